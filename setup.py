@@ -19,5 +19,11 @@ setup(
     packages=find_packages(where='src'),
     python_requires='>=3.5',
     install_requires=['pandas', 'aioboto3'],
+    extras_require={
+        'zstd': ['zstandard'],
+        'parquet': ['pyarrow'],
+        'signal': ['scipy']
+        },
+    entry_points={'console_scripts': ['openeew=openeew.cli:main']},
     zip_safe=False
     )
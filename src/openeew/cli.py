@@ -0,0 +1,344 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""
+Command-line interface of the openeew package.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from .data.aws import AwsDataClient
+from .data.storage import LocalStorage
+
+# Name of the checkpoint manifest within the output directory
+MANIFEST_NAME = 'manifest.jsonl'
+# File extension of each output format
+_EXTENSIONS = {'jsonl': '.jsonl', 'parquet': '.parquet', 'numpy': '.npz'}
+# File suffix of each JSON-lines compression
+_JSONL_COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+# Compressions supported by each output format. NumPy files can only
+# be compressed with deflate, the algorithm used by gzip
+_COMPRESSIONS = {
+    'jsonl': ('gzip', 'zstd'),
+    'parquet': ('gzip', 'zstd'),
+    'numpy': ('gzip',)
+    }
+
+
+def _read_manifest(path):
+    # Returns the entries of a checkpoint manifest, if it exists
+
+    if not os.path.exists(path):
+        return []
+
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _append_manifest(path, entry):
+    # Appends an entry to a checkpoint manifest, making sure it is
+    # written to disk before returning
+
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_jsonl(path, records, compression):
+    from .data.jsonl import write_records
+
+    write_records(path, records)
+
+
+def _write_parquet(path, records, compression):
+    from .data.df import get_df_from_records
+
+    get_df_from_records(records).to_parquet(
+        path, compression=compression or 'snappy', index=False)
+
+
+def _write_numpy(path, records, compression):
+    import numpy as np
+    from .data.arrays import get_arrays_from_records
+
+    arrays = get_arrays_from_records(records)
+    device_ids = arrays.pop('device_ids')
+    arrays['device_id'] = device_ids[arrays.pop('device_idx')]
+
+    if compression:
+        np.savez_compressed(path, **arrays)
+    else:
+        np.savez(path, **arrays)
+
+
+_WRITERS = {
+    'jsonl': _write_jsonl,
+    'parquet': _write_parquet,
+    'numpy': _write_numpy
+    }
+
+
+def _get_export_params(data_client, start_date_utc, end_date_utc,
+                       device_ids, output_format, compression):
+    # Returns the parameters of an export, as stored in the header
+    # entry of its checkpoint manifest
+
+    if isinstance(device_ids, str):
+        device_ids = [device_ids]
+
+    return {
+        'country_code': data_client.country_code,
+        'start_date_utc': start_date_utc,
+        'end_date_utc': end_date_utc,
+        'device_ids': sorted(set(device_ids)) if device_ids else None,
+        'output_format': output_format,
+        'compression': compression
+        }
+
+
+def _get_part_name(part_num, output_format, compression):
+    # Returns the file name of an output part
+
+    name = 'part-{:05d}{}'.format(part_num, _EXTENSIONS[output_format])
+    if output_format == 'jsonl' and compression:
+        name += _JSONL_COMPRESSION_SUFFIXES[compression]
+
+    return name
+
+
+def export(data_client, start_date_utc, end_date_utc, output_dir,
+           device_ids=None, output_format='jsonl', compression=None,
+           batch_size=32, progress=sys.stderr):
+    """
+    Exports accelerometer records filtered by date and device to
+    a local directory, writing one file for each batch of keys.
+    Completed keys are recorded in a checkpoint manifest in the
+    output directory, so that an interrupted export resumes without
+    downloading them again. The manifest starts with the parameters
+    of the export, and an export to the same directory with other
+    parameters is refused, since keys at the edges of the date range
+    are only partly exported.
+
+    :param data_client: The client used to list and download keys.
+    :type data_client: openeew.data.aws.AwsDataClient
+
+    :param start_date_utc: The UTC start date
+        with format %Y-%m-%d %H:%M:%S. E.g. '2018-02-16 23:39:38'.
+    :type start_date_utc: str
+
+    :param end_date_utc: The UTC end date with same format as
+        start_date_utc.
+    :type end_date_utc: str
+
+    :param output_dir: The directory to export to.
+    :type output_dir: str
+
+    :param device_ids: Device IDs that should be exported.
+    :type device_ids: Union[str, list[str]]
+
+    :param output_format: One of 'jsonl', 'parquet' or 'numpy'.
+    :type output_format: str
+
+    :param compression: Optional compression of output files,
+        'gzip' or 'zstd'. NumPy files only support 'gzip', which
+        compresses them with deflate as numpy.savez_compressed does.
+    :type compression: str
+
+    :param batch_size: The number of keys to download concurrently
+        and write to each file.
+    :type batch_size: int
+
+    :param progress: A text stream to which progress is reported,
+        or None to not report progress.
+
+    :return: The number of records exported by this call.
+    :rtype: int
+
+    :raises ValueError: If the compression is not supported by the
+        output format, or if output_dir holds an export with different
+        parameters.
+    """
+    if output_format not in _WRITERS:
+        raise ValueError('Unknown output format {}'.format(output_format))
+    if compression is not None and \
+            compression not in _COMPRESSIONS[output_format]:
+        raise ValueError('Compression {} is not supported by {} files'.format(
+            compression, output_format))
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = _read_manifest(manifest_path)
+    params = _get_export_params(
+        data_client, start_date_utc, end_date_utc, device_ids,
+        output_format, compression)
+    if not manifest:
+        _append_manifest(manifest_path, {'export': params})
+    elif manifest[0].get('export') != params:
+        raise ValueError(
+            '{} already holds an export with different parameters {}, '
+            'export to a new directory instead'.format(
+                output_dir, manifest[0].get('export')))
+
+    # Entries of the files written so far, following the header
+    manifest = manifest[1:]
+    completed_keys = {k for entry in manifest for k in entry['keys']}
+
+    partitions = [
+        p for p in data_client.get_key_partitions(
+            start_date_utc, end_date_utc, device_ids)
+        if p.key not in completed_keys
+        ]
+
+    if progress is not None:
+        print('{} keys already exported, {} keys to export'.format(
+            len(completed_keys), len(partitions)), file=progress)
+
+    start = time.monotonic()
+    num_keys = 0
+    num_records = 0
+    for i in range(0, len(partitions), batch_size):
+        batch = partitions[i:i + batch_size]
+        records = [
+            r for pr in data_client.get_records_from_partitions(batch)
+            for r in pr
+            ]
+
+        entry = {'file': None, 'keys': [p.key for p in batch],
+                 'num_records': len(records)}
+        if records:
+            entry['file'] = _get_part_name(
+                len(manifest), output_format, compression)
+            path = os.path.join(output_dir, entry['file'])
+            # Write to a temporary file first so that only complete
+            # files are ever listed in the manifest
+            tmp_path = os.path.join(output_dir, '.tmp-' + entry['file'])
+            _WRITERS[output_format](tmp_path, records, compression)
+            os.replace(tmp_path, path)
+
+        _append_manifest(manifest_path, entry)
+        manifest.append(entry)
+
+        num_keys += len(batch)
+        num_records += len(records)
+        if progress is not None:
+            elapsed = max(time.monotonic() - start, 1e-9)
+            print('[{}/{} keys] {} records, {:.1f} keys/s, '
+                  '{:.0f} records/s'.format(
+                      num_keys, len(partitions), num_records,
+                      num_keys / elapsed, num_records / elapsed),
+                  file=progress)
+
+    return num_records
+
+
+def _get_parser():
+    # Returns the parser of command-line arguments
+
+    parser = argparse.ArgumentParser(
+        prog='openeew',
+        description='OpenEEW command-line interface')
+    subparsers = parser.add_subparsers(dest='command')
+
+    export_parser = subparsers.add_parser(
+        'export',
+        help='Export records to a local directory, resuming any '
+             'interrupted export to the same directory')
+    export_parser.add_argument(
+        'country_code', help='ISO 3166 two-letter country code')
+    export_parser.add_argument(
+        'start_date_utc', help="UTC start date, e.g. '2018-02-16 23:39:38'")
+    export_parser.add_argument(
+        'end_date_utc', help="UTC end date, e.g. '2018-02-16 23:49:38'")
+    export_parser.add_argument(
+        'output_dir', help='Directory to export to')
+    export_parser.add_argument(
+        '--devices', nargs='+', help='Device IDs to export (default: all)')
+    export_parser.add_argument(
+        '--format', choices=sorted(_WRITERS), default='jsonl',
+        help='Output format (default: jsonl)')
+    export_parser.add_argument(
+        '--compression', choices=sorted(_JSONL_COMPRESSION_SUFFIXES),
+        help='Compression of output files (numpy only supports gzip)')
+    export_parser.add_argument(
+        '--batch-size', type=int, default=32,
+        help='Number of keys downloaded concurrently per file (default: 32)')
+    export_parser.add_argument(
+        '--storage-dir',
+        help='Local mirror of the OpenEEW bucket to export from '
+             'instead of AWS')
+    export_parser.add_argument(
+        '--index-dir',
+        help='Directory in which to cache line offset indexes of keys')
+    export_parser.add_argument(
+        '--hedge-percentile', type=float,
+        help='Latency percentile after which to hedge slow downloads')
+    export_parser.add_argument(
+        '--request-timeout', type=float,
+        help='Timeout in seconds of each key download')
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the openeew command-line interface.
+
+    :param argv: The command-line arguments. If no value is given,
+        sys.argv is used.
+    :type argv: list[str]
+
+    :return: The exit status.
+    :rtype: int
+    """
+    parser = _get_parser()
+    args = parser.parse_args(argv)
+
+    if args.command != 'export':
+        parser.print_help()
+        return 2
+
+    data_client = AwsDataClient(
+        args.country_code,
+        index_dir=args.index_dir,
+        hedge_percentile=args.hedge_percentile,
+        request_timeout=args.request_timeout,
+        storage=LocalStorage(args.storage_dir) if args.storage_dir else None
+        )
+
+    try:
+        export(
+            data_client,
+            args.start_date_utc,
+            args.end_date_utc,
+            args.output_dir,
+            args.devices,
+            args.format,
+            args.compression,
+            args.batch_size
+            )
+    except ValueError as e:
+        print('openeew: error: {}'.format(e), file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+from array import array
+from collections import namedtuple
+import numpy as np
+from .timing import get_sample_t_array
+
+# Fields of each record that are repeated for each of its samples
+_RECORD_FIELDS = ('sr', 'cloud_t', 'device_t')
+
+
+class DeviceArrays(namedtuple(
+        'DeviceArrays',
+        ['device_ids', 'offsets', 'sr', 'sample_t', 'data', 'axes'])):
+    """
+    Samples of many devices stored in contiguous arrays, so that
+    operations can be applied to all devices at once. The samples of
+    the i-th device are data[:, offsets[i]:offsets[i + 1]], in
+    chronological order, with one row of data for each axis.
+
+    :param device_ids: The ID of each device.
+    :type device_ids: numpy.ndarray
+
+    :param offsets: The index of the first sample of each device,
+        followed by the total number of samples.
+    :type offsets: numpy.ndarray
+
+    :param sr: The sample rate of each device.
+    :type sr: numpy.ndarray
+
+    :param sample_t: The Unix time of each sample.
+    :type sample_t: numpy.ndarray
+
+    :param data: The samples, with shape (len(axes), len(sample_t)).
+    :type data: numpy.ndarray
+
+    :param axes: The name of each axis, e.g. ('x', 'y', 'z').
+    :type axes: tuple[str]
+    """
+    __slots__ = ()
+
+    @property
+    def num_devices(self):
+        """
+        :return: The number of devices.
+        :rtype: int
+        """
+        return len(self.device_ids)
+
+    @property
+    def counts(self):
+        """
+        :return: The number of samples of each device.
+        :rtype: numpy.ndarray
+        """
+        return np.diff(self.offsets)
+
+    def get_device(self, device_id):
+        """
+        Gets the samples of a single device, without copying them.
+
+        :param device_id: The ID of the device.
+        :type device_id: str
+
+        :return: A tuple (sample_t, data) of the device.
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        """
+        i = int(np.searchsorted(self.device_ids, device_id))
+        if i == self.num_devices or self.device_ids[i] != device_id:
+            raise KeyError(device_id)
+
+        start, end = self.offsets[i], self.offsets[i + 1]
+
+        return self.sample_t[start:end], self.data[:, start:end]
+
+
+def get_device_arrays(df, axes=('x', 'y', 'z'), t_name='sample_t'):
+    """
+    Returns contiguous per-device arrays from a pandas DataFrame,
+    as returned by :func:`openeew.data.df.get_df_from_records`.
+
+    :param df: The DataFrame, with at least columns device_id, sr,
+        t_name and each axis.
+    :type df: pandas.DataFrame
+
+    :param axes: The axes to include.
+    :type axes: tuple[str]
+
+    :param t_name: The name of the time column of samples.
+    :type t_name: str
+
+    :return: The arrays, with devices sorted by ID.
+    :rtype: DeviceArrays
+    """
+    df = df.sort_values(['device_id', t_name], kind='mergesort')
+
+    all_device_ids = df['device_id'].to_numpy().astype(str)
+    device_ids, starts = np.unique(all_device_ids, return_index=True)
+
+    data = np.empty((len(axes), len(df)))
+    for i, axis in enumerate(axes):
+        data[i] = df[axis].to_numpy(dtype=float)
+
+    return DeviceArrays(
+        device_ids=device_ids,
+        offsets=np.append(starts, len(df)).astype(np.int64),
+        sr=df['sr'].to_numpy(dtype=float)[starts],
+        sample_t=np.ascontiguousarray(df[t_name].to_numpy(dtype=float)),
+        data=data,
+        axes=tuple(axes)
+        )
+
+
+def get_df_from_device_arrays(arrays):
+    """
+    Returns a pandas DataFrame from per-device arrays, with columns
+    device_id, sr, sample_t and one for each axis.
+
+    :param arrays: The per-device arrays.
+    :type arrays: DeviceArrays
+
+    :rtype: pandas.DataFrame
+    """
+    import pandas as pd
+
+    counts = arrays.counts
+    columns = {
+        'device_id': np.repeat(arrays.device_ids, counts),
+        'sr': np.repeat(arrays.sr, counts),
+        'sample_t': arrays.sample_t
+        }
+    for axis, values in zip(arrays.axes, arrays.data):
+        columns[axis] = values
+
+    return pd.DataFrame(columns)
+
+
+def get_arrays_from_records(records, ref_t_name='cloud_t', ref_axis='x',
+                            axes=('x', 'y', 'z')):
+    """
+    Returns contiguous NumPy arrays of the samples of records,
+    equivalent to the DataFrame returned by
+    :func:`openeew.data.df.get_df_from_records` but without importing
+    pandas or creating a Python object for each sample. Records are
+    read in a single pass, so they can be given by a generator.
+
+    :param records: The records, e.g. as returned by
+        :func:`openeew.data.aws.AwsDataClient.get_filtered_records`.
+    :type records: Iterable[dict]
+
+    :param ref_t_name: The name of the time field to use as a reference when
+        calculating sample times, e.g. cloud_t or device_t.
+    :type ref_t_name: str
+
+    :param ref_axis: The axis to use when determining
+        the number of sample points in each record.
+    :type ref_axis: str
+
+    :param axes: The axes to include.
+    :type axes: tuple[str]
+
+    :return: A dict of arrays of the same length, one element for each
+        sample, sorted by device and then chronologically. device_idx
+        gives the index of the device of each sample in device_ids,
+        an additional array of the sorted unique device IDs. Other
+        arrays are sample_t, the axes, sr, cloud_t and device_t.
+    :rtype: dict[str, numpy.ndarray]
+    """
+    # Typed arrays store samples as compactly as NumPy arrays and can
+    # be viewed as NumPy arrays without copying
+    device_idx_by_id = {}
+    record_device_idx = array('l')
+    num_samples = array('l')
+    ref_t = array('d')
+    fields = {name: array('d') for name in _RECORD_FIELDS}
+    samples = {axis: array('d') for axis in axes}
+
+    for r in records:
+        record_device_idx.append(
+            device_idx_by_id.setdefault(r['device_id'], len(device_idx_by_id)))
+        num_samples.append(len(r[ref_axis]))
+        ref_t.append(r[ref_t_name])
+        for name, values in fields.items():
+            values.append(r[name])
+        for axis, values in samples.items():
+            values.extend(r[axis])
+
+    if not num_samples:
+        raise ValueError('The list of records should be non-empty')
+
+    num_samples = np.frombuffer(num_samples, dtype=np.dtype('l'))
+    # Renumber devices in order of their IDs
+    device_ids = np.array(list(device_idx_by_id))
+    id_order = np.argsort(device_ids)
+    id_ranks = np.empty(len(id_order), dtype=np.int32)
+    id_ranks[id_order] = np.arange(len(id_order))
+
+    arrays = {
+        'device_idx': np.repeat(
+            id_ranks[np.frombuffer(record_device_idx, dtype=np.dtype('l'))],
+            num_samples),
+        'sample_t': get_sample_t_array(
+            np.frombuffer(ref_t), num_samples,
+            np.frombuffer(fields['sr']))
+        }
+    for axis, values in samples.items():
+        arrays[axis] = np.frombuffer(values)
+    for name, values in fields.items():
+        arrays[name] = np.repeat(np.frombuffer(values), num_samples)
+
+    # Sort by device and then in chronological order, which is usually
+    # already the order of records, in which case nothing is copied
+    order = np.lexsort(
+        (arrays['device_t'], arrays['sample_t'], arrays['device_idx']))
+    if (order != np.arange(len(order))).any():
+        arrays = {name: values[order] for name, values in arrays.items()}
+    arrays['device_ids'] = device_ids[id_order]
+
+    return arrays
+
+
+def get_structured_array(arrays):
+    """
+    Returns a NumPy structured array with one field for each array
+    returned by :func:`get_arrays_from_records`, other than device_ids.
+
+    :param arrays: The arrays.
+    :type arrays: dict[str, numpy.ndarray]
+
+    :rtype: numpy.ndarray
+    """
+    names = [name for name in arrays if name != 'device_ids']
+    structured = np.empty(
+        len(arrays['sample_t']),
+        dtype=[(name, arrays[name].dtype) for name in names]
+        )
+    for name in names:
+        structured[name] = arrays[name]
+
+    return structured
+
+
+def get_device_arrays_from_arrays(arrays, axes=('x', 'y', 'z')):
+    """
+    Returns per-device arrays from the arrays returned by
+    :func:`get_arrays_from_records`.
+
+    :param arrays: The arrays.
+    :type arrays: dict[str, numpy.ndarray]
+
+    :param axes: The axes to include.
+    :type axes: tuple[str]
+
+    :rtype: DeviceArrays
+    """
+    counts = np.bincount(
+        arrays['device_idx'], minlength=len(arrays['device_ids']))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    # Devices without samples are left out
+    has_samples = counts > 0
+
+    return DeviceArrays(
+        device_ids=arrays['device_ids'][has_samples],
+        offsets=np.append(offsets[:-1][has_samples], offsets[-1]),
+        sr=arrays['sr'][offsets[:-1][has_samples]],
+        sample_t=arrays['sample_t'],
+        data=np.stack([arrays[axis] for axis in axes]),
+        axes=tuple(axes)
+        )
+
+
+def get_df_from_arrays(arrays):
+    """
+    Returns a pandas DataFrame from the arrays returned by
+    :func:`get_arrays_from_records`, without copying them. The
+    device_id column is categorical, with categories device_ids.
+
+    :param arrays: The arrays.
+    :type arrays: dict[str, numpy.ndarray]
+
+    :rtype: pandas.DataFrame
+    """
+    import pandas as pd
+
+    columns = {
+        'device_id': pd.Categorical.from_codes(
+            arrays['device_idx'], arrays['device_ids'])
+        }
+    for name, values in arrays.items():
+        if name not in ('device_idx', 'device_ids'):
+            columns[name] = values
+
+    return pd.DataFrame(columns, copy=False)
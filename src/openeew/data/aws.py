@@ -14,15 +14,27 @@
 # limitations under the License.
 # =============================================================================
 
-import aioboto3
 import boto3
 import asyncio
 import io,sys
 import json
-from datetime import datetime, timedelta
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import groupby, islice
 from botocore import UNSIGNED
 from botocore.exceptions import ClientError as botocoreClientError
 from botocore.client import Config
+from .index import LineOffsetIndex
+from .jsonl import LineDecoder, get_compression, strip_compression_suffix
+from .event import get_event_windows, merge_event_windows
+from .hedge import LatencyTracker, hedge
+from .spatial import DeviceIndex
+from .storage import InvalidRangeError, ObjectChangedError, S3Storage
 
 
 class DateTimeKeyBuilder(object):
@@ -182,6 +194,32 @@ class DateTimeKeyBuilder(object):
             self._granularity
             )
 
+    def get_dt_from_key(self, key_part):
+        """
+        Returns the datetime corresponding to a key part built by the
+        key builder, i.e. the inverse of :func:`get_max_key`.
+
+        :param key_part: The key part, starting with the year, e.g.
+            "year=2020/month=01/day=01/hour=00/05.jsonl".
+        :type key_part: str
+
+        :return: The UTC datetime of the key part, where any date parts
+            not in the template take their min possible value.
+        :rtype: datetime.datetime
+        """
+        pattern = r'(\d+)'.join(
+            re.escape(p) for p in ''.join(self._template_parts).split('{}')
+            )
+        match = re.match(pattern, key_part)
+        if match is None:
+            raise ValueError(
+                'Key {} does not match key template'.format(key_part))
+
+        values = [int(v) for v in match.groups()]
+        values += self._MIN_VALS[len(values):]
+
+        return datetime(*values, tzinfo=timezone.utc)
+
     def get_key_prefixes_within_range(self, start_dt, end_dt):
         """
         Returns a list of key search prefixes for the given
@@ -213,6 +251,195 @@ class DateTimeKeyBuilder(object):
         return key_prefixes_within_range
 
 
+KeyPartition = namedtuple(
+    'KeyPartition',
+    ['key', 'device_id', 'start_t', 'end_t', 'key_start_t', 'key_end_t']
+    )
+KeyPartition.__doc__ = """
+A records key to be downloaded, where only records with a time field
+within [start_t, end_t] are kept. The records of the key are expected
+to have a time field within [key_start_t, key_end_t], given by the
+datetime of the key and that of the next key of the same device.
+"""
+
+
+class _CompressedObjectError(Exception):
+    """
+    Raised when a compressed object is read by byte range.
+    """
+
+
+class _LruCache(object):
+    """
+    A dict-like cache holding at most max_size items, which evicts
+    the least recently used item first. It can be used from several
+    threads at once.
+    """
+
+    # Number of locks guarding the creation of items, each shared by
+    # the keys with the same hash modulo this number
+    _NUM_KEY_LOCKS = 64
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = [
+            threading.Lock() for _ in range(self._NUM_KEY_LOCKS)]
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def get_or_create(self, key, create):
+        """
+        Returns the item of a key, creating it by calling create if
+        there is none. Threads getting the same missing key wait for
+        the first one to create it.
+        """
+        with self._key_locks[hash(key) % len(self._key_locks)]:
+            value = self.get(key)
+            if value is None:
+                value = create()
+                self[key] = value
+            return value
+
+
+class _RangeReader(object):
+    """
+    A reader of byte ranges of a single object. Fetched chunks
+    are kept so that nearby small reads do not need another ranged GET.
+    """
+
+    def __init__(self, connection, key, index, chunk_size):
+        self._connection = connection
+        self._key = key
+        self._index = index
+        self._chunk_size = chunk_size
+        # List of fetched chunks (start, data)
+        self._chunks = []
+
+    async def _fetch(self, start, end):
+        # Gets the bytes in [start, end) using a ranged GET. If the index
+        # was built from a known version of the object, only that version
+        # is accepted
+
+        response = await self._connection.get_object(
+            self._key, start, end, etag=self._index.etag)
+        data = await response.body.read()
+
+        if get_compression(self._key, response.content_encoding):
+            raise _CompressedObjectError(self._key)
+
+        if self._index.size is None:
+            self._index.size = response.size
+            self._index.etag = response.etag
+
+        return data
+
+    async def open(self):
+        """
+        Gets the size of the object, unless it is already known, by
+        fetching its first chunk. The last chunk is fetched too, so that
+        the first and last lines of the object can be read.
+        """
+        if self._index.size is not None:
+            return
+
+        try:
+            self._chunks.append((0, await self._fetch(0, self._chunk_size)))
+        except InvalidRangeError:
+            # An empty object has no satisfiable range
+            self._index.size = 0
+
+        tail_start = self._index.size - self._chunk_size
+        if tail_start > 0:
+            self._chunks.append(
+                (tail_start, await self._fetch(tail_start, self._index.size))
+                )
+
+    async def read(self, start, end):
+        """
+        Returns the bytes in [start, end).
+        """
+        for chunk_start, chunk in self._chunks:
+            if chunk_start <= start and end <= chunk_start + len(chunk):
+                return chunk[start - chunk_start:end - chunk_start]
+
+        chunk = await self._fetch(
+            start,
+            min(max(end, start + self._chunk_size), self._index.size)
+            )
+        self._chunks.append((start, chunk))
+
+        return chunk[:end - start]
+
+    async def _read_from(self, start, end):
+        # Returns bytes starting at offset start and ending no later than
+        # end, using a cached chunk if one contains start
+
+        for chunk_start, chunk in self._chunks:
+            if chunk_start <= start < chunk_start + len(chunk):
+                return chunk[start - chunk_start:end - chunk_start]
+
+        return await self.read(start, min(start + self._chunk_size, end))
+
+    async def _read_to(self, start, end):
+        # Returns bytes ending at offset end and starting no earlier than
+        # start, using a cached chunk if one contains the byte before end
+
+        for chunk_start, chunk in self._chunks:
+            if chunk_start < end <= chunk_start + len(chunk):
+                return chunk[max(start - chunk_start, 0):end - chunk_start]
+
+        return await self.read(max(end - self._chunk_size, start), end)
+
+    async def find_newline(self, start, end):
+        """
+        Returns the offset of the first newline in [start, end),
+        or None if there is none.
+        """
+        while start < end:
+            data = await self._read_from(start, end)
+            i = data.find(b'\n')
+            if i >= 0:
+                return start + i
+            start += len(data)
+
+        return None
+
+    async def rfind_newline(self, start, end):
+        """
+        Returns the offset of the last newline in [start, end),
+        or None if there is none.
+        """
+        while start < end:
+            data = await self._read_to(start, end)
+            i = data.rfind(b'\n')
+            if i >= 0:
+                return end - len(data) + i
+            end -= len(data)
+
+        return None
+
+
 class AwsDataClient(object):
     """
     A client for downloading OpenEEW data stored as an
@@ -223,6 +450,9 @@ class AwsDataClient(object):
     _RECORDS_KEY_COUNTRY_TEMPLATE = 'records/country_code={}/'
     # Template of the device part of all record keys
     _RECORDS_KEY_DEVICE_TEMPLATE = 'device_id={}/'
+    # Template parts of the datetime part of all record keys
+    _RECORDS_KEY_DATE_TEMPLATE_PARTS = (
+        'year={}/', 'month={}/', 'day={}/', 'hour={}/', '{}')
     # The suffix of all record keys
     _RECORDS_KEY_SUFFIX = '.jsonl'
     # Template of the country part of all device metadata keys
@@ -233,8 +463,21 @@ class AwsDataClient(object):
     _S3_BUCKET_REGION = 'us-east-1'
     # Name of the time field used to assign records to files
     _RECORD_T = 'cloud_t'
-
-    def __init__(self, country_code, s3_client=None):
+    # The suffix of sidecar files storing line offset indexes
+    _LINE_INDEX_SUFFIX = '.idx.json'
+    # Number of bytes fetched by each ranged GET when searching for lines
+    _RANGE_CHUNK_SIZE = 2048
+    # Number of bytes read at a time when streaming a whole key
+    _STREAM_CHUNK_SIZE = 65536
+    # Max number of line offset indexes kept in memory
+    _MAX_LINE_INDEXES = 256
+    # Number of locks guarding line offset indexes, each shared by
+    # the keys with the same hash modulo this number
+    _NUM_LINE_INDEX_LOCKS = 64
+
+    def __init__(self, country_code, s3_client=None,
+                 index_dir=None, range_reads=True, hedge_percentile=None,
+                 request_timeout=None, storage=None):
         """
         Initialize AwsDataClient with the following parameters:
 
@@ -247,17 +490,68 @@ class AwsDataClient(object):
             on AWS. If no value is given, an anonymous S3 client
             will be used.
         :type s3_client: boto3.client.s3
+
+        :param index_dir: Optional local directory in which to cache
+            an index of line byte offsets and record times for each
+            downloaded key, stored as a sidecar file mirroring the key.
+            If no value is given, indexes are only kept in memory.
+        :type index_dir: str
+
+        :param range_reads: Whether to read only the relevant part of
+            the first and last key of each device using ranged GETs,
+            rather than downloading them in full.
+        :type range_reads: bool
+
+        :param hedge_percentile: Optional percentile, between 0 and 100,
+            of recently observed key download latencies, tracked
+            separately for keys read by range. A duplicate request is
+            issued for any key taking longer than this, and whichever
+            response arrives first is used. If no value is given,
+            requests are not hedged.
+        :type hedge_percentile: float
+
+        :param request_timeout: Optional timeout in seconds of each key
+            download. A download that times out is retried once.
+        :type request_timeout: float
+
+        :param storage: Optional storage from which to list and get
+            keys instead of the OpenEEW bucket, e.g. a LocalStorage
+            holding a mirror of the bucket. If given, s3_client is
+            not used.
+        :type storage: openeew.data.storage.Storage
         """
 
         self.country_code = country_code
-        self._s3_client = s3_client or boto3.client(
-                's3',
-                region_name=self._S3_BUCKET_REGION,
-                config=Config(signature_version=UNSIGNED)
+        self._index_dir = index_dir
+        self._range_reads = range_reads
+        # Line offset indexes of keys most recently read by range, which
+        # are loaded and saved under a lock since keys can be read from
+        # several threads by iter_filtered_records. Indexes evicted from
+        # memory are loaded again from their sidecar files, if any
+        self._line_indexes = _LruCache(self._MAX_LINE_INDEXES)
+        self._line_index_locks = [
+            threading.Lock() for _ in range(self._NUM_LINE_INDEX_LOCKS)]
+        self._request_timeout = request_timeout
+        # Latencies of ranged reads, which take several requests, are
+        # tracked separately from those of full downloads
+        self._latency_tracker = None
+        self._range_latency_tracker = None
+        if hedge_percentile is not None:
+            self._latency_tracker = LatencyTracker(hedge_percentile)
+            self._range_latency_tracker = LatencyTracker(hedge_percentile)
+        if storage is None:
+            storage = S3Storage(
+                s3_client or boto3.client(
+                    's3',
+                    region_name=self._S3_BUCKET_REGION,
+                    config=Config(signature_version=UNSIGNED)
+                    ),
+                self._S3_BUCKET_NAME
                 )
+        self._storage = storage
         # Initialize a datetime key builder for forming records keys
         self._dt_builder = DateTimeKeyBuilder(
-            'year={}/', 'month={}/', 'day={}/', 'hour={}/', '{}')
+            *self._RECORDS_KEY_DATE_TEMPLATE_PARTS)
 
     @property
     def country_code(self):
@@ -276,6 +570,8 @@ class AwsDataClient(object):
             self._RECORDS_KEY_COUNTRY_TEMPLATE.format(self._country_code)
         self._devices_key = \
             self._DEVICES_KEY_TEMPLATE.format(self._country_code)
+        # Spatial index of device metadata, built when first needed
+        self._device_index = None
 
     @staticmethod
     def _get_dt_from_str(date_utc):
@@ -289,17 +585,8 @@ class AwsDataClient(object):
     def _get_device_ids_from_records(self):
         # Returns a list of all devices (device_id) that have records
 
-        paginator = self._s3_client.get_paginator('list_objects_v2')
-
-        pages = paginator.paginate(
-                Bucket=self._S3_BUCKET_NAME,
-                Prefix=self._records_key_country_part,
-                Delimiter='/'
-                )
-
-        device_prefixes = [
-                p.get('Prefix') for p in pages.search('CommonPrefixes')
-                ]
+        device_prefixes = self._storage.list_prefixes(
+                self._records_key_country_part)
 
         # Use [:-1] to remove the final /
         return [d.split('device_id=')[1][:-1] for d in device_prefixes]
@@ -310,25 +597,53 @@ class AwsDataClient(object):
         return self._records_key_country_part + \
             self._RECORDS_KEY_DEVICE_TEMPLATE.format(device_id)
 
-    def _get_records_keys_to_download(self, start_dt, end_dt, device_ids=None):
-        # Returns list of keys that contain required data.
-
-        if end_dt < start_dt:
-            raise ValueError('end date should not be earlier than start date')
+    def _get_device_ids(self, device_ids):
+        # Returns a list of device IDs from a device_ids parameter value
 
         if device_ids is None:
             # Get list of all available devices
-            _device_ids = self._get_device_ids_from_records()
+            return self._get_device_ids_from_records()
         elif isinstance(device_ids, str):
             # Add single device to list
-            _device_ids = [device_ids]
+            return [device_ids]
         elif isinstance(device_ids, list):
             # Use list directly
-            _device_ids = device_ids
+            return device_ids
         else:
             raise ValueError('device_ids, if specified, should be either '
                              'a string or a list')
 
+    def _list_keys(self, prefix, listing_cache=None):
+        # Returns all keys starting with prefix. If a listing_cache dict
+        # (or _LruCache) is given, each prefix it holds is not listed again
+
+        if isinstance(listing_cache, _LruCache):
+            # The cache is shared by threads, which wait for each other
+            # rather than listing the same prefix
+            return listing_cache.get_or_create(
+                prefix, lambda: self._storage.list_keys(prefix))
+
+        if listing_cache is not None:
+            keys = listing_cache.get(prefix)
+            if keys is not None:
+                return keys
+
+        keys = self._storage.list_keys(prefix)
+
+        if listing_cache is not None:
+            listing_cache[prefix] = keys
+
+        return keys
+
+    def _get_records_keys_to_download(self, start_dt, end_dt, device_ids=None,
+                                      listing_cache=None):
+        # Returns list of keys that contain required data.
+
+        if end_dt < start_dt:
+            raise ValueError('end date should not be earlier than start date')
+
+        _device_ids = self._get_device_ids(device_ids)
+
         # A simple lower bound for keys to download (without making
         # assumptions on num minutes contained per file) is given by
         # the hour corresponding to the start date
@@ -348,35 +663,27 @@ class AwsDataClient(object):
 
         # Initialize empty list to store the keys to download
         keys_to_download = []
-        paginator = self._s3_client.get_paginator('list_objects_v2')
 
         for d in _device_ids:
 
             device_prefix = self._get_records_key_device_prefix(d)
 
             for key_date_prefix in key_date_prefixes_within_range:
-                # Initialize list to store all keys that might contain
-                # data for the current device and chosen dates
-                candidate_keys = []
-
-                pages = paginator.paginate(
-                            Bucket=self._S3_BUCKET_NAME,
-                            Prefix=device_prefix + key_date_prefix
+                # Select those keys that contain data before the
+                # end date and no earlier than the hour of the
+                # start date. Compressed keys are compared
+                # without their compression suffix
+                candidate_keys = [
+                        k for k in self._list_keys(
+                            device_prefix + key_date_prefix,
+                            listing_cache
                             )
-
-                for p in pages:
-                    if 'Contents' not in p.keys():
-                        continue
-                    # Select those keys that contain data before the
-                    # end date and no earlier than the hour of the
-                    # start date
-                    candidate_keys += [
-                            o['Key'] for o in p['Contents']
-                            if o['Key'] <= device_prefix +
-                            end_key_date_part_max + self._RECORDS_KEY_SUFFIX
-                            and o['Key'] >= device_prefix +
-                            start_key_date_part_min
-                            ]
+                        if strip_compression_suffix(k) <=
+                        device_prefix +
+                        end_key_date_part_max + self._RECORDS_KEY_SUFFIX
+                        and k >= device_prefix +
+                        start_key_date_part_min
+                        ]
 
                 if not candidate_keys:
                     continue
@@ -384,7 +691,8 @@ class AwsDataClient(object):
                 # Check which keys contain data before the start date
                 keys_before_start_date = [
                         k for k in candidate_keys
-                        if k <= device_prefix + start_key_date_part_max +
+                        if strip_compression_suffix(k) <=
+                        device_prefix + start_key_date_part_max +
                         self._RECORDS_KEY_SUFFIX
                         ]
 
@@ -396,53 +704,419 @@ class AwsDataClient(object):
                     # Of all keys that contain data before start date,
                     # only the max of these might actually contain relevant
                     # data
-                    max_key_before_start_date = max(keys_before_start_date)
+                    max_key_before_start_date = strip_compression_suffix(
+                        max(keys_before_start_date,
+                            key=strip_compression_suffix)
+                        )
                     keys_to_download += [
                             k for k in candidate_keys
-                            if k >= max_key_before_start_date
+                            if strip_compression_suffix(k) >=
+                            max_key_before_start_date
                             ]
 
         return keys_to_download
 
-    @classmethod
-    async def _get_records_from_key(cls, async_s3_client, key):
-        # Gets records from a single key and converts them to a list of dicts
+    def _get_device_prefix_from_key(self, key):
+        # Returns the key prefix including country_code and device_id
+        # of a records key
 
-        with io.BytesIO() as bytes_stream:
+        device_part = key[len(self._records_key_country_part):].split('/')[0]
 
-            await async_s3_client.download_fileobj(
-                cls._S3_BUCKET_NAME,
-                key,
-                bytes_stream
-                )
+        return self._records_key_country_part + device_part + '/'
+
+    def _get_line_index_path(self, key):
+        # Returns the path of the sidecar file storing the index of a key
+
+        return os.path.join(self._index_dir, key + self._LINE_INDEX_SUFFIX)
+
+    def _get_line_index_lock(self, key):
+        # Returns the lock guarding the line offset index of a key
+
+        return self._line_index_locks[
+            hash(key) % len(self._line_index_locks)]
+
+    def _get_line_index(self, key):
+        # Returns the line offset index of a key, loading it from its
+        # sidecar file if available, or an empty index otherwise
+
+        with self._get_line_index_lock(key):
+            index = self._line_indexes.get(key)
+            if index is None and self._index_dir is not None:
+                index = LineOffsetIndex.load(self._get_line_index_path(key))
+
+            index = index or LineOffsetIndex()
+            self._line_indexes[key] = index
+
+            return index
+
+    def _save_line_index(self, key, index):
+        # Saves the line offset index of a key to its sidecar file
+
+        if self._index_dir is not None:
+            with self._get_line_index_lock(key):
+                index.save(self._get_line_index_path(key))
+
+    def _get_records_from_lines(self, lines, offset, index=None):
+        # Converts lines starting at the given byte offset to a list of
+        # dicts, adding each line to the index if given
+
+        records = []
+        for line in lines:
+            record = json.loads(line)
+            if index is not None:
+                index.add_span(
+                    offset, offset + len(line), record[self._RECORD_T])
+            offset += len(line)
+            records.append(record)
+
+        return records
+
+    async def _get_records_from_key(self, connection, key):
+        # Gets records from a single key and converts them to a list of dicts.
+        # Lines are parsed as the object is streamed, decompressing it first
+        # if it is compressed according to its suffix or Content-Encoding
+
+        response = await connection.get_object(key)
+        compression = get_compression(key, response.content_encoding)
+        decoder = LineDecoder(compression)
+        # Byte offsets are only meaningful for uncompressed objects
+        index = LineOffsetIndex() if compression is None else None
+
+        records = []
+        offset = 0
+        body = response.body
+        while True:
+            chunk = await body.read(self._STREAM_CHUNK_SIZE)
+            lines = decoder.decode(chunk) if chunk else decoder.flush()
+            records += self._get_records_from_lines(lines, offset, index)
+            offset += sum(len(line) for line in lines)
+            if not chunk:
+                break
 
-            bytes_stream.seek(0)
-            records = [json.loads(line) for line in bytes_stream.readlines()]
+        if index is not None:
+            index.size = offset
+            index.etag = response.etag
+            self._save_line_index(key, index)
 
         return records
 
-    async def _download_keys(self, keys_to_download):
-        # Gets all records from list of keys.
-        # Returns a list of lists of dicts
+    async def _read_line_t(self, reader, index, pos, lo=0):
+        # Reads the line containing the byte offset pos, which starts no
+        # earlier than the line start lo, and adds it to the index. Returns
+        # the start and end offsets of the line and its _RECORD_T
+
+        # Fetch a chunk centred on pos, which usually contains the whole line
+        half_chunk = self._RANGE_CHUNK_SIZE // 2
+        await reader.read(max(pos - half_chunk, lo),
+                          min(pos + half_chunk, index.size))
+
+        newline = await reader.rfind_newline(lo, pos)
+        start = lo if newline is None else newline + 1
+        newline = await reader.find_newline(pos, index.size)
+        end = index.size if newline is None else newline + 1
+        t = json.loads(await reader.read(start, end))[self._RECORD_T]
+        index.add_span(start, end, t)
+
+        return start, end, t
+
+    async def _search_lines(self, reader, index, t, inclusive):
+        # Returns the byte offset at which the first line with a _RECORD_T
+        # greater than t (or equal to it, if inclusive) starts, or the object
+        # size if there is no such line. Known lines narrow down the search,
+        # which then probes lines using ranged reads. Since records are
+        # roughly evenly spaced in time, probe positions are interpolated
+        # from the times of the bounding lines, falling back to bisection
+        # whenever an interpolated probe does not halve the search range
+
+        if inclusive:
+            def is_after(record_t): return record_t >= t
+        else:
+            def is_after(record_t): return record_t > t
+
+        lo, hi, t_lo, t_hi = index.get_bounds(is_after)
+        interpolate = True
+        while lo < hi:
+            width = hi - lo
+            mid = (lo + hi) // 2
+            if interpolate and t_lo is not None and t_hi is not None \
+                    and t_hi > t_lo:
+                mid = lo + int((t - t_lo) / (t_hi - t_lo) * width)
+                mid = min(max(mid, lo), hi - 1)
+
+            start, end, line_t = await self._read_line_t(
+                reader, index, mid, lo)
+            if is_after(line_t):
+                hi, t_hi = start, line_t
+            else:
+                lo, t_lo = end, line_t
+
+            interpolate = hi - lo <= width / 2
+
+        return lo
+
+    async def _get_records_from_key_range(self, connection, key,
+                                          start_t, end_t):
+        # Gets records from the part of a single key that contains records
+        # with a _RECORD_T within [start_t, end_t], and converts them to
+        # a list of dicts
 
-        # Set up async S3 client using same region and config as s3_client
-        session = aioboto3.Session()
-        async with session.client(
-                's3',
-                region_name=self._s3_client.meta.region_name,
-                config=self._s3_client.meta.config
-                ) as async_s3_client:
+        index = self._get_line_index(key)
+        reader = _RangeReader(
+            connection,
+            key,
+            index,
+            self._RANGE_CHUNK_SIZE
+            )
+
+        try:
+            await reader.open()
+            if index.size and not index.spans:
+                # The first and last lines bound the times in the object
+                await self._read_line_t(reader, index, 0)
+                await self._read_line_t(reader, index, index.size - 1)
+            start = await self._search_lines(reader, index, start_t, True)
+            end = await self._search_lines(reader, index, end_t, False)
+            lines = []
+            if start < end:
+                lines = io.BytesIO(await reader.read(start, end)).readlines()
+        except ObjectChangedError:
+            # The object has changed since it was indexed, so discard
+            # the index and download the object in full
+            self._line_indexes.pop(key, None)
+            return await self._get_records_from_key(connection, key)
+        except _CompressedObjectError:
+            # Compressed objects cannot be read by byte range
+            self._line_indexes.pop(key, None)
+            return await self._get_records_from_key(connection, key)
+
+        records = self._get_records_from_lines(lines, start, index)
+        self._save_line_index(key, index)
+
+        return records
+
+    async def _download_keys(self, keys_to_download, key_ranges=None):
+        # Gets all records from list of keys. Keys in key_ranges, a dict
+        # mapping a key to a tuple (start_t, end_t), are only partially
+        # read. Returns a list of lists of dicts
+
+        key_ranges = key_ranges or {}
+
+        async with self._storage.connect() as connection:
+
+            def hedge_key(k):
+                # Returns a coroutine getting the records of key k, which
+                # is hedged using the tracker of its kind of read
+                if k in key_ranges:
+                    return hedge(
+                        lambda: self._get_records_from_key_range(
+                            connection, k, *key_ranges[k]),
+                        self._range_latency_tracker,
+                        self._request_timeout
+                        )
+                return hedge(
+                    lambda: self._get_records_from_key(connection, k),
+                    self._latency_tracker,
+                    self._request_timeout
+                    )
 
             # Define coroutines, one for each file to download
-            coros = [
-                    self._get_records_from_key(async_s3_client, k)
-                    for k in keys_to_download
-                        ]
+            coros = [hedge_key(k) for k in keys_to_download]
 
             key_records = await asyncio.gather(*coros)
 
         return key_records
 
+    def _get_key_dt(self, key):
+        # Returns the datetime of a records key
+
+        device_prefix = self._get_device_prefix_from_key(key)
+
+        return self._dt_builder.get_dt_from_key(key[len(device_prefix):])
+
+    def get_key_partitions(self, start_date_utc, end_date_utc,
+                           device_ids=None):
+        """
+        Returns the keys containing accelerometer records within a date
+        range, without downloading them. Each key is a partition of the
+        records that :func:`get_filtered_records` would return.
+
+        :param start_date_utc: The UTC start date
+            with format %Y-%m-%d %H:%M:%S. E.g. '2018-02-16 23:39:38'.
+        :type start_date_utc: str
+
+        :param end_date_utc: The UTC end date with same format as
+            start_date_utc.
+        :type end_date_utc: str
+
+        :param device_ids: Device IDs that should be returned.
+        :type device_ids: Union[str, list[str]]
+
+        :return: A list of partitions, one for each key, in order
+            of device and then time.
+        :rtype: list[KeyPartition]
+        """
+
+        return self._get_key_partitions(
+                self._get_dt_from_str(start_date_utc),
+                self._get_dt_from_str(end_date_utc),
+                device_ids
+                )
+
+    def _get_key_partitions(self, start_dt, end_dt, device_ids=None,
+                            listing_cache=None):
+        # Returns a list of partitions, one for each key containing
+        # records within [start_dt, end_dt]
+
+        # Get the list of keys based on start and end dates
+        keys = self._get_records_keys_to_download(
+                start_dt,
+                end_dt,
+                device_ids,
+                listing_cache
+                )
+
+        partitions = []
+        for device_prefix, device_keys in groupby(
+                keys, self._get_device_prefix_from_key):
+            # Use [:-1] to remove the final /
+            device_id = device_prefix.split('device_id=')[1][:-1]
+            device_keys = list(device_keys)
+            key_ts = [self._get_key_dt(k).timestamp() for k in device_keys]
+            # Records of the last key may extend beyond the end date
+            key_ts.append(float('inf'))
+
+            partitions += [
+                    KeyPartition(
+                        k,
+                        device_id,
+                        start_dt.timestamp(),
+                        end_dt.timestamp(),
+                        key_ts[i],
+                        key_ts[i + 1]
+                        )
+                    for i, k in enumerate(device_keys)
+                    ]
+
+        return partitions
+
+    def get_records_from_partitions(self, partitions):
+        """
+        Downloads the keys of a list of partitions concurrently. Each key
+        is only downloaded once, even if it is in several partitions.
+
+        :param partitions: The partitions to download.
+        :type partitions: list[KeyPartition]
+
+        :return: A list with the records of each partition, keeping
+            only those with a _RECORD_T within its [start_t, end_t].
+            Partitions of the same key share the same record dicts.
+        :rtype: list[list[dict]]
+        """
+
+        # Get the hull of the partition bounds of each unique key
+        keys = []
+        key_bounds = {}
+        for p in partitions:
+            if p.key not in key_bounds:
+                keys.append(p.key)
+                key_bounds[p.key] = (p.start_t, p.end_t)
+            else:
+                start_t, end_t = key_bounds[p.key]
+                key_bounds[p.key] = (
+                    min(start_t, p.start_t), max(end_t, p.end_t))
+
+        # Only read the relevant part of keys that might contain
+        # records outside the date range
+        key_ranges = {}
+        if self._range_reads:
+            key_ranges = {
+                    p.key: key_bounds[p.key]
+                    for p in partitions
+                    if (p.key_start_t < key_bounds[p.key][0] or
+                        p.key_end_t > key_bounds[p.key][1])
+                    and get_compression(p.key) is None
+                    }
+
+        key_records = dict(zip(
+                keys,
+                self._run_until_complete(
+                    self._download_keys(keys, key_ranges)
+                    )
+                ))
+
+        return [
+                [
+                    d for d in key_records[p.key]
+                    if d[self._RECORD_T] >= p.start_t and
+                    d[self._RECORD_T] <= p.end_t
+                    ]
+                for p in partitions
+                ]
+
+    def get_filtered_records_batch(self, windows):
+        """
+        Returns accelerometer records for many windows of date and
+        device at once. Keys are planned for all windows together, so
+        that each prefix is only listed once and each key is only
+        downloaded once, however many windows it belongs to.
+
+        :param windows: A list of windows, each a tuple
+            (start_date_utc, end_date_utc, device_ids) of parameters
+            as for :func:`get_filtered_records`. device_ids may be
+            omitted to use all devices.
+        :type windows: list[tuple]
+
+        :return: A list with the records of each window, in the same
+            order as windows. Windows that overlap share the same
+            record dicts.
+        :rtype: list[list[dict]]
+        """
+
+        listing_cache = {}
+        all_device_ids = None
+        window_partitions = []
+        for w in windows:
+            start_date_utc, end_date_utc, device_ids = (tuple(w) + (None,))[:3]
+            if device_ids is None:
+                # Only list all available devices once
+                if all_device_ids is None:
+                    all_device_ids = self._get_device_ids(None)
+                device_ids = all_device_ids
+
+            window_partitions.append(self._get_key_partitions(
+                    self._get_dt_from_str(start_date_utc),
+                    self._get_dt_from_str(end_date_utc),
+                    device_ids,
+                    listing_cache
+                    ))
+
+        partition_records = iter(self.get_records_from_partitions(
+                [p for wp in window_partitions for p in wp]
+                ))
+
+        # Fan the records of each partition out to its window
+        window_records = []
+        for wp in window_partitions:
+            records = []
+            for _ in wp:
+                records += next(partition_records)
+            window_records.append(records)
+
+        return window_records
+
+    @staticmethod
+    def _run_until_complete(coro):
+        # Runs a coroutine on the current event loop, creating one if
+        # the current thread does not have one
+
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+
+        return loop.run_until_complete(coro)
+
     def get_filtered_records(self, start_date_utc, end_date_utc,
                              device_ids=None):
         """
@@ -470,37 +1144,297 @@ class AwsDataClient(object):
         :rtype: list[dict]
         """
 
+        records = []
+        # Concatenate the records of all keys, which have already
+        # been filtered by date
+        for pr in self.get_records_from_partitions(
+                self.get_key_partitions(
+                    start_date_utc,
+                    end_date_utc,
+                    device_ids
+                    )
+                ):
+            records += pr
+
+        return records
+
+    def iter_filtered_records(self, start_date_utc, end_date_utc,
+                              device_ids=None, chunk_seconds=3600,
+                              read_ahead=2):
+        """
+        Yields accelerometer records filtered by date and device in
+        consecutive time chunks, e.g. hour by hour over a year. While
+        the caller processes a chunk, the next read_ahead chunks are
+        listed and downloaded in background threads, so that at most
+        read_ahead + 1 chunks are held at once.
+
+        :param start_date_utc: The UTC start date
+            with format %Y-%m-%d %H:%M:%S. E.g. '2018-02-16 23:39:38'.
+        :type start_date_utc: str
+
+        :param end_date_utc: The UTC end date with same format as
+            start_date_utc.
+        :type end_date_utc: str
+
+        :param device_ids: Device IDs that should be returned. If no
+            value is given, the devices available when iteration starts
+            are used.
+        :type device_ids: Union[str, list[str]]
+
+        :param chunk_seconds: The length in seconds of each chunk.
+        :type chunk_seconds: int
+
+        :param read_ahead: The number of chunks to download ahead of
+            the one being processed.
+        :type read_ahead: int
+
+        :return: A generator of tuples (chunk_start_utc, chunk_end_utc,
+            records), with the same date format and records as
+            :func:`get_filtered_records`. Each chunk includes records
+            at its start date, but not at its end date unless it is
+            the last chunk.
+        :rtype: generator
+        """
+
         start_dt = self._get_dt_from_str(start_date_utc)
         end_dt = self._get_dt_from_str(end_date_utc)
-        # Get the list of keys based on start and end dates
 
-        keys_to_download = self._get_records_keys_to_download(
-                start_dt,
-                end_dt,
-                device_ids
-                )
+        if end_dt < start_dt:
+            raise ValueError('end date should not be earlier than start date')
+        if chunk_seconds <= 0:
+            raise ValueError('chunk_seconds should be positive')
+        if read_ahead < 0:
+            raise ValueError('read_ahead should not be negative')
+
+        chunk_dts = []
+        chunk_start_dt = start_dt
+        while True:
+            chunk_end_dt = min(
+                chunk_start_dt + timedelta(seconds=chunk_seconds), end_dt)
+            chunk_dts.append((chunk_start_dt, chunk_end_dt))
+            if chunk_end_dt >= end_dt:
+                break
+            chunk_start_dt = chunk_end_dt
+
+        # Devices are only listed once. Listings are shared by chunks, so
+        # that each prefix is usually only listed once too, while only
+        # those of about as many chunks as are held at once are kept
+        device_ids = self._get_device_ids(device_ids)
+        num_prefixes = len(self._dt_builder.get_key_prefixes_within_range(
+            *chunk_dts[0]))
+        listing_cache = _LruCache(
+            max(len(device_ids), 1) * (num_prefixes + 1) * (read_ahead + 2))
+
+        def get_chunk_records(chunk_start_dt, chunk_end_dt):
+            records = []
+            for pr in self.get_records_from_partitions(
+                    self._get_key_partitions(
+                        chunk_start_dt,
+                        chunk_end_dt,
+                        device_ids,
+                        listing_cache
+                        )
+                    ):
+                records += pr
+            if chunk_end_dt < end_dt:
+                # Records at the end date belong to the next chunk
+                end_t = chunk_end_dt.timestamp()
+                records = [r for r in records if r[self._RECORD_T] < end_t]
+            return records
+
+        with ThreadPoolExecutor(max_workers=read_ahead + 1) as executor:
+            futures = deque()
+            chunks = iter(chunk_dts)
+            try:
+                while True:
+                    # Keep the next chunk and read_ahead chunks after it
+                    # downloading
+                    for chunk in islice(chunks, read_ahead + 1 - len(futures)):
+                        futures.append(
+                            (chunk, executor.submit(get_chunk_records, *chunk))
+                            )
+                    if not futures:
+                        break
+
+                    (chunk_start_dt, chunk_end_dt), future = futures.popleft()
+                    yield (
+                        chunk_start_dt.strftime('%Y-%m-%d %H:%M:%S'),
+                        chunk_end_dt.strftime('%Y-%m-%d %H:%M:%S'),
+                        future.result()
+                        )
+            finally:
+                # Stop downloading chunks that will not be used
+                for _, future in futures:
+                    future.cancel()
 
-        loop = asyncio.get_event_loop()
+    def _get_new_records_keys(self, watermarks, device_ids, start_dt):
+        # Returns a dict mapping each device to the list of keys added after
+        # its watermark key. Devices without a watermark start from the
+        # hour of start_dt
 
-        key_records = loop.run_until_complete(
+        new_keys = {}
+
+        for d in self._get_device_ids(device_ids):
+
+            device_prefix = self._get_records_key_device_prefix(d)
+            start_after = watermarks.get(d) or \
+                device_prefix + self._dt_builder.get_min_key(start_dt)
+
+            # Only keys after the watermark are listed, in key order
+            new_keys[d] = [
+                    k for k in self._storage.list_keys(
+                        device_prefix, start_after)
+                    if strip_compression_suffix(k).endswith(
+                        self._RECORDS_KEY_SUFFIX)
+                    ]
+
+        return new_keys
+
+    def get_new_records(self, watermarks, device_ids=None,
+                        start_date_utc=None):
+        """
+        Returns accelerometer records stored in keys added after
+        the watermark key of each device, and moves the watermarks to
+        the last of these keys. Keys are assumed to be added in
+        chronological order.
+
+        :param watermarks: A dict mapping device ID to the last
+            key that has been read for that device. It is updated
+            in place.
+        :type watermarks: dict
+
+        :param device_ids: Device IDs that should be returned.
+            If no value is given, all devices are used.
+        :type device_ids: Union[str, list[str]]
+
+        :param start_date_utc: The UTC start date with format
+            %Y-%m-%d %H:%M:%S, used for devices without a watermark.
+            Only records of these devices with a _RECORD_T equal to or
+            greater than start_date_utc will be returned. If no value
+            is given, the current time is used.
+        :type start_date_utc: str
+
+        :return: A list of records.
+        :rtype: list[dict]
+        """
+
+        if start_date_utc is None:
+            start_dt = datetime.now(timezone.utc)
+        else:
+            start_dt = self._get_dt_from_str(start_date_utc)
+
+        new_keys = self._get_new_records_keys(
+                watermarks,
+                device_ids,
+                start_dt
+                )
+
+        keys_to_download = []
+        # Keys of devices without a watermark, which need to be filtered
+        # by start date
+        keys_to_filter = set()
+        for d, keys in new_keys.items():
+            if not keys:
+                continue
+            if d not in watermarks:
+                keys_to_filter.update(keys)
+            keys_to_download += keys
+
+        key_records = self._run_until_complete(
                 self._download_keys(keys_to_download)
                 )
-        # Initialize empty list in which to store dicts
+
         records = []
-        # Now loop through all keys to download and
-        # concatenate the resulting lists of dicts
-
-        for kr in key_records:
-            # Keep all individual records that
-            # meet the date filter
-            records += [
-                    d for d in kr
-                    if d[self._RECORD_T] >= start_dt.timestamp() and
-                    d[self._RECORD_T] <= end_dt.timestamp()
-                    ]
+        for k, kr in zip(keys_to_download, key_records):
+            if k in keys_to_filter:
+                kr = [
+                        r for r in kr
+                        if r[self._RECORD_T] >= start_dt.timestamp()
+                        ]
+            records += kr
+
+        # Only move watermarks once all records have been downloaded
+        for d, keys in new_keys.items():
+            if keys:
+                watermarks[d] = keys[-1]
 
         return records
 
+    @staticmethod
+    def _load_watermarks(watermark_path):
+        # Loads watermarks from a JSON file, if it exists
+
+        if watermark_path is None or not os.path.exists(watermark_path):
+            return {}
+
+        with open(watermark_path, 'r') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _save_watermarks(watermark_path, watermarks):
+        # Saves watermarks to a JSON file, replacing it in one step so
+        # that a failure while saving does not lose the previous watermarks
+
+        if watermark_path is None:
+            return
+
+        tmp_path = watermark_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(watermarks, f)
+        os.replace(tmp_path, watermark_path)
+
+    def follow_records(self, watermark_path=None, device_ids=None,
+                       start_date_utc=None, poll_interval=10):
+        """
+        Yields accelerometer records as new keys are added, by
+        repeatedly calling :func:`get_new_records`. Watermarks are
+        saved after all records of each poll have been yielded, so that
+        a restarted process continues where it left off. Records of a
+        poll that was interrupted may therefore be yielded again.
+
+        :param watermark_path: Optional path of a JSON file in which
+            to persist the watermark key of each device.
+        :type watermark_path: str
+
+        :param device_ids: Device IDs that should be returned.
+            If no value is given, all devices are used, including
+            devices that appear while following.
+        :type device_ids: Union[str, list[str]]
+
+        :param start_date_utc: The UTC start date with format
+            %Y-%m-%d %H:%M:%S, used for devices without a watermark.
+            If no value is given, the current time is used.
+        :type start_date_utc: str
+
+        :param poll_interval: The number of seconds to wait after a poll
+            that finds no new records.
+        :type poll_interval: float
+
+        :return: A generator of records.
+        :rtype: generator
+        """
+
+        watermarks = self._load_watermarks(watermark_path)
+
+        if start_date_utc is None:
+            # Fix the start date so it does not move between polls
+            start_date_utc = datetime.now(timezone.utc).strftime(
+                '%Y-%m-%d %H:%M:%S')
+
+        while True:
+            records = self.get_new_records(
+                    watermarks,
+                    device_ids,
+                    start_date_utc
+                    )
+
+            yield from records
+
+            self._save_watermarks(watermark_path, watermarks)
+
+            if not records:
+                time.sleep(poll_interval)
+
     def get_devices_full_history(self):
         """
         Gets full history of device metadata.
@@ -511,20 +1445,14 @@ class AwsDataClient(object):
         :rtype: list[dict]
         """
 
-        bytes_stream = io.BytesIO()
         try:
-            self._s3_client.download_fileobj(
-                    self._S3_BUCKET_NAME,
-                    self._devices_key,
-                    bytes_stream
-                    )
-        except botocoreClientError as e:
-            if e.response['Error']['Code'] == "404":
-                print("Currently there are no devices availabel in country "+self.country_code.upper())
-                sys.exit(1)
-            else:
-                raise NotImplementedError
-        bytes_stream.seek(0)
+            bytes_stream = io.BytesIO(
+                    self._storage.get_bytes(self._devices_key))
+        except KeyError:
+            print("Currently there are no devices availabel in country "+self.country_code.upper())
+            sys.exit(1)
+        except botocoreClientError:
+            raise NotImplementedError
         devices = [json.loads(line) for line in bytes_stream.readlines()]
         bytes_stream.close()
 
@@ -564,3 +1492,225 @@ class AwsDataClient(object):
                 if d['effective_from'] <= ts and
                 d['effective_to'] >= ts
                 ]
+
+    def get_device_index(self):
+        """
+        Gets a spatial index of the full history of device metadata.
+        The index is built on first use and then reused by the client.
+
+        :return: The spatial index.
+        :rtype: openeew.data.spatial.DeviceIndex
+        """
+
+        if self._device_index is None:
+            self._device_index = DeviceIndex(self.get_devices_full_history())
+
+        return self._device_index
+
+    def get_filtered_records_within_box(self, start_date_utc, end_date_utc,
+                                        min_latitude, min_longitude,
+                                        max_latitude, max_longitude):
+        """
+        Returns accelerometer records filtered by date, of devices
+        located within a latitude/longitude bounding box at some time
+        within the date range. Only the keys of these devices are
+        listed and downloaded.
+
+        :param start_date_utc: The UTC start date
+            with format %Y-%m-%d %H:%M:%S. E.g. '2018-02-16 23:39:38'.
+        :type start_date_utc: str
+
+        :param end_date_utc: The UTC end date with same format as
+            start_date_utc.
+        :type end_date_utc: str
+
+        :param min_latitude: The southern edge of the box.
+        :type min_latitude: float
+
+        :param min_longitude: The western edge of the box.
+        :type min_longitude: float
+
+        :param max_latitude: The northern edge of the box.
+        :type max_latitude: float
+
+        :param max_longitude: The eastern edge of the box.
+        :type max_longitude: float
+
+        :return: A list of records, as for :func:`get_filtered_records`.
+        :rtype: list[dict]
+        """
+
+        device_ids = self.get_device_index().get_device_ids_within_box(
+                min_latitude,
+                min_longitude,
+                max_latitude,
+                max_longitude,
+                self._get_dt_from_str(start_date_utc).timestamp(),
+                self._get_dt_from_str(end_date_utc).timestamp()
+                )
+
+        return self.get_filtered_records(
+                start_date_utc,
+                end_date_utc,
+                device_ids
+                )
+
+    def get_filtered_records_within_radius(self, start_date_utc, end_date_utc,
+                                           latitude, longitude, radius_km):
+        """
+        Returns accelerometer records filtered by date, of devices
+        located within a distance of a point, e.g. an epicenter, at some
+        time within the date range. Only the keys of these devices are
+        listed and downloaded.
+
+        :param start_date_utc: The UTC start date
+            with format %Y-%m-%d %H:%M:%S. E.g. '2018-02-16 23:39:38'.
+        :type start_date_utc: str
+
+        :param end_date_utc: The UTC end date with same format as
+            start_date_utc.
+        :type end_date_utc: str
+
+        :param latitude: Latitude of the point in degrees.
+        :type latitude: float
+
+        :param longitude: Longitude of the point in degrees.
+        :type longitude: float
+
+        :param radius_km: The max distance from the point in km.
+        :type radius_km: float
+
+        :return: A list of records, as for :func:`get_filtered_records`.
+        :rtype: list[dict]
+        """
+
+        device_ids = self.get_device_index().get_device_ids_within_radius(
+                latitude,
+                longitude,
+                radius_km,
+                self._get_dt_from_str(start_date_utc).timestamp(),
+                self._get_dt_from_str(end_date_utc).timestamp()
+                )
+
+        return self.get_filtered_records(
+                start_date_utc,
+                end_date_utc,
+                device_ids
+                )
+
+    def get_event_records(self, origin_time_utc, latitude, longitude,
+                          radius_km, depth_km=0.0, velocity_model=None,
+                          pre_p=5.0, post_s=30.0):
+        """
+        Returns accelerometer records of an earthquake for all devices
+        within a distance of its epicenter. The records of each device
+        are filtered to its own window, from shortly before the predicted
+        P arrival until after the predicted S arrival (see
+        :func:`openeew.data.event.get_event_windows`). The keys of all
+        windows are planned together and downloaded in one batch.
+
+        :param origin_time_utc: The UTC origin time of the earthquake
+            with format %Y-%m-%d %H:%M:%S. E.g. '2018-02-16 23:39:38'.
+        :type origin_time_utc: str
+
+        :param latitude: Latitude of the epicenter in degrees.
+        :type latitude: float
+
+        :param longitude: Longitude of the epicenter in degrees.
+        :type longitude: float
+
+        :param radius_km: The max epicentral distance of devices in km.
+        :type radius_km: float
+
+        :param depth_km: The depth of the hypocenter in km.
+        :type depth_km: float
+
+        :param velocity_model: The velocity model used to predict arrival
+            times. If no value is given, a default model is used.
+        :type velocity_model: openeew.data.event.VelocityModel
+
+        :param pre_p: The number of seconds before the P arrival
+            at which each window starts.
+        :type pre_p: float
+
+        :param post_s: The number of seconds after the S arrival
+            at which each window ends.
+        :type post_s: float
+
+        :return: A list of records, as for :func:`get_filtered_records`.
+        :rtype: list[dict]
+        """
+
+        return self.get_events_records(
+                [(origin_time_utc, latitude, longitude, depth_km)],
+                radius_km,
+                velocity_model,
+                pre_p,
+                post_s
+                )
+
+    def get_events_records(self, events, radius_km, velocity_model=None,
+                           pre_p=5.0, post_s=30.0):
+        """
+        Same as :func:`get_event_records`, but for many earthquakes at
+        once. Windows of the same device that overlap, e.g. those of
+        nearby earthquakes, are merged so that each record is only
+        returned once.
+
+        :param events: A list of earthquakes, each a tuple
+            (origin_time_utc, latitude, longitude, depth_km) of
+            parameters as for :func:`get_event_records`. depth_km may
+            be omitted to use 0.
+        :type events: list[tuple]
+
+        :param radius_km: The max epicentral distance of devices in km.
+        :type radius_km: float
+
+        :param velocity_model: The velocity model used to predict arrival
+            times. If no value is given, a default model is used.
+        :type velocity_model: openeew.data.event.VelocityModel
+
+        :param pre_p: The number of seconds before the P arrival
+            at which each window starts.
+        :type pre_p: float
+
+        :param post_s: The number of seconds after the S arrival
+            at which each window ends.
+        :type post_s: float
+
+        :return: A list of records, as for :func:`get_filtered_records`.
+        :rtype: list[dict]
+        """
+
+        device_index = self.get_device_index()
+        windows = []
+        for e in events:
+            origin_time_utc, latitude, longitude, depth_km = \
+                (tuple(e) + (0.0,))[:4]
+            windows += get_event_windows(
+                    device_index,
+                    self._get_dt_from_str(origin_time_utc).timestamp(),
+                    latitude,
+                    longitude,
+                    radius_km,
+                    depth_km,
+                    velocity_model,
+                    pre_p,
+                    post_s
+                    )
+
+        listing_cache = {}
+        partitions = []
+        for w in merge_event_windows(windows):
+            partitions += self._get_key_partitions(
+                    datetime.fromtimestamp(w['start_t'], timezone.utc),
+                    datetime.fromtimestamp(w['end_t'], timezone.utc),
+                    w['device_id'],
+                    listing_cache
+                    )
+
+        records = []
+        for pr in self.get_records_from_partitions(partitions):
+            records += pr
+
+        return records
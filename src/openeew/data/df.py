@@ -14,7 +14,9 @@
 # limitations under the License.
 # =============================================================================
 
-from .record import add_sample_t_to_records
+from .timing import get_sample_t_array
+from datetime import datetime
+from itertools import accumulate, groupby
 import pandas as pd
 
 
@@ -27,7 +29,9 @@ def get_df_from_records(records, ref_t_name='cloud_t', ref_axis='x'):
     :type records: list[dict]
 
     :param ref_t_name: The name of the time field to use as a reference when
-        calculating sample times. This should be either cloud_t or device_t.
+        calculating sample times. This should be either cloud_t, device_t
+        or fitted_t, added by
+        :func:`openeew.data.timing.add_fitted_t_to_records`.
     :type ref_t_name: str
 
     :param ref_axis: The axis to use when determining
@@ -44,8 +48,19 @@ def get_df_from_records(records, ref_t_name='cloud_t', ref_axis='x'):
     if not records:
         raise ValueError('The list of records should be non-empty')
 
-    # Add list of sample times to each record
-    records = add_sample_t_to_records(records, ref_t_name, ref_axis)
+    # Add list of sample times to each record, calculating those of
+    # all records at once
+    num_samples = [len(r[ref_axis]) for r in records]
+    sample_t = get_sample_t_array(
+            [r[ref_t_name] for r in records],
+            num_samples,
+            [r['sr'] for r in records]
+            ).tolist()
+    ends = list(accumulate(num_samples))
+    records = [
+            {**r, 'sample_t': sample_t[end - n:end]}
+            for r, n, end in zip(records, num_samples, ends)
+            ]
     # Concatenate all dicts into a single DataFrame
     records_df = pd.concat(
             [pd.DataFrame.from_dict(r) for r in records]
@@ -56,3 +71,262 @@ def get_df_from_records(records, ref_t_name='cloud_t', ref_axis='x'):
             )
 
     return records_df
+
+
+def _get_ts_from_str(date_utc):
+    # Parses the input string with format YYYY-mm-dd HH:MM:SS into
+    # a Unix timestamp, assuming UTC
+    return datetime.strptime(
+        '{} +0000'.format(date_utc),
+        '%Y-%m-%d %H:%M:%S %z'
+        ).timestamp()
+
+
+class LazyDataFrame(object):
+    """
+    A lazy, partitioned equivalent of the DataFrame returned by
+    :func:`get_df_from_records`, with one partition per records key.
+    Partitions are only downloaded and converted to pandas DataFrames
+    when iterated over or computed, so that data larger than memory can
+    be processed one partition at a time.
+    """
+
+    def __init__(self, data_client, partitions, ref_t_name='cloud_t',
+                 ref_axis='x', funcs=None):
+        """
+        Initialize LazyDataFrame with the following parameters:
+
+        :param data_client: The client used to download partitions.
+        :type data_client: openeew.data.aws.AwsDataClient
+
+        :param partitions: The partitions, as returned by
+            :func:`openeew.data.aws.AwsDataClient.get_key_partitions`.
+        :type partitions: list[openeew.data.aws.KeyPartition]
+
+        :param ref_t_name: The name of the time field to use as a reference
+            when calculating sample times.
+        :type ref_t_name: str
+
+        :param ref_axis: The axis to use when determining
+            the number of sample points in each record.
+        :type ref_axis: str
+
+        :param funcs: Functions to apply in order to the DataFrame of
+            each partition.
+        :type funcs: list[function]
+        """
+        self._data_client = data_client
+        self._partitions = list(partitions)
+        self._ref_t_name = ref_t_name
+        self._ref_axis = ref_axis
+        self._funcs = list(funcs or [])
+
+    def _copy(self, partitions=None, funcs=None):
+        # Returns a LazyDataFrame with the same client and settings
+
+        return LazyDataFrame(
+            self._data_client,
+            self._partitions if partitions is None else partitions,
+            self._ref_t_name,
+            self._ref_axis,
+            self._funcs if funcs is None else funcs
+            )
+
+    @property
+    def partitions(self):
+        """
+        :return: The partitions, one for each records key.
+        :rtype: list[openeew.data.aws.KeyPartition]
+        """
+        return self._partitions
+
+    @property
+    def npartitions(self):
+        """
+        :return: The number of partitions.
+        :rtype: int
+        """
+        return len(self._partitions)
+
+    @property
+    def device_ids(self):
+        """
+        :return: The devices with at least one partition, in order.
+        :rtype: list[str]
+        """
+        return [d for d, _ in groupby(p.device_id for p in self._partitions)]
+
+    def filter_time(self, start_date_utc, end_date_utc):
+        """
+        Lazily keeps only records within a date range. Partitions
+        that cannot contain any such records are dropped without
+        being downloaded.
+
+        :param start_date_utc: The UTC start date
+            with format %Y-%m-%d %H:%M:%S. E.g. '2018-02-16 23:39:38'.
+        :type start_date_utc: str
+
+        :param end_date_utc: The UTC end date with same format as
+            start_date_utc.
+        :type end_date_utc: str
+
+        :return: The filtered LazyDataFrame.
+        :rtype: LazyDataFrame
+        """
+        start_t = _get_ts_from_str(start_date_utc)
+        end_t = _get_ts_from_str(end_date_utc)
+
+        if end_t < start_t:
+            raise ValueError('end date should not be earlier than start date')
+
+        partitions = []
+        for p in self._partitions:
+            p = p._replace(
+                start_t=max(p.start_t, start_t),
+                end_t=min(p.end_t, end_t)
+                )
+            if max(p.start_t, p.key_start_t) <= min(p.end_t, p.key_end_t):
+                partitions.append(p)
+
+        return self._copy(partitions=partitions)
+
+    def filter_devices(self, device_ids):
+        """
+        Lazily keeps only records of some devices.
+
+        :param device_ids: Device IDs to keep.
+        :type device_ids: Union[str, list[str]]
+
+        :return: The filtered LazyDataFrame.
+        :rtype: LazyDataFrame
+        """
+        if isinstance(device_ids, str):
+            device_ids = [device_ids]
+
+        return self._copy(partitions=[
+            p for p in self._partitions if p.device_id in device_ids
+            ])
+
+    def map_partitions(self, func):
+        """
+        Lazily applies a function to the DataFrame of each partition,
+        e.g. to compute a per-partition aggregation.
+
+        :param func: A function that takes a pandas DataFrame and
+            returns a pandas DataFrame or Series.
+        :type func: function
+
+        :return: The LazyDataFrame with the function applied.
+        :rtype: LazyDataFrame
+        """
+        return self._copy(funcs=self._funcs + [func])
+
+    def iter_partitions(self, batch_size=16):
+        """
+        Downloads partitions and yields their DataFrames in order.
+        Partitions without any records are skipped.
+
+        :param batch_size: The number of partitions to download
+            concurrently. At most this many partitions are held
+            in memory at a time.
+        :type batch_size: int
+
+        :return: A generator of pandas DataFrames.
+        :rtype: generator
+        """
+        for i in range(0, len(self._partitions), batch_size):
+            batch_records = self._data_client.get_records_from_partitions(
+                self._partitions[i:i + batch_size]
+                )
+
+            for records in batch_records:
+                if not records:
+                    continue
+
+                df = get_df_from_records(
+                    records, self._ref_t_name, self._ref_axis)
+                for func in self._funcs:
+                    df = func(df)
+
+                yield df
+
+    def iter_devices(self, batch_size=16):
+        """
+        Yields the DataFrame of each device in turn, so that only
+        the records of one device are held in memory at a time.
+
+        :param batch_size: The number of partitions to download
+            concurrently.
+        :type batch_size: int
+
+        :return: A generator of tuples (device_id, DataFrame). Devices
+            without any records are skipped.
+        :rtype: generator
+        """
+        for device_id, partitions in groupby(
+                self._partitions, lambda p: p.device_id):
+            dfs = list(
+                self._copy(partitions=list(partitions))
+                .iter_partitions(batch_size)
+                )
+            if dfs:
+                yield device_id, pd.concat(dfs)
+
+    def compute(self, batch_size=16):
+        """
+        Downloads all partitions and concatenates their DataFrames.
+
+        :param batch_size: The number of partitions to download
+            concurrently.
+        :type batch_size: int
+
+        :return: The concatenated DataFrames, or an empty DataFrame
+            if there are no records.
+        :rtype: pandas.DataFrame
+        """
+        dfs = list(self.iter_partitions(batch_size))
+
+        return pd.concat(dfs) if dfs else pd.DataFrame()
+
+
+def get_lazy_df(data_client, start_date_utc, end_date_utc, device_ids=None,
+                ref_t_name='cloud_t', ref_axis='x'):
+    """
+    Returns a lazy, partitioned DataFrame of accelerometer records
+    filtered by date and device, with one partition per records key.
+    Keys are listed but not downloaded.
+
+    :param data_client: The client used to list and download keys.
+    :type data_client: openeew.data.aws.AwsDataClient
+
+    :param start_date_utc: The UTC start date
+        with format %Y-%m-%d %H:%M:%S. E.g. '2018-02-16 23:39:38'.
+    :type start_date_utc: str
+
+    :param end_date_utc: The UTC end date with same format as
+        start_date_utc.
+    :type end_date_utc: str
+
+    :param device_ids: Device IDs that should be returned.
+    :type device_ids: Union[str, list[str]]
+
+    :param ref_t_name: The name of the time field to use as a reference when
+        calculating sample times. This should be either cloud_t or device_t.
+    :type ref_t_name: str
+
+    :param ref_axis: The axis to use when determining
+        the number of sample points in each record.
+    :type ref_axis: str
+
+    :return: A LazyDataFrame whose partitions, once computed, give
+        the same rows as :func:`get_df_from_records` applied to the
+        output of :func:`openeew.data.aws.AwsDataClient.get_filtered_records`.
+    :rtype: LazyDataFrame
+    """
+    return LazyDataFrame(
+        data_client,
+        data_client.get_key_partitions(
+            start_date_utc, end_date_utc, device_ids),
+        ref_t_name,
+        ref_axis
+        )
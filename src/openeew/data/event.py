@@ -0,0 +1,151 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from math import sqrt
+
+
+class VelocityModel(object):
+    """
+    A simple velocity model of a homogeneous half-space, where
+    P and S waves travel along straight rays at constant velocities.
+    """
+
+    def __init__(self, vp=6.0, vs=3.5):
+        """
+        Initialize VelocityModel with the following parameters:
+
+        :param vp: The P-wave velocity in km/s.
+        :type vp: float
+
+        :param vs: The S-wave velocity in km/s.
+        :type vs: float
+        """
+        if vp <= 0 or vs <= 0:
+            raise ValueError('velocities should be positive')
+
+        self.vp = vp
+        self.vs = vs
+
+    def get_travel_times(self, distance_km, depth_km=0.0):
+        """
+        Calculates P and S travel times from a hypocenter.
+
+        :param distance_km: The epicentral distance in km.
+        :type distance_km: float
+
+        :param depth_km: The depth of the hypocenter in km.
+        :type depth_km: float
+
+        :return: A tuple (tp, ts) of travel times in seconds.
+        :rtype: tuple(float, float)
+        """
+        hypocentral_distance_km = sqrt(distance_km ** 2 + depth_km ** 2)
+
+        return (
+            hypocentral_distance_km / self.vp,
+            hypocentral_distance_km / self.vs
+            )
+
+
+def get_event_windows(device_index, origin_t, latitude, longitude,
+                      radius_km, depth_km=0.0, velocity_model=None,
+                      pre_p=5.0, post_s=30.0):
+    """
+    Calculates, for each device near an earthquake, the time window
+    from shortly before the predicted P arrival until after the
+    predicted S arrival.
+
+    :param device_index: A spatial index of device metadata.
+    :type device_index: openeew.data.spatial.DeviceIndex
+
+    :param origin_t: The Unix origin time of the earthquake.
+    :type origin_t: float
+
+    :param latitude: Latitude of the epicenter in degrees.
+    :type latitude: float
+
+    :param longitude: Longitude of the epicenter in degrees.
+    :type longitude: float
+
+    :param radius_km: The max epicentral distance of devices in km.
+    :type radius_km: float
+
+    :param depth_km: The depth of the hypocenter in km.
+    :type depth_km: float
+
+    :param velocity_model: The velocity model used to predict arrival
+        times. If no value is given, a default VelocityModel is used.
+    :type velocity_model: VelocityModel
+
+    :param pre_p: The number of seconds before the P arrival
+        at which each window starts.
+    :type pre_p: float
+
+    :param post_s: The number of seconds after the S arrival
+        at which each window ends.
+    :type post_s: float
+
+    :return: A list of windows sorted by distance, each a dict with
+        fields device_id, distance_km, p_t, s_t, start_t and end_t,
+        where times are Unix times.
+    :rtype: list[dict]
+    """
+    velocity_model = velocity_model or VelocityModel()
+
+    windows = []
+    # Only use device locations valid at the origin time
+    for d in device_index.get_devices_within_radius(
+            latitude, longitude, radius_km, origin_t, origin_t):
+        tp, ts = velocity_model.get_travel_times(d['distance_km'], depth_km)
+        windows.append({
+            'device_id': d['device_id'],
+            'distance_km': d['distance_km'],
+            'p_t': origin_t + tp,
+            's_t': origin_t + ts,
+            'start_t': origin_t + tp - pre_p,
+            'end_t': origin_t + ts + post_s
+            })
+
+    return windows
+
+
+def merge_event_windows(windows):
+    """
+    Merges the overlapping time windows of each device, e.g. the
+    windows of nearby earthquakes, so that no record belongs to more
+    than one window.
+
+    :param windows: A list of windows, each a dict with at least
+        the fields device_id, start_t and end_t.
+    :type windows: list[dict]
+
+    :return: A list of windows sorted by device and start time, each
+        a dict with fields device_id, start_t and end_t.
+    :rtype: list[dict]
+    """
+    merged = []
+    for w in sorted(windows, key=lambda w: (w['device_id'], w['start_t'])):
+        if merged and merged[-1]['device_id'] == w['device_id'] \
+                and w['start_t'] <= merged[-1]['end_t']:
+            merged[-1]['end_t'] = max(merged[-1]['end_t'], w['end_t'])
+        else:
+            merged.append({
+                'device_id': w['device_id'],
+                'start_t': w['start_t'],
+                'end_t': w['end_t']
+                })
+
+    return merged
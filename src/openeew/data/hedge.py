@@ -0,0 +1,166 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import asyncio
+import time
+from collections import deque
+
+
+class LatencyTracker(object):
+    """
+    A tracker of recent request latencies, giving the delay after
+    which a request is considered slow enough to be hedged, i.e. to
+    have a duplicate request issued for it. The delay adapts to the
+    observed latencies as a percentile of the most recent ones.
+    """
+
+    def __init__(self, percentile=95.0, window=1000, min_samples=20,
+                 min_delay=0.0):
+        """
+        Initialize LatencyTracker with the following parameters:
+
+        :param percentile: The percentile of recent latencies after
+            which requests are hedged, between 0 and 100.
+        :type percentile: float
+
+        :param window: The number of most recent latencies to keep.
+        :type window: int
+
+        :param min_samples: The number of latencies required before
+            any request is hedged.
+        :type min_samples: int
+
+        :param min_delay: The min delay in seconds before hedging.
+        :type min_delay: float
+        """
+        if not 0 <= percentile <= 100:
+            raise ValueError('percentile should be between 0 and 100')
+
+        self._percentile = percentile
+        self._latencies = deque(maxlen=window)
+        self._min_samples = min_samples
+        self._min_delay = min_delay
+        self.num_requests = 0
+        self.num_hedges = 0
+
+    def add(self, latency):
+        """
+        Adds the latency of a completed request.
+
+        :param latency: The latency in seconds.
+        :type latency: float
+        """
+        self._latencies.append(latency)
+
+    @property
+    def delay(self):
+        """
+        :return: The delay in seconds after which to hedge a request,
+            or None if there are not yet enough latencies to tell.
+        :rtype: float
+        """
+        if len(self._latencies) < max(self._min_samples, 1):
+            return None
+
+        latencies = sorted(self._latencies)
+        idx = int(round(self._percentile / 100 * (len(latencies) - 1)))
+
+        return max(latencies[idx], self._min_delay)
+
+
+async def hedge(coro_factory, tracker=None, timeout=None, max_hedges=1):
+    """
+    Awaits a request, issuing a duplicate request if it takes longer
+    than the tracker's delay, and returns whichever result arrives
+    first. Any other requests still pending are then cancelled.
+
+    :param coro_factory: A function returning a new coroutine that
+        makes the request each time it is called.
+    :type coro_factory: function
+
+    :param tracker: The tracker giving the hedge delay, which is also
+        given the time from issuing the first request until a result
+        arrives. If no value is given, requests are never hedged.
+    :type tracker: LatencyTracker
+
+    :param timeout: Optional timeout in seconds of each request.
+        A request that times out is hedged if possible.
+    :type timeout: float
+
+    :param max_hedges: The max number of duplicate requests to issue.
+    :type max_hedges: int
+
+    :return: The result of the first request to succeed.
+    """
+
+    async def request():
+        if timeout is None:
+            return await coro_factory()
+        return await asyncio.wait_for(coro_factory(), timeout)
+
+    if tracker is not None:
+        tracker.num_requests += 1
+
+    # The latency is measured from the first request rather than for
+    # each duplicate, since only the requests that win would be
+    # measured otherwise. Losing requests are the slow ones, and
+    # leaving them out would make the hedge delay keep falling
+    start = time.monotonic()
+
+    pending = {asyncio.ensure_future(request())}
+    num_hedges = 0
+    try:
+        while True:
+            delay = None
+            if tracker is not None and num_hedges < max_hedges:
+                delay = tracker.delay
+
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=delay,
+                return_when=asyncio.FIRST_COMPLETED
+                )
+
+            error = None
+            for task in done:
+                if task.exception() is None:
+                    if tracker is not None:
+                        tracker.add(time.monotonic() - start)
+                    return task.result()
+                error = task.exception()
+
+            if pending and error is not None:
+                # Wait for the requests that are still running
+                continue
+
+            if error is not None and \
+                    not isinstance(error, asyncio.TimeoutError):
+                raise error
+
+            if num_hedges >= max_hedges:
+                if error is not None:
+                    raise error
+                continue
+
+            # Issue a duplicate request, as the previous ones are either
+            # slow or have timed out
+            num_hedges += 1
+            if tracker is not None:
+                tracker.num_hedges += 1
+            pending.add(asyncio.ensure_future(request()))
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,189 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import json
+import os
+import tempfile
+import threading
+
+
+class LineOffsetIndex(object):
+    """
+    An index of the lines of a single JSON-lines object. For each
+    known line it stores the byte offset at which the line starts,
+    the byte offset at which it ends (i.e. where the next line starts)
+    and the value of the time field of the record on that line.
+
+    The index may be partial, containing only those lines that have
+    been read so far. It assumes that records within an object
+    are stored in chronological order of the time field. Lines can
+    be added and looked up from several threads at once.
+    """
+
+    def __init__(self, size=None, etag=None, spans=None):
+        """
+        Initialize LineOffsetIndex with the following parameters:
+
+        :param size: The size of the object in bytes, if known.
+        :type size: int
+
+        :param etag: The ETag of the object, if known.
+        :type etag: str
+
+        :param spans: A list of known lines, where each line is
+            a list [start, end, t].
+        :type spans: list[list]
+        """
+        self.size = size
+        self.etag = etag
+        self._spans = []
+        self._lock = threading.Lock()
+        for s in spans or []:
+            self.add_span(*s)
+
+    @property
+    def spans(self):
+        """
+        :return: A list of known lines [start, end, t] sorted by start.
+        :rtype: list[list]
+        """
+        return self._spans
+
+    def add_span(self, start, end, t):
+        """
+        Adds a line to the index, unless it is already known.
+
+        :param start: Byte offset at which the line starts.
+        :type start: int
+
+        :param end: Byte offset at which the next line starts.
+        :type end: int
+
+        :param t: Value of the time field of the record on the line.
+        :type t: float
+        """
+        with self._lock:
+            # Find the insertion point by bisecting on the start offset
+            lo, hi = 0, len(self._spans)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._spans[mid][0] < start:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < len(self._spans) and self._spans[lo][0] == start:
+                return
+            self._spans.insert(lo, [start, end, t])
+
+    def get_bounds(self, is_after):
+        """
+        Narrows down where the first line satisfying a condition
+        on the time field can start, using known lines only.
+
+        :param is_after: A function of the time field that is False
+            for all lines before some line and True for that line
+            and all lines after it.
+        :type is_after: function
+
+        :return: A tuple (lo, hi, t_lo, t_hi) such that the required
+            line starts no earlier than lo and no later than hi. If
+            lo == hi then the line starts exactly at lo (or lo is the
+            object size if there is no such line). t_lo is the time of
+            the line ending at lo and t_hi the time of the line starting
+            at hi, each of which is None if that line is not known.
+        :rtype: tuple
+        """
+        with self._lock:
+            # Bisect for the first known line satisfying is_after
+            lo, hi = 0, len(self._spans)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if is_after(self._spans[mid][2]):
+                    hi = mid
+                else:
+                    lo = mid + 1
+
+            lower, t_lower = 0, None
+            if lo > 0:
+                lower, t_lower = self._spans[lo - 1][1:]
+
+            upper, t_upper = self.size, None
+            if lo < len(self._spans):
+                upper, t_upper = self._spans[lo][0], self._spans[lo][2]
+
+        return lower, upper, t_lower, t_upper
+
+    def to_dict(self):
+        """
+        :return: A JSON-serializable representation of the index.
+        :rtype: dict
+        """
+        with self._lock:
+            spans = [list(s) for s in self._spans]
+
+        return {'size': self.size, 'etag': self.etag, 'spans': spans}
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Creates an index from the output of :func:`to_dict`.
+
+        :param d: The dict representation of the index.
+        :type d: dict
+
+        :return: The index.
+        :rtype: LineOffsetIndex
+        """
+        return cls(d.get('size'), d.get('etag'), d.get('spans'))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index from a sidecar file.
+
+        :param path: Path of the sidecar file.
+        :type path: str
+
+        :return: The index, or None if the file does not exist.
+        :rtype: LineOffsetIndex
+        """
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        """
+        Saves the index to a sidecar file, creating any missing
+        parent directories.
+
+        :param path: Path of the sidecar file.
+        :type path: str
+        """
+        dir_name = os.path.dirname(path) or '.'
+        os.makedirs(dir_name, exist_ok=True)
+        # Write to a unique temporary file first so that a partially
+        # written index is never read back, even if the same index is
+        # saved from several threads at once
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=dir_name)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.to_dict(), f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
@@ -0,0 +1,278 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+import gzip
+import json
+import zlib
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+# Compression of files and keys by suffix
+_SUFFIXES = {'.gz': GZIP, '.zst': ZSTD}
+# Compression of S3 objects by Content-Encoding
+_CONTENT_ENCODINGS = {'gzip': GZIP, 'x-gzip': GZIP, 'zstd': ZSTD}
+# Number of bytes read at a time from local files
+_READ_CHUNK_SIZE = 65536
+
+
+def _import_zstandard():
+    # zstandard is an optional dependency, only needed for zstd data
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            'zstandard is required for zstd-compressed data. '
+            'It can be installed with pip install openeew[zstd]'
+            )
+
+    return zstandard
+
+
+def get_compression(name, content_encoding=None):
+    """
+    Returns the compression of a file or key, given by its suffix
+    or, failing that, by its Content-Encoding.
+
+    :param name: The name of the file or key.
+    :type name: str
+
+    :param content_encoding: Optional Content-Encoding of the object.
+    :type content_encoding: str
+
+    :return: Either 'gzip', 'zstd' or None if not compressed.
+    :rtype: str
+    """
+    for suffix, compression in _SUFFIXES.items():
+        if name.endswith(suffix):
+            return compression
+
+    if content_encoding:
+        return _CONTENT_ENCODINGS.get(content_encoding.lower())
+
+    return None
+
+
+def strip_compression_suffix(name):
+    """
+    Removes the compression suffix, if any, from a file or key.
+
+    :param name: The name of the file or key.
+    :type name: str
+
+    :return: The name without compression suffix.
+    :rtype: str
+    """
+    for suffix in _SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+
+    return name
+
+
+class _ConcatenatedDecompressor(object):
+    """
+    An incremental decompressor that also handles data consisting of
+    several concatenated gzip members or zstd frames, each of which is
+    decompressed by a new decompression object.
+    """
+
+    def __init__(self, get_decompressobj):
+        self._get_decompressobj = get_decompressobj
+        self._decompressor = get_decompressobj()
+
+    def decompress(self, data):
+        parts = []
+        while data:
+            if self._decompressor.eof:
+                self._decompressor = self._get_decompressobj()
+            parts.append(self._decompressor.decompress(data))
+            data = self._decompressor.unused_data \
+                if self._decompressor.eof else b''
+
+        return b''.join(parts)
+
+
+class LineDecoder(object):
+    """
+    An incremental decoder that decompresses chunks of a JSON-lines
+    stream, if needed, and splits them into lines. This allows lines to
+    be parsed while the stream is still being downloaded.
+    """
+
+    def __init__(self, compression=None):
+        """
+        Initialize LineDecoder with the following parameters:
+
+        :param compression: The compression of the stream, either
+            'gzip', 'zstd' or None if not compressed.
+        :type compression: str
+        """
+        if compression == GZIP:
+            self._decompressor = _ConcatenatedDecompressor(
+                lambda: zlib.decompressobj(16 + zlib.MAX_WBITS))
+        elif compression == ZSTD:
+            zstd_decompressor = _import_zstandard().ZstdDecompressor()
+            self._decompressor = _ConcatenatedDecompressor(
+                zstd_decompressor.decompressobj)
+        elif compression is None:
+            self._decompressor = None
+        else:
+            raise ValueError('Unknown compression {}'.format(compression))
+        # Decompressed bytes of the current incomplete line
+        self._remainder = b''
+
+    def decode(self, chunk):
+        """
+        Decodes the next chunk of the stream.
+
+        :param chunk: The next chunk of the stream.
+        :type chunk: bytes
+
+        :return: The lines completed by the chunk, each including
+            its trailing newline.
+        :rtype: list[bytes]
+        """
+        if self._decompressor is not None:
+            chunk = self._decompressor.decompress(chunk)
+
+        lines = (self._remainder + chunk).split(b'\n')
+        self._remainder = lines.pop()
+
+        return [line + b'\n' for line in lines]
+
+    def flush(self):
+        """
+        Ends the stream.
+
+        :return: The final line, if the stream does not end
+            with a newline.
+        :rtype: list[bytes]
+        """
+        remainder, self._remainder = self._remainder, b''
+
+        return [remainder] if remainder.strip() else []
+
+
+def open_jsonl(path, mode='rb'):
+    """
+    Opens a local JSON-lines file, compressed according to its suffix,
+    i.e. .gz for gzip and .zst for zstd.
+
+    :param path: Path of the file.
+    :type path: str
+
+    :param mode: The mode in which to open the file, e.g. 'rb' or 'wb'.
+    :type mode: str
+
+    :return: A file object.
+    """
+    compression = get_compression(path)
+
+    if compression == GZIP:
+        return gzip.open(path, mode)
+    elif compression == ZSTD:
+        return _import_zstandard().open(path, mode)
+
+    return open(path, mode)
+
+
+def encode_records(records, compression=None):
+    """
+    Encodes records as JSON lines.
+
+    :param records: The records to encode.
+    :type records: list[dict]
+
+    :param compression: The compression of the encoded data, either
+        'gzip', 'zstd' or None to not compress it.
+    :type compression: str
+
+    :return: The encoded data.
+    :rtype: bytes
+    """
+    data = b''.join(json.dumps(r).encode() + b'\n' for r in records)
+
+    if compression == GZIP:
+        return gzip.compress(data)
+    elif compression == ZSTD:
+        return _import_zstandard().ZstdCompressor().compress(data)
+    elif compression is not None:
+        raise ValueError('Unknown compression {}'.format(compression))
+
+    return data
+
+
+def decode_records(data, compression=None):
+    """
+    Decodes records from JSON lines.
+
+    :param data: The encoded data.
+    :type data: bytes
+
+    :param compression: The compression of the encoded data, either
+        'gzip', 'zstd' or None if not compressed.
+    :type compression: str
+
+    :return: A list of records.
+    :rtype: list[dict]
+    """
+    decoder = LineDecoder(compression)
+    lines = decoder.decode(data) + decoder.flush()
+
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def write_records(path, records):
+    """
+    Writes records to a local JSON-lines file, compressed according
+    to its suffix (see :func:`open_jsonl`).
+
+    :param path: Path of the file.
+    :type path: str
+
+    :param records: The records to write.
+    :type records: list[dict]
+    """
+    with open_jsonl(path, 'wb') as f:
+        for r in records:
+            f.write(json.dumps(r).encode() + b'\n')
+
+
+def read_records(path):
+    """
+    Reads records from a local JSON-lines file, compressed according
+    to its suffix (see :func:`open_jsonl`).
+
+    :param path: Path of the file.
+    :type path: str
+
+    :return: A list of records.
+    :rtype: list[dict]
+    """
+    # Decompression is done by open_jsonl, so lines only need splitting
+    decoder = LineDecoder()
+    records = []
+    with open_jsonl(path, 'rb') as f:
+        while True:
+            chunk = f.read(_READ_CHUNK_SIZE)
+            lines = decoder.decode(chunk) if chunk else decoder.flush()
+            records += [json.loads(line) for line in lines if line.strip()]
+            if not chunk:
+                break
+
+    return records
@@ -0,0 +1,330 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import numpy as np
+
+
+def _import_scipy_signal():
+    # scipy is an optional dependency, only needed for filtering
+
+    try:
+        from scipy import signal
+    except ImportError:
+        raise ImportError(
+            'scipy is required for filtering. '
+            'It can be installed with pip install openeew[signal]'
+            )
+
+    return signal
+
+
+def _repeat(arrays, values):
+    # Repeats per-device values, with shape (..., num_devices),
+    # for each sample of the device
+
+    return np.repeat(values, arrays.counts, axis=-1)
+
+
+def _get_segment_sums(arrays, values):
+    # Sums values, with shape (..., num_samples), over the samples
+    # of each device
+
+    return np.add.reduceat(values, arrays.offsets[:-1], axis=-1)
+
+
+def demean(arrays):
+    """
+    Removes the mean of each device and axis.
+
+    :param arrays: The per-device arrays.
+    :type arrays: openeew.data.arrays.DeviceArrays
+
+    :return: New arrays with demeaned data.
+    :rtype: openeew.data.arrays.DeviceArrays
+    """
+    if not arrays.num_devices:
+        return arrays
+
+    means = _get_segment_sums(arrays, arrays.data) / arrays.counts
+
+    return arrays._replace(data=arrays.data - _repeat(arrays, means))
+
+
+def detrend(arrays):
+    """
+    Removes the least-squares linear trend of each device and axis.
+
+    :param arrays: The per-device arrays.
+    :type arrays: openeew.data.arrays.DeviceArrays
+
+    :return: New arrays with detrended data.
+    :rtype: openeew.data.arrays.DeviceArrays
+    """
+    if not arrays.num_devices:
+        return arrays
+
+    counts = arrays.counts
+    # Sample index within each device, centered on its midpoint so that
+    # the slope and mean can be fitted independently
+    k = np.arange(arrays.offsets[-1]) - \
+        _repeat(arrays, arrays.offsets[:-1] + (counts - 1) / 2)
+
+    means = _get_segment_sums(arrays, arrays.data) / counts
+    k_sq_sums = _get_segment_sums(arrays, k * k)
+    slopes = np.divide(
+        _get_segment_sums(arrays, arrays.data * k),
+        k_sq_sums,
+        out=np.zeros((len(arrays.axes), arrays.num_devices)),
+        where=k_sq_sums > 0
+        )
+
+    return arrays._replace(
+        data=arrays.data - _repeat(arrays, means) - _repeat(arrays, slopes) * k
+        )
+
+
+def _get_baselines(arrays, num_samples):
+    # Returns the mean of the first samples of each device and axis
+
+    starts = arrays.offsets[:-1]
+    baseline_counts = np.minimum(arrays.counts, num_samples)
+    sums = np.zeros((len(arrays.axes), arrays.offsets[-1] + 1))
+    np.cumsum(arrays.data, axis=1, out=sums[:, 1:])
+
+    return (sums[:, starts + baseline_counts] - sums[:, starts]) / \
+        baseline_counts
+
+
+def remove_baseline(arrays, num_samples):
+    """
+    Removes the baseline of each device and axis, given by the mean of
+    its first samples, e.g. before the arrival of an earthquake.
+
+    :param arrays: The per-device arrays.
+    :type arrays: openeew.data.arrays.DeviceArrays
+
+    :param num_samples: The number of samples over which to calculate
+        the baseline.
+    :type num_samples: int
+
+    :return: New arrays with baseline-corrected data.
+    :rtype: openeew.data.arrays.DeviceArrays
+    """
+    if not arrays.num_devices:
+        return arrays
+
+    baselines = _get_baselines(arrays, num_samples)
+
+    return arrays._replace(data=arrays.data - _repeat(arrays, baselines))
+
+
+def apply_gain(arrays, gain):
+    """
+    Multiplies samples by a gain, e.g. to convert them to other units.
+
+    :param arrays: The per-device arrays.
+    :type arrays: openeew.data.arrays.DeviceArrays
+
+    :param gain: The gain of all axes, or a sequence with
+        the gain of each axis.
+    :type gain: Union[float, list[float]]
+
+    :return: New arrays with converted data.
+    :rtype: openeew.data.arrays.DeviceArrays
+    """
+    gain = np.asarray(gain, dtype=float)
+    if gain.ndim:
+        gain = gain.reshape(-1, 1)
+
+    return arrays._replace(data=arrays.data * gain)
+
+
+class Preprocessor(object):
+    """
+    A preprocessing stage that applies baseline correction,
+    gain conversion and a Butterworth filter to per-device arrays.
+    Arrays can be given in consecutive time chunks, e.g. from the
+    partitions of a :class:`openeew.data.df.LazyDataFrame`, as the
+    baseline and filter state of each device are carried across chunks.
+    Results then match those of processing all samples at once, as long
+    as the first chunk of each device has at least baseline_samples
+    samples. Filtering requires scipy.
+    """
+
+    def __init__(self, gain=None, baseline_samples=None, freqmin=None,
+                 freqmax=None, corners=4):
+        """
+        Initialize Preprocessor with the following parameters:
+
+        :param gain: Optional gain of all axes, or of each axis.
+        :type gain: Union[float, list[float]]
+
+        :param baseline_samples: Optional number of first samples of
+            each device from which to calculate its baseline.
+        :type baseline_samples: int
+
+        :param freqmin: Optional corner frequency in Hz of
+            a highpass filter, or lower corner of a bandpass filter.
+        :type freqmin: float
+
+        :param freqmax: Optional corner frequency in Hz of
+            a lowpass filter, or upper corner of a bandpass filter.
+        :type freqmax: float
+
+        :param corners: The order of the filter.
+        :type corners: int
+        """
+        self._gain = gain
+        self._baseline_samples = baseline_samples
+        self._freqmin = freqmin
+        self._freqmax = freqmax
+        self._corners = corners
+        # Filter second-order sections by sample rate
+        self._sos = {}
+        # Baseline and filter state by device ID
+        self._baselines = {}
+        self._zi = {}
+
+    def reset(self):
+        """
+        Forgets the baseline and filter state of all devices.
+        """
+        self._baselines = {}
+        self._zi = {}
+
+    def _get_sos(self, sr):
+        # Returns the second-order sections of the filter for
+        # a sample rate, designing it if needed
+
+        if sr not in self._sos:
+            if self._freqmin is not None and self._freqmax is not None:
+                btype, freq = 'bandpass', [self._freqmin, self._freqmax]
+            elif self._freqmin is not None:
+                btype, freq = 'highpass', self._freqmin
+            else:
+                btype, freq = 'lowpass', self._freqmax
+
+            self._sos[sr] = _import_scipy_signal().butter(
+                self._corners, freq, btype=btype, fs=sr, output='sos')
+
+        return self._sos[sr]
+
+    def _remove_baselines(self, arrays):
+        # Removes the baseline of each device, calculating it from
+        # the first chunk of devices without one
+
+        if any(d not in self._baselines for d in arrays.device_ids):
+            baselines = _get_baselines(arrays, self._baseline_samples)
+            for i, device_id in enumerate(arrays.device_ids):
+                self._baselines.setdefault(device_id, baselines[:, i])
+
+        baselines = np.stack(
+            [self._baselines[device_id] for device_id in arrays.device_ids],
+            axis=1
+            )
+
+        return arrays._replace(data=arrays.data - _repeat(arrays, baselines))
+
+    def _filter(self, arrays):
+        # Filters the samples of each device, continuing from
+        # its filter state at the end of the previous chunk
+
+        signal = _import_scipy_signal()
+        data = np.empty_like(arrays.data)
+        for i, device_id in enumerate(arrays.device_ids):
+            sos = self._get_sos(float(arrays.sr[i]))
+            zi = self._zi.get(device_id)
+            if zi is None:
+                zi = np.zeros((sos.shape[0], len(arrays.axes), 2))
+
+            start, end = arrays.offsets[i], arrays.offsets[i + 1]
+            data[:, start:end], self._zi[device_id] = signal.sosfilt(
+                sos, arrays.data[:, start:end], axis=1, zi=zi)
+
+        return arrays._replace(data=data)
+
+    def process(self, arrays):
+        """
+        Processes the next chunk of arrays.
+
+        :param arrays: The per-device arrays, following any arrays
+            previously processed.
+        :type arrays: openeew.data.arrays.DeviceArrays
+
+        :return: New arrays with processed data.
+        :rtype: openeew.data.arrays.DeviceArrays
+        """
+        if not arrays.num_devices:
+            return arrays
+
+        if self._baseline_samples:
+            arrays = self._remove_baselines(arrays)
+
+        if self._gain is not None:
+            arrays = apply_gain(arrays, self._gain)
+
+        if self._freqmin is not None or self._freqmax is not None:
+            arrays = self._filter(arrays)
+
+        return arrays
+
+
+def preprocess(arrays, detrend_type=None, gain=None, baseline_samples=None,
+               freqmin=None, freqmax=None, corners=4):
+    """
+    Preprocesses all samples of per-device arrays at once, applying
+    in order detrending, baseline correction, gain conversion and
+    filtering. See :class:`Preprocessor` for processing time chunks.
+
+    :param arrays: The per-device arrays, e.g. as returned by
+        :func:`openeew.data.arrays.get_device_arrays`.
+    :type arrays: openeew.data.arrays.DeviceArrays
+
+    :param detrend_type: Optionally 'mean' to remove the mean or
+        'linear' to remove the linear trend of each device and axis.
+    :type detrend_type: str
+
+    :param gain: Optional gain of all axes, or of each axis.
+    :type gain: Union[float, list[float]]
+
+    :param baseline_samples: Optional number of first samples of
+        each device from which to calculate its baseline.
+    :type baseline_samples: int
+
+    :param freqmin: Optional corner frequency in Hz of
+        a highpass filter, or lower corner of a bandpass filter.
+    :type freqmin: float
+
+    :param freqmax: Optional corner frequency in Hz of
+        a lowpass filter, or upper corner of a bandpass filter.
+    :type freqmax: float
+
+    :param corners: The order of the filter.
+    :type corners: int
+
+    :return: New arrays with processed data.
+    :rtype: openeew.data.arrays.DeviceArrays
+    """
+    if detrend_type == 'mean':
+        arrays = demean(arrays)
+    elif detrend_type == 'linear':
+        arrays = detrend(arrays)
+    elif detrend_type is not None:
+        raise ValueError('Unknown detrend type {}'.format(detrend_type))
+
+    return Preprocessor(
+        gain, baseline_samples, freqmin, freqmax, corners).process(arrays)
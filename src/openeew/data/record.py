@@ -84,7 +84,9 @@ def add_sample_t_to_records(records, ref_t_name, ref_axis):
     :type records: list[dict]
 
     :param ref_t_name: The name of the time field to use as a reference when
-        calculating sample times. This should be either cloud_t or device_t.
+        calculating sample times. This should be either cloud_t, device_t
+        or fitted_t, added by
+        :func:`openeew.data.timing.add_fitted_t_to_records`.
     :type ref_t_name: str
 
     :param ref_axis: The axis to use when determining
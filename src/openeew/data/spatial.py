@@ -0,0 +1,245 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+from math import asin, cos, floor, radians, sin, sqrt
+
+# Mean radius of the Earth in km
+EARTH_RADIUS_KM = 6371.0
+# Approximate length of one degree of latitude in km
+_KM_PER_DEG_LAT = 111.195
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Calculates the great-circle distance between two points.
+
+    :param lat1: Latitude of the first point in degrees.
+    :type lat1: float
+
+    :param lon1: Longitude of the first point in degrees.
+    :type lon1: float
+
+    :param lat2: Latitude of the second point in degrees.
+    :type lat2: float
+
+    :param lon2: Longitude of the second point in degrees.
+    :type lon2: float
+
+    :return: The distance in km.
+    :rtype: float
+    """
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + \
+        cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+class DeviceIndex(object):
+    """
+    A spatial index of device metadata, as returned by
+    :func:`openeew.data.aws.AwsDataClient.get_devices_full_history`.
+    Devices are assigned to a grid of latitude/longitude cells so that
+    only nearby cells need to be searched. Since devices can move,
+    each metadata row is only considered during the time it is valid,
+    i.e. from its effective_from until its effective_to.
+    """
+
+    def __init__(self, devices, cell_size=1.0):
+        """
+        Initialize DeviceIndex with the following parameters:
+
+        :param devices: A list of device metadata, each with at least
+            the fields device_id, latitude, longitude, effective_from
+            and effective_to.
+        :type devices: list[dict]
+
+        :param cell_size: The size in degrees of each grid cell,
+            which should divide 360.
+        :type cell_size: float
+        """
+        self._cell_size = cell_size
+        # Device metadata by (latitude, longitude) cell
+        self._cells = {}
+        for d in devices:
+            cell = self._get_cell(d['latitude'], d['longitude'])
+            self._cells.setdefault(cell, []).append(d)
+
+    def _get_cell(self, latitude, longitude):
+        # Returns the grid cell containing a point
+
+        return (
+            int(floor(latitude / self._cell_size)),
+            int(floor(longitude / self._cell_size))
+            )
+
+    def _get_candidates(self, min_latitude, min_longitude,
+                        max_latitude, max_longitude, start_t, end_t):
+        # Returns device metadata within all cells that overlap a box,
+        # valid at some time within [start_t, end_t]. The box crosses
+        # the antimeridian if min_longitude > max_longitude
+
+        min_cell = self._get_cell(min_latitude, min_longitude)
+        max_cell = self._get_cell(max_latitude, max_longitude)
+
+        # Wrap longitude cells around the antimeridian
+        num_lon_cells = int(round(360.0 / self._cell_size))
+        if min_longitude > max_longitude:
+            max_cell = (max_cell[0], max_cell[1] + num_lon_cells)
+        lon_cells = sorted({
+            (j + num_lon_cells // 2) % num_lon_cells - num_lon_cells // 2
+            for j in range(min_cell[1], max_cell[1] + 1)
+            })
+
+        candidates = []
+        for i in range(min_cell[0], max_cell[0] + 1):
+            for j in lon_cells:
+                candidates += [
+                    d for d in self._cells.get((i, j), [])
+                    if (start_t is None or d['effective_to'] >= start_t)
+                    and (end_t is None or d['effective_from'] <= end_t)
+                    ]
+
+        return candidates
+
+    @staticmethod
+    def _get_device_ids(devices):
+        # Returns the unique device IDs of device metadata, in order
+
+        device_ids = []
+        for d in devices:
+            if d['device_id'] not in device_ids:
+                device_ids.append(d['device_id'])
+
+        return device_ids
+
+    def get_devices_within_box(self, min_latitude, min_longitude,
+                               max_latitude, max_longitude,
+                               start_t=None, end_t=None):
+        """
+        Gets device metadata located within a latitude/longitude
+        bounding box. If min_longitude is greater than max_longitude,
+        the box crosses the antimeridian, e.g. from 170 to -170.
+
+        :param min_latitude: The southern edge of the box.
+        :type min_latitude: float
+
+        :param min_longitude: The western edge of the box.
+        :type min_longitude: float
+
+        :param max_latitude: The northern edge of the box.
+        :type max_latitude: float
+
+        :param max_longitude: The eastern edge of the box.
+        :type max_longitude: float
+
+        :param start_t: Optional Unix time. Only metadata valid at
+            or after this time is returned.
+        :type start_t: float
+
+        :param end_t: Optional Unix time. Only metadata valid at
+            or before this time is returned.
+        :type end_t: float
+
+        :return: A list of device metadata.
+        :rtype: list[dict]
+        """
+        if min_latitude > max_latitude:
+            raise ValueError(
+                'min_latitude should not be greater than max_latitude')
+
+        if min_longitude <= max_longitude:
+            def is_within_longitudes(longitude):
+                return min_longitude <= longitude <= max_longitude
+        else:
+            def is_within_longitudes(longitude):
+                return longitude >= min_longitude or \
+                    longitude <= max_longitude
+
+        return [
+            d for d in self._get_candidates(
+                min_latitude, min_longitude, max_latitude, max_longitude,
+                start_t, end_t)
+            if min_latitude <= d['latitude'] <= max_latitude
+            and is_within_longitudes(d['longitude'])
+            ]
+
+    def get_devices_within_radius(self, latitude, longitude, radius_km,
+                                  start_t=None, end_t=None):
+        """
+        Gets device metadata located within a distance of a point,
+        e.g. an epicenter.
+
+        :param latitude: Latitude of the point in degrees.
+        :type latitude: float
+
+        :param longitude: Longitude of the point in degrees.
+        :type longitude: float
+
+        :param radius_km: The max distance from the point in km.
+        :type radius_km: float
+
+        :param start_t: Optional Unix time. Only metadata valid at
+            or after this time is returned.
+        :type start_t: float
+
+        :param end_t: Optional Unix time. Only metadata valid at
+            or before this time is returned.
+        :type end_t: float
+
+        :return: A list of device metadata, each with an additional
+            distance_km field, sorted by distance.
+        :rtype: list[dict]
+        """
+        # Bounding box of the circle, widening the longitude range
+        # as meridians converge away from the equator
+        dlat = radius_km / _KM_PER_DEG_LAT
+        cos_lat = cos(radians(min(abs(latitude) + dlat, 90.0)))
+        dlon = 180.0 if cos_lat < 1e-6 else \
+            min(radius_km / (_KM_PER_DEG_LAT * cos_lat), 180.0)
+
+        devices = []
+        for d in self._get_candidates(
+                latitude - dlat, longitude - dlon,
+                latitude + dlat, longitude + dlon,
+                start_t, end_t):
+            distance_km = haversine_km(
+                latitude, longitude, d['latitude'], d['longitude'])
+            if distance_km <= radius_km:
+                devices.append({**d, 'distance_km': distance_km})
+
+        return sorted(devices, key=lambda d: d['distance_km'])
+
+    def get_device_ids_within_box(self, *args, **kwargs):
+        """
+        Same as :func:`get_devices_within_box`, but returns
+        a list of unique device IDs.
+
+        :rtype: list[str]
+        """
+        return self._get_device_ids(
+            self.get_devices_within_box(*args, **kwargs))
+
+    def get_device_ids_within_radius(self, *args, **kwargs):
+        """
+        Same as :func:`get_devices_within_radius`, but returns
+        a list of unique device IDs, sorted by distance.
+
+        :rtype: list[str]
+        """
+        return self._get_device_ids(
+            self.get_devices_within_radius(*args, **kwargs))
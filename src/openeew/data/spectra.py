@@ -0,0 +1,196 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+from collections import namedtuple
+import numpy as np
+from .arrays import DeviceArrays, get_device_arrays
+
+# Fourier amplitude spectra of devices, with frequencies of shape
+# (num_devices, num_freqs) and amplitudes of shape
+# (num_devices, num_axes, num_freqs)
+FourierSpectra = namedtuple(
+    'FourierSpectra', ['device_ids', 'axes', 'freqs', 'amplitudes'])
+# Pseudo-spectral accelerations of devices, with shape
+# (num_devices, num_axes, num_periods)
+ResponseSpectra = namedtuple(
+    'ResponseSpectra', ['device_ids', 'axes', 'periods', 'psa'])
+
+
+def _get_arrays(data, axes):
+    # Returns per-device arrays from either arrays or a DataFrame
+
+    if isinstance(data, DeviceArrays):
+        return data
+
+    return get_device_arrays(data, axes)
+
+
+def _get_nfft(num_samples):
+    # Returns the smallest power of two of at least num_samples
+
+    return 1 << max(int(num_samples) - 1, 0).bit_length()
+
+
+def _get_padded(arrays, idx, nfft, taper):
+    # Returns the samples of devices idx, tapered at both ends and
+    # zero-padded to nfft, with shape (len(idx), num_axes, nfft)
+
+    starts = arrays.offsets[idx]
+    counts = arrays.offsets[idx + 1] - starts
+    device_idx = np.repeat(np.arange(len(idx)), counts)
+    # Index of each sample within its device
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    sample_idx = np.repeat(starts, counts) + k
+
+    values = arrays.data[:, sample_idx]
+    if taper:
+        # Cosine taper over a fraction of each end, i.e. a Tukey window
+        n = np.repeat(counts, counts)
+        m = np.repeat(np.floor(taper * counts / 2), counts)
+        edge = np.minimum(k, n - 1 - k)
+        values = values * np.where(
+            edge < m,
+            0.5 * (1 - np.cos(np.pi * edge / np.maximum(m, 1))),
+            1.0
+            )
+
+    padded = np.zeros((len(idx), len(arrays.axes), nfft))
+    padded[device_idx, :, k] = values.T
+
+    return padded
+
+
+def get_fourier_spectra(data, axes=('x', 'y', 'z'), taper=0.05, nfft=None,
+                        batch_size=64):
+    """
+    Calculates the Fourier amplitude spectra of all devices and axes
+    with batched FFTs. Records of different lengths are zero-padded
+    to the same number of points, so that devices with different
+    sample rates have different frequencies.
+
+    :param data: The samples, either as per-device arrays or as
+        a DataFrame returned by :func:`openeew.data.df.get_df_from_records`.
+    :type data: Union[openeew.data.arrays.DeviceArrays, pandas.DataFrame]
+
+    :param axes: The axes to use if data is a DataFrame.
+    :type axes: tuple[str]
+
+    :param taper: The fraction of each record tapered by
+        a cosine window, split between both ends.
+    :type taper: float
+
+    :param nfft: The number of FFT points. If no value is given,
+        the smallest power of two fitting the longest record is used.
+    :type nfft: int
+
+    :param batch_size: The number of devices whose FFTs are held in
+        memory at once.
+    :type batch_size: int
+
+    :return: The spectra, with amplitudes in units of the samples
+        multiplied by seconds.
+    :rtype: FourierSpectra
+    """
+    arrays = _get_arrays(data, axes)
+    nfft = nfft or _get_nfft(arrays.counts.max(initial=1))
+    if nfft < arrays.counts.max(initial=0):
+        raise ValueError('nfft should be at least the longest record')
+
+    dt = 1 / arrays.sr
+    amplitudes = np.zeros(
+        (arrays.num_devices, len(arrays.axes), nfft // 2 + 1))
+    for start in range(0, arrays.num_devices, batch_size):
+        idx = np.arange(start, min(start + batch_size, arrays.num_devices))
+        padded = _get_padded(arrays, idx, nfft, taper)
+        amplitudes[idx] = np.abs(np.fft.rfft(padded)) * \
+            dt[idx, np.newaxis, np.newaxis]
+
+    return FourierSpectra(
+        device_ids=arrays.device_ids,
+        axes=arrays.axes,
+        freqs=np.fft.rfftfreq(nfft)[np.newaxis, :] / dt[:, np.newaxis],
+        amplitudes=amplitudes
+        )
+
+
+def get_response_spectra(data, periods, damping=0.05, axes=('x', 'y', 'z'),
+                         batch_size=64):
+    """
+    Calculates the pseudo-spectral acceleration (PSA) of all devices
+    and axes, i.e. the peak response of damped single-degree-of-freedom
+    oscillators to the samples as ground acceleration, multiplied by
+    the square of their natural angular frequency. Responses are
+    calculated in the frequency domain with batched FFTs, padding each
+    record with enough zeros for the oscillators to come to rest.
+
+    :param data: The samples, either as per-device arrays or as
+        a DataFrame returned by :func:`openeew.data.df.get_df_from_records`.
+    :type data: Union[openeew.data.arrays.DeviceArrays, pandas.DataFrame]
+
+    :param periods: The natural periods of the oscillators in seconds.
+    :type periods: list[float]
+
+    :param damping: The damping ratio of the oscillators.
+    :type damping: float
+
+    :param axes: The axes to use if data is a DataFrame.
+    :type axes: tuple[str]
+
+    :param batch_size: The number of devices whose FFTs are held in
+        memory at once.
+    :type batch_size: int
+
+    :return: The spectra, with PSA in units of the samples.
+    :rtype: ResponseSpectra
+    """
+    arrays = _get_arrays(data, axes)
+    periods = np.asarray(periods, dtype=float)
+    if (periods <= 0).any():
+        raise ValueError('periods should be positive')
+    if not 0 < damping < 1:
+        raise ValueError('damping should be between 0 and 1')
+
+    omegas = 2 * np.pi / periods
+    # Time for the free vibration of the slowest oscillator
+    # to decay by a factor of 1000
+    decay_t = np.log(1000) / (damping * omegas.min()) if len(periods) else 0
+
+    psa = np.zeros((arrays.num_devices, len(arrays.axes), len(periods)))
+    for start in range(0, arrays.num_devices, batch_size):
+        idx = np.arange(start, min(start + batch_size, arrays.num_devices))
+        counts = arrays.counts[idx]
+        sr = arrays.sr[idx]
+        nfft = _get_nfft((counts + np.ceil(decay_t * sr)).max())
+
+        spectra = np.fft.rfft(_get_padded(arrays, idx, nfft, 0))
+        # Angular frequency of each FFT point of each device
+        w = 2 * np.pi * np.fft.rfftfreq(nfft)[np.newaxis, :] * \
+            sr[:, np.newaxis]
+
+        for j, wn in enumerate(omegas):
+            # Transfer function from ground acceleration
+            # to relative displacement
+            h = -1 / (wn ** 2 - w ** 2 + 2j * damping * wn * w)
+            u = np.fft.irfft(spectra * h[:, np.newaxis, :], nfft)
+            psa[idx, :, j] = wn ** 2 * np.abs(u).max(axis=-1)
+
+    return ResponseSpectra(
+        device_ids=arrays.device_ids,
+        axes=arrays.axes,
+        periods=periods,
+        psa=psa
+        )
@@ -0,0 +1,412 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import aioboto3
+import io
+import mmap
+import os
+import tempfile
+import time
+from collections import namedtuple
+from botocore.exceptions import ClientError as botocoreClientError
+
+# Response to a GET of an object, where body has an async read method,
+# size is the size of the whole object (if known), and etag identifies
+# the version of the object
+ObjectResponse = namedtuple(
+    'ObjectResponse', ['body', 'size', 'etag', 'content_encoding'])
+
+
+class ObjectChangedError(Exception):
+    """
+    Raised when an object no longer matches the requested ETag.
+    """
+
+
+class InvalidRangeError(Exception):
+    """
+    Raised when a requested byte range starts beyond the end
+    of an object.
+    """
+
+
+class Storage(object):
+    """
+    A store of objects organized by key, in the layout of
+    the OpenEEW dataset. Subclasses implement listing of keys, which
+    is synchronous, and GETs of objects or byte ranges of objects,
+    which are asynchronous and made through a connection.
+    """
+
+    def list_keys(self, prefix, start_after=None):
+        """
+        Lists keys starting with a prefix, in key order.
+
+        :param prefix: The prefix of keys.
+        :type prefix: str
+
+        :param start_after: Optional key after which to start listing.
+        :type start_after: str
+
+        :rtype: list[str]
+        """
+        raise NotImplementedError
+
+    def list_prefixes(self, prefix):
+        """
+        Lists the distinct prefixes of keys starting with a prefix,
+        up to and including the next /.
+
+        :param prefix: The prefix of keys, ending with /.
+        :type prefix: str
+
+        :rtype: list[str]
+        """
+        raise NotImplementedError
+
+    def get_bytes(self, key):
+        """
+        Gets a whole object. Raises KeyError if it does not exist.
+
+        :param key: The key of the object.
+        :type key: str
+
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def put_bytes(self, key, data):
+        """
+        Puts a whole object, replacing any existing object.
+
+        :param key: The key of the object.
+        :type key: str
+
+        :param data: The content of the object.
+        :type data: bytes
+        """
+        raise NotImplementedError
+
+    def connect(self):
+        """
+        Returns an async context manager giving a connection, with
+        an async method get_object(key, start=None, end=None, etag=None)
+        returning an ObjectResponse. If start and end are given, only
+        the bytes in [start, end) are returned. If etag is given,
+        ObjectChangedError is raised unless the object matches it.
+        """
+        raise NotImplementedError
+
+
+class _S3Connection(object):
+    """
+    A connection to an S3 bucket through an async S3 client.
+    """
+
+    def __init__(self, async_s3_client, bucket):
+        self._async_s3_client = async_s3_client
+        self._bucket = bucket
+
+    async def get_object(self, key, start=None, end=None, etag=None):
+        kwargs = {}
+        if start is not None:
+            kwargs['Range'] = 'bytes={}-{}'.format(start, end - 1)
+        if etag:
+            kwargs['IfMatch'] = etag
+
+        try:
+            response = await self._async_s3_client.get_object(
+                Bucket=self._bucket,
+                Key=key,
+                **kwargs
+                )
+        except botocoreClientError as e:
+            code = e.response['Error']['Code']
+            if code == 'PreconditionFailed':
+                raise ObjectChangedError(key)
+            elif code == 'InvalidRange':
+                raise InvalidRangeError(key)
+            raise
+
+        if 'ContentRange' in response:
+            # ContentRange has the format bytes start-end/size
+            size = int(response['ContentRange'].split('/')[-1])
+        else:
+            size = response.get('ContentLength')
+
+        return ObjectResponse(
+            body=response['Body'],
+            size=size,
+            etag=response.get('ETag'),
+            content_encoding=response.get('ContentEncoding')
+            )
+
+
+class _S3ConnectionContext(object):
+    """
+    An async context manager opening an async S3 client with
+    the same region and config as a (non-async) S3 client.
+    """
+
+    def __init__(self, s3_client, bucket):
+        self._s3_client = s3_client
+        self._bucket = bucket
+        self._client_context = None
+
+    async def __aenter__(self):
+        session = aioboto3.Session()
+        self._client_context = session.client(
+            's3',
+            region_name=self._s3_client.meta.region_name,
+            config=self._s3_client.meta.config
+            )
+        async_s3_client = await self._client_context.__aenter__()
+
+        return _S3Connection(async_s3_client, self._bucket)
+
+    async def __aexit__(self, *exc_info):
+        return await self._client_context.__aexit__(*exc_info)
+
+
+class S3Storage(Storage):
+    """
+    Storage in an S3 bucket.
+    """
+
+    def __init__(self, s3_client, bucket):
+        """
+        Initialize S3Storage with the following parameters:
+
+        :param s3_client: The S3 client used for listing. GETs are made
+            by an async S3 client with the same region and config.
+        :type s3_client: boto3.client.s3
+
+        :param bucket: The name of the bucket.
+        :type bucket: str
+        """
+        self._s3_client = s3_client
+        self._bucket = bucket
+
+    def list_keys(self, prefix, start_after=None):
+        paginator = self._s3_client.get_paginator('list_objects_v2')
+        kwargs = {'StartAfter': start_after} if start_after else {}
+        pages = paginator.paginate(
+                    Bucket=self._bucket,
+                    Prefix=prefix,
+                    **kwargs
+                    )
+
+        return [o['Key'] for p in pages for o in p.get('Contents', [])]
+
+    def list_prefixes(self, prefix):
+        paginator = self._s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+                Bucket=self._bucket,
+                Prefix=prefix,
+                Delimiter='/'
+                )
+
+        return [p.get('Prefix') for p in pages.search('CommonPrefixes')]
+
+    def get_bytes(self, key):
+        bytes_stream = io.BytesIO()
+        try:
+            self._s3_client.download_fileobj(self._bucket, key, bytes_stream)
+        except botocoreClientError as e:
+            if e.response['Error']['Code'] == '404':
+                raise KeyError(key)
+            raise
+
+        return bytes_stream.getvalue()
+
+    def put_bytes(self, key, data):
+        self._s3_client.put_object(Bucket=self._bucket, Key=key, Body=data)
+
+    def connect(self):
+        return _S3ConnectionContext(self._s3_client, self._bucket)
+
+
+class _MmapBody(object):
+    """
+    The body of a GET from a local file, read from a memory map.
+    """
+
+    def __init__(self, data, start, end):
+        self._data = data
+        self._pos = start
+        self._end = end
+
+    async def read(self, amt=None):
+        end = self._end if amt is None else min(self._pos + amt, self._end)
+        chunk = self._data[self._pos:end]
+        self._pos = end
+
+        return chunk
+
+
+class _LocalConnectionContext(object):
+    """
+    An async context manager giving a local storage as its own
+    connection, as no connection needs to be opened.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    async def __aenter__(self):
+        return self._storage
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class LocalStorage(Storage):
+    """
+    Storage in a local directory, e.g. a mirror of the OpenEEW bucket,
+    where each key is the path of a file relative to the directory.
+    Listings come from directory scans, which are cached for each
+    directory until it is modified. Files are read through memory maps.
+    """
+
+    # Number of seconds after its last modification during which
+    # a directory is always scanned again, as further modifications
+    # within the resolution of its modification time go unnoticed
+    _RECENT_MTIME_INTERVAL = 2.0
+
+    def __init__(self, root):
+        """
+        Initialize LocalStorage with the following parameters:
+
+        :param root: The directory holding the objects.
+        :type root: str
+        """
+        self._root = root
+        # Subdirectory and file names of each scanned directory,
+        # by relative path, along with its modification time
+        self._scans = {}
+
+    def _get_path(self, key):
+        # Returns the path of the file of a key
+
+        return os.path.join(self._root, *key.split('/'))
+
+    def _scan(self, dir_key):
+        # Returns the sorted subdirectory and file names of a directory,
+        # given by its key prefix, rescanning it only if it has changed
+
+        path = self._get_path(dir_key)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return [], []
+
+        scan = self._scans.get(dir_key)
+        if scan is None or scan[0] != mtime:
+            dirs, files = [], []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    (dirs if entry.is_dir() else files).append(entry.name)
+            scan = (mtime, sorted(dirs), sorted(files))
+            if time.time() - mtime / 1e9 > self._RECENT_MTIME_INTERVAL:
+                self._scans[dir_key] = scan
+
+        return scan[1], scan[2]
+
+    def _walk(self, dir_key, name_prefix):
+        # Yields the keys within a directory, given by its key prefix,
+        # whose names start with name_prefix
+
+        dirs, files = self._scan(dir_key)
+        for name in files:
+            if name.startswith(name_prefix):
+                yield dir_key + name
+        for name in dirs:
+            if name.startswith(name_prefix):
+                yield from self._walk(dir_key + name + '/', '')
+
+    def list_keys(self, prefix, start_after=None):
+        dir_key, _, name_prefix = prefix.rpartition('/')
+        dir_key = dir_key + '/' if dir_key else ''
+        keys = sorted(self._walk(dir_key, name_prefix))
+
+        if start_after:
+            keys = [k for k in keys if k > start_after]
+
+        return keys
+
+    def list_prefixes(self, prefix):
+        dirs, _ = self._scan(prefix)
+
+        return [prefix + name + '/' for name in dirs]
+
+    def get_bytes(self, key):
+        try:
+            with open(self._get_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def put_bytes(self, key, data):
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file outside of any listed directory
+        # first, so that the file is never listed before it is complete
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self._root)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def connect(self):
+        return _LocalConnectionContext(self)
+
+    async def get_object(self, key, start=None, end=None, etag=None):
+        """
+        Gets an object, or the bytes in [start, end) of it, from
+        a memory map of its file. See :func:`Storage.connect`.
+        """
+        try:
+            f = open(self._get_path(key), 'rb')
+        except FileNotFoundError:
+            raise KeyError(key)
+
+        with f:
+            stat = os.fstat(f.fileno())
+            # The size and modification time identify the file version
+            file_etag = '"{:x}-{:x}"'.format(stat.st_size, stat.st_mtime_ns)
+            if etag and etag != file_etag:
+                raise ObjectChangedError(key)
+
+            if start is None:
+                start, end = 0, stat.st_size
+            elif start >= stat.st_size:
+                raise InvalidRangeError(key)
+
+            # Empty files cannot be memory-mapped
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                if stat.st_size else b''
+
+        return ObjectResponse(
+            body=_MmapBody(data, start, min(end, stat.st_size)),
+            size=stat.st_size,
+            etag=file_etag,
+            content_encoding=None
+            )
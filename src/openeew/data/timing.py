@@ -0,0 +1,260 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import numpy as np
+
+# Length of the epochs into which device times are split, in windows.
+# Sums over windows are taken within an epoch, relative to its start,
+# so that they stay accurate however long the time range is
+_EPOCH_WINDOWS = 32
+# Number of records over which cumulative sums are taken at once.
+# Groups of records are batched up to this size, so that memory
+# stays proportional to the number of records however uneven groups
+# are, while sums still only accumulate over a bounded number of them
+_BATCH_SIZE = 1 << 16
+# Tuning constant of Tukey's bisquare weights, in robust standard
+# deviations of residuals
+_BISQUARE_TUNING = 4.685
+# Min robust standard deviation of residuals in seconds
+_MIN_SCALE = 1e-6
+
+
+def _get_group_medians(codes, values, num_groups):
+    # Returns the median of values within each group
+
+    # Sort by value, then stably by group, which is faster than lexsort
+    order = np.argsort(values)
+    order = order[np.argsort(codes[order], kind='stable')]
+    counts = np.bincount(codes, minlength=num_groups)
+    starts = np.cumsum(counts) - counts
+    sorted_values = values[order]
+    lo = starts + (counts - 1) // 2
+    hi = starts + counts // 2
+
+    return np.where(
+        counts > 0,
+        (sorted_values[np.minimum(lo, len(values) - 1)] +
+         sorted_values[np.minimum(hi, len(values) - 1)]) / 2,
+        0.0
+        )
+
+
+def fit_clock_offsets(device_ids, device_t, cloud_t, window=600.0,
+                      num_iterations=3):
+    """
+    Fits the offset cloud_t - device_t between the cloud and device
+    clocks of each device, which drifts over time. At each record,
+    a line is fitted to the offsets of the device's records within
+    a sliding window of device time centered on it, by iteratively
+    reweighted least squares with Tukey's bisquare weights. This
+    removes network jitter in cloud_t while following clock drift.
+    All devices and records are fitted at once with vectorized
+    windowed sums.
+
+    :param device_ids: The device ID of each record.
+    :type device_ids: list[str]
+
+    :param device_t: The device_t of each record.
+    :type device_t: list[float]
+
+    :param cloud_t: The cloud_t of each record.
+    :type cloud_t: list[float]
+
+    :param window: The length of the sliding window in seconds.
+    :type window: float
+
+    :param num_iterations: The number of reweighting iterations. If 0,
+        the fit is an ordinary least squares fit.
+    :type num_iterations: int
+
+    :return: The fitted offset at each record.
+    :rtype: numpy.ndarray
+    """
+    device_t = np.asarray(device_t, dtype=float)
+    offsets = np.asarray(cloud_t, dtype=float) - device_t
+    num_records = len(device_t)
+    if not num_records:
+        return np.empty(0)
+
+    _, codes = np.unique(np.asarray(device_ids), return_inverse=True)
+    codes = codes.reshape(-1)
+    num_devices = codes.max() + 1
+
+    # Split device times into epochs, copying records within half
+    # a window of an epoch boundary into the neighbouring epoch, so
+    # that every window lies within a single epoch
+    half = window / 2
+    epoch_len = _EPOCH_WINDOWS * window
+    epochs = np.floor(device_t / epoch_len)
+    x = device_t - epochs * epoch_len
+    is_prev = x < half
+    is_next = x >= epoch_len - half
+
+    idx = np.concatenate([
+        np.arange(num_records), np.flatnonzero(is_prev),
+        np.flatnonzero(is_next)
+        ])
+    epochs = np.concatenate([epochs, epochs[is_prev] - 1, epochs[is_next] + 1])
+    x = np.concatenate([x, x[is_prev] + epoch_len, x[is_next] - epoch_len])
+    is_primary = np.arange(len(idx)) < num_records
+
+    order = np.lexsort((x, epochs, codes[idx]))
+    idx, epochs, x, is_primary = \
+        idx[order], epochs[order], x[order], is_primary[order]
+    y = offsets[idx]
+
+    # Group records by device and epoch
+    is_new_group = np.ones(len(idx), dtype=bool)
+    is_new_group[1:] = (codes[idx][1:] != codes[idx][:-1]) | \
+        (epochs[1:] != epochs[:-1])
+    groups = np.cumsum(is_new_group) - 1
+    group_starts = np.flatnonzero(is_new_group)
+
+    # Window bounds, found by shifting each group so that they do
+    # not overlap
+    shifted_x = x + groups * (epoch_len + 2 * window)
+    lo = np.searchsorted(shifted_x, shifted_x - half, 'left')
+    hi = np.searchsorted(shifted_x, shifted_x + half, 'right')
+
+    # Batches of whole groups, each starting with the first group
+    # that starts within a new multiple of _BATCH_SIZE records
+    group_batches = group_starts // _BATCH_SIZE
+    is_new_batch = np.ones(len(group_starts), dtype=bool)
+    is_new_batch[1:] = group_batches[1:] != group_batches[:-1]
+    batch_bounds = np.append(group_starts[is_new_batch], len(idx))
+
+    def get_window_sums(values):
+        # Windowed sums are differences of cumulative sums, which
+        # restart for each batch since windows never cross groups
+        window_sums = np.empty(len(values))
+        for start, end in zip(batch_bounds[:-1], batch_bounds[1:]):
+            sums = np.zeros(end - start + 1)
+            np.cumsum(values[start:end], out=sums[1:])
+            window_sums[start:end] = \
+                sums[hi[start:end] - start] - sums[lo[start:end] - start]
+        return window_sums
+
+    weights = np.ones(len(idx))
+    fitted = np.zeros(len(idx))
+    for i in range(num_iterations + 1):
+        w = get_window_sums(weights)
+        wx = get_window_sums(weights * x)
+        wxx = get_window_sums(weights * x * x)
+        wy = get_window_sums(weights * y)
+        wxy = get_window_sums(weights * x * y)
+
+        denom = w * wxx - wx * wx
+        has_slope = denom > 1e-9 * np.maximum(w * wxx, 1e-300)
+        slope = np.divide(
+            w * wxy - wx * wy, denom,
+            out=np.zeros(len(idx)), where=has_slope)
+        # Keep the previous fit where all neighbours were rejected
+        fitted = np.where(
+            w > 0,
+            np.divide(wy - slope * wx, w, out=np.zeros(len(idx)),
+                      where=w > 0) + slope * x,
+            fitted
+            )
+
+        if i == num_iterations:
+            break
+
+        # Weigh each record by its residual relative to the median
+        # absolute residual of its device
+        residuals = np.empty(num_records)
+        residuals[idx[is_primary]] = (y - fitted)[is_primary]
+        scales = np.maximum(
+            1.4826 * _get_group_medians(
+                codes, np.abs(residuals), num_devices),
+            _MIN_SCALE
+            )
+        u = residuals / (_BISQUARE_TUNING * scales[codes])
+        weights = np.where(np.abs(u) < 1, (1 - u * u) ** 2, 0.0)[idx]
+
+    result = np.empty(num_records)
+    result[idx[is_primary]] = fitted[is_primary]
+
+    return result
+
+
+def add_fitted_t_to_records(records, window=600.0, num_iterations=3):
+    """
+    Adds a fitted_t field to each record in a list of records, giving
+    its device_t corrected by the fitted clock offset of its device
+    (see :func:`fit_clock_offsets`). fitted_t can then be used as
+    the reference time when calculating sample times, e.g. with
+    ref_t_name='fitted_t' in :func:`openeew.data.df.get_df_from_records`.
+
+    :param records: The list of records to which to add fitted times.
+    :type records: list[dict]
+
+    :param window: The length of the sliding window in seconds.
+    :type window: float
+
+    :param num_iterations: The number of reweighting iterations.
+    :type num_iterations: int
+
+    :return: A list of records with additional fitted_t field.
+    :rtype: list[dict]
+    """
+    device_t = np.array([r['device_t'] for r in records], dtype=float)
+    fitted_t = device_t + fit_clock_offsets(
+        [r['device_id'] for r in records],
+        device_t,
+        [r['cloud_t'] for r in records],
+        window,
+        num_iterations
+        )
+
+    return [
+        {**r, 'fitted_t': t} for r, t in zip(records, fitted_t.tolist())
+        ]
+
+
+def get_sample_t_array(ref_t, num_samples, sr, decimals=3):
+    """
+    Calculates the Unix time of every sample point of many records
+    at once, in the same way as :func:`openeew.data.record.get_sample_t`,
+    where the reference time corresponds to the final sample point
+    of each record.
+
+    :param ref_t: The reference time of each record.
+    :type ref_t: numpy.ndarray
+
+    :param num_samples: The number of sample points of each record.
+    :type num_samples: numpy.ndarray
+
+    :param sr: The sample rate of each record.
+    :type sr: numpy.ndarray
+
+    :param decimals: The number of decimals to round times to,
+        or None to not round them.
+    :type decimals: int
+
+    :return: The concatenated sample times of all records.
+    :rtype: numpy.ndarray
+    """
+    num_samples = np.asarray(num_samples, dtype=np.int64)
+    total = num_samples.sum()
+    # Number of samples after each sample point within its record
+    remaining = np.repeat(np.cumsum(num_samples), num_samples) - \
+        np.arange(total) - 1
+
+    sample_t = np.repeat(np.asarray(ref_t, dtype=float), num_samples) - \
+        remaining / np.repeat(np.asarray(sr, dtype=float), num_samples)
+
+    return sample_t if decimals is None else np.round(sample_t, decimals)
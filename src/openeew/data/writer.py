@@ -0,0 +1,236 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from .aws import AwsDataClient, DateTimeKeyBuilder
+from .jsonl import decode_records, encode_records, get_compression
+
+# File suffix of each compression of keys
+_COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+class RecordWriter(object):
+    """
+    A writer of accelerometer records to a storage, in the key layout
+    read by :class:`openeew.data.aws.AwsDataClient`, i.e. one key for
+    each device and minute of the records' cloud_t. Records are
+    buffered for each key until records arriving for later minutes show
+    that the key is complete. Complete keys are then written in batches,
+    sorted by cloud_t. Memory is bounded by writing the oldest keys
+    early whenever too many records are buffered, and writing blocks
+    until a batch is written, so that fast producers are held back.
+    Records arriving for a key that has already been written are
+    merged into it.
+    """
+
+    def __init__(self, storage, country_code, lateness=60.0,
+                 max_buffered_records=100000, max_workers=8,
+                 compression=None):
+        """
+        Initialize RecordWriter with the following parameters:
+
+        :param storage: The storage to write keys to, e.g.
+            a LocalStorage or S3Storage.
+        :type storage: openeew.data.storage.Storage
+
+        :param country_code: The ISO 3166 two-letter country code
+            of the records.
+        :type country_code: str
+
+        :param lateness: The number of seconds of cloud_t after the
+            end of a minute to wait for its records before writing it.
+        :type lateness: float
+
+        :param max_buffered_records: The max number of records to
+            buffer before the oldest keys are written early.
+        :type max_buffered_records: int
+
+        :param max_workers: The max number of keys written concurrently.
+        :type max_workers: int
+
+        :param compression: The compression of written keys, either
+            'gzip', 'zstd' or None to not compress them.
+        :type compression: str
+        """
+        if compression not in _COMPRESSION_SUFFIXES:
+            raise ValueError('Unknown compression {}'.format(compression))
+
+        self._storage = storage
+        self._records_key_country_part = \
+            AwsDataClient._RECORDS_KEY_COUNTRY_TEMPLATE.format(
+                country_code.lower())
+        self._key_suffix = AwsDataClient._RECORDS_KEY_SUFFIX + \
+            _COMPRESSION_SUFFIXES[compression]
+        self._dt_builder = DateTimeKeyBuilder(
+            *AwsDataClient._RECORDS_KEY_DATE_TEMPLATE_PARTS)
+        self._lateness = lateness
+        self._max_buffered_records = max_buffered_records
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._lock = threading.Lock()
+
+        # Buffered records by key
+        self._buffers = {}
+        self._num_buffered = 0
+        # Heap of (minute end time, key) of buffered keys
+        self._heap = []
+        # The latest cloud_t written so far
+        self._max_t = None
+        self.num_keys_written = 0
+        self.num_records_written = 0
+
+    def _get_key(self, record):
+        # Returns the key of a record and the end time of its minute
+
+        t = record[AwsDataClient._RECORD_T]
+        minute_t = t - t % 60
+
+        return (
+            self._records_key_country_part +
+            AwsDataClient._RECORDS_KEY_DEVICE_TEMPLATE.format(
+                record['device_id']) +
+            self._dt_builder.get_max_key(
+                datetime.fromtimestamp(minute_t, timezone.utc)) +
+            self._key_suffix,
+            minute_t + 60
+            )
+
+    def _write_key(self, key, records):
+        # Writes the records of a key, merged with any records
+        # it already has
+
+        try:
+            records = decode_records(
+                self._storage.get_bytes(key), get_compression(key)
+                ) + records
+        except KeyError:
+            pass
+
+        records.sort(key=lambda r: r[AwsDataClient._RECORD_T])
+        self._storage.put_bytes(
+            key, encode_records(records, get_compression(key)))
+
+        return len(records)
+
+    def _flush_keys(self, keys):
+        # Writes the buffered records of keys in a batch. Records are
+        # only removed from the buffer once written, so keys whose write
+        # fails are written again by the next flush. The first error is
+        # raised once the whole batch has been attempted
+
+        futures = [
+            (k, self._executor.submit(
+                self._write_key, k, list(self._buffers[k])))
+            for k in keys
+            ]
+
+        error = None
+        for key, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                error = error or e
+                _, end_t = self._get_key(self._buffers[key][0])
+                heapq.heappush(self._heap, (end_t, key))
+                continue
+            records = self._buffers.pop(key)
+            self._num_buffered -= len(records)
+            self.num_keys_written += 1
+            self.num_records_written += len(records)
+
+        if error is not None:
+            raise error
+
+    def _pop_keys(self, end_t=None, num_records=None):
+        # Pops buffered keys from the heap, oldest first, while their
+        # minute ends no later than end_t, or until at least num_records
+        # records have been popped
+
+        keys = []
+        while self._heap:
+            if end_t is not None and self._heap[0][0] > end_t:
+                break
+            if num_records is not None and num_records <= 0:
+                break
+            _, key = heapq.heappop(self._heap)
+            keys.append(key)
+            if num_records is not None:
+                num_records -= len(self._buffers[key])
+
+        return keys
+
+    def write(self, records):
+        """
+        Writes records, which may belong to many devices and minutes.
+        Keys that are complete are written before returning. If writing
+        a key fails, the error is raised and its records stay buffered
+        until the next write, flush or close.
+
+        :param records: The records to write.
+        :type records: list[dict]
+        """
+        with self._lock:
+            for r in records:
+                key, end_t = self._get_key(r)
+                if key not in self._buffers:
+                    self._buffers[key] = []
+                    heapq.heappush(self._heap, (end_t, key))
+                self._buffers[key].append(r)
+                t = r[AwsDataClient._RECORD_T]
+                if self._max_t is None or t > self._max_t:
+                    self._max_t = t
+            self._num_buffered += len(records)
+            if self._max_t is None:
+                return
+
+            keys = self._pop_keys(end_t=self._max_t - self._lateness)
+
+            num_buffered = self._num_buffered - sum(
+                len(self._buffers[k]) for k in keys)
+            if num_buffered > self._max_buffered_records:
+                # Write the oldest keys early, down to half the limit
+                keys += self._pop_keys(num_records=(
+                    num_buffered - self._max_buffered_records // 2))
+
+            if keys:
+                self._flush_keys(keys)
+
+    def flush(self):
+        """
+        Writes all buffered records.
+        """
+        with self._lock:
+            keys = self._pop_keys()
+            if keys:
+                self._flush_keys(keys)
+
+    def close(self):
+        """
+        Writes all buffered records and stops the writer. If writing
+        fails, the error is raised without stopping the writer, so that
+        closing it can be retried.
+        """
+        self.flush()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
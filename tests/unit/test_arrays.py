@@ -0,0 +1,142 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import numpy as np
+import pandas as pd
+import pytest
+from openeew.data.arrays import (
+    get_arrays_from_records,
+    get_device_arrays,
+    get_device_arrays_from_arrays,
+    get_df_from_arrays,
+    get_df_from_device_arrays,
+    get_structured_array
+    )
+from openeew.data.df import get_df_from_records
+
+
+def _get_df():
+    return pd.DataFrame({
+        'device_id': ['002', '001', '002', '001', '001'],
+        'sr': [2.0, 4.0, 2.0, 4.0, 4.0],
+        'sample_t': [1.5, 2.5, 1.0, 2.0, 2.25],
+        'x': [1, 2, 3, 4, 5],
+        'y': [6, 7, 8, 9, 10],
+        'z': [11, 12, 13, 14, 15]
+        })
+
+
+def test_get_device_arrays():
+    # Check that samples are grouped by device in chronological order
+
+    arrays = get_device_arrays(_get_df())
+
+    assert list(arrays.device_ids) == ['001', '002']
+    assert list(arrays.offsets) == [0, 3, 5]
+    assert list(arrays.sr) == [4.0, 2.0]
+    assert list(arrays.sample_t) == [2.0, 2.25, 2.5, 1.0, 1.5]
+    assert arrays.data.tolist() == [
+        [4, 5, 2, 3, 1],
+        [9, 10, 7, 8, 6],
+        [14, 15, 12, 13, 11]
+        ]
+
+    sample_t, data = arrays.get_device('002')
+    assert list(sample_t) == [1.0, 1.5]
+    assert data.tolist() == [[3, 1], [8, 6], [13, 11]]
+
+    with pytest.raises(KeyError):
+        arrays.get_device('003')
+
+
+def test_get_df_from_device_arrays():
+    # Check that arrays convert back to an equivalent DataFrame
+
+    df = _get_df()
+    result = get_df_from_device_arrays(get_device_arrays(df))
+
+    expected = df.sort_values(['device_id', 'sample_t'])
+    np.testing.assert_array_equal(
+        result['device_id'].to_numpy().astype(str),
+        expected['device_id'].to_numpy().astype(str)
+        )
+    for c in ['sr', 'sample_t', 'x', 'y', 'z']:
+        np.testing.assert_array_equal(
+            result[c].to_numpy(), expected[c].to_numpy(dtype=float))
+
+
+def _get_records():
+    return [
+        {'device_id': '002', 'cloud_t': 11.0, 'device_t': 10.0, 'sr': 2.0,
+         'x': [1, 2], 'y': [3, 4], 'z': [5, 6]},
+        {'device_id': '001', 'cloud_t': 21.0, 'device_t': 20.5, 'sr': 4.0,
+         'x': [7, 8, 9], 'y': [0, 0, 0], 'z': [1, 1, 1]},
+        {'device_id': '002', 'cloud_t': 10.0, 'device_t': 9.0, 'sr': 2.0,
+         'x': [10, 11], 'y': [12, 13], 'z': [14, 15]}
+        ]
+
+
+def test_get_arrays_from_records_matches_df():
+    # Check that arrays have the same values and order as
+    # the DataFrame of get_df_from_records
+
+    records = _get_records()
+
+    arrays = get_arrays_from_records(iter(records))
+    df = get_df_from_records(records)
+
+    assert list(arrays['device_ids']) == ['001', '002']
+    assert list(arrays['device_ids'][arrays['device_idx']]) == \
+        list(df['device_id'])
+    for c in ['sample_t', 'x', 'y', 'z', 'sr', 'cloud_t', 'device_t']:
+        np.testing.assert_array_equal(arrays[c], df[c].to_numpy(dtype=float))
+
+
+def test_get_arrays_from_records_empty():
+    with pytest.raises(ValueError):
+        get_arrays_from_records([])
+
+
+def test_get_structured_array():
+    arrays = get_arrays_from_records(_get_records())
+
+    structured = get_structured_array(arrays)
+
+    assert structured.dtype.names == (
+        'device_idx', 'sample_t', 'x', 'y', 'z', 'sr', 'cloud_t', 'device_t')
+    np.testing.assert_array_equal(structured['x'], arrays['x'])
+
+
+def test_get_device_arrays_from_arrays():
+    arrays = get_arrays_from_records(_get_records())
+
+    device_arrays = get_device_arrays_from_arrays(arrays)
+
+    assert list(device_arrays.device_ids) == ['001', '002']
+    assert list(device_arrays.offsets) == [0, 3, 7]
+    assert list(device_arrays.sr) == [4.0, 2.0]
+    np.testing.assert_array_equal(device_arrays.data[0], arrays['x'])
+
+
+def test_get_df_from_arrays_does_not_copy():
+    arrays = get_arrays_from_records(_get_records())
+
+    df = get_df_from_arrays(arrays)
+
+    assert list(df['device_id']) == ['001'] * 3 + ['002'] * 4
+    for c in ['sample_t', 'x', 'y', 'z', 'sr', 'cloud_t', 'device_t']:
+        assert np.shares_memory(df[c].to_numpy(), arrays[c])
@@ -14,8 +14,20 @@
 # limitations under the License.
 # =============================================================================
 
+import gzip
+import io
+import json
 import pytest
-from openeew.data.aws import AwsDataClient
+import threading
+import time
+from datetime import datetime, timezone
+from math import inf
+from openeew.data.aws import AwsDataClient, DateTimeKeyBuilder, KeyPartition
+from openeew.data.event import VelocityModel
+from openeew.data.jsonl import encode_records
+from openeew.data.spatial import DeviceIndex
+from openeew.data.storage import LocalStorage, _S3Connection
+from openeew.data.writer import RecordWriter
 
 
 def test_initialize_country_code_all_caps():
@@ -31,3 +43,492 @@ def test_change_country_code_all_caps():
     data_client.country_code = 'CD'
 
     assert data_client.country_code == 'cd'
+
+
+class _FakeBody(object):
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    async def read(self, amt=None):
+        return self._stream.read(amt)
+
+
+class _FakeAsyncS3Client(object):
+    # Serves GETs of a single object from memory
+
+    def __init__(self, data, content_encoding=None):
+        self._data = data
+        self._content_encoding = content_encoding
+        self.bytes_read = 0
+
+    async def get_object(self, Bucket, Key, Range=None, **kwargs):
+        if Range is None:
+            self.bytes_read += len(self._data)
+            return {
+                'Body': _FakeBody(self._data),
+                'ContentEncoding': self._content_encoding,
+                'ETag': '"abc"'
+                }
+
+        start, end = [int(b) for b in Range[len('bytes='):].split('-')]
+        data = self._data[start:end + 1]
+        self.bytes_read += len(data)
+        return {
+            'Body': _FakeBody(data),
+            'ContentRange': 'bytes {}-{}/{}'.format(
+                start, start + len(data) - 1, len(self._data)),
+            'ContentEncoding': self._content_encoding,
+            'ETag': '"abc"'
+            }
+
+
+@pytest.mark.parametrize('start_t,end_t', [
+    (0.0, 200.0), (10.0, 10.0), (10.5, 20.5), (98.0, 150.0), (150.0, 160.0)
+    ])
+def test_get_records_from_key_range(start_t, end_t):
+
+    records = [{'cloud_t': float(t), 'x': [0] * 200} for t in range(100)]
+    data = b''.join(json.dumps(r).encode() + b'\n' for r in records)
+    async_s3_client = _FakeAsyncS3Client(data)
+
+    data_client = AwsDataClient('ab')
+    result = data_client._run_until_complete(
+        data_client._get_records_from_key_range(
+            _S3Connection(async_s3_client, 'bucket'), 'key', start_t, end_t)
+        )
+
+    assert result == [
+        r for r in records if start_t <= r['cloud_t'] <= end_t
+        ]
+    # Short windows should not require the whole object
+    if end_t - start_t < 20.0:
+        assert async_s3_client.bytes_read < len(data) / 2
+
+
+@pytest.mark.parametrize('key,content_encoding', [
+    ('key.jsonl.gz', None), ('key.jsonl', 'gzip')
+    ])
+def test_get_records_from_key_gzip(key, content_encoding):
+
+    records = [{'cloud_t': float(t), 'x': [t] * 20} for t in range(1000)]
+    data = gzip.compress(
+        b''.join(json.dumps(r).encode() + b'\n' for r in records))
+
+    data_client = AwsDataClient('ab')
+    data_client._STREAM_CHUNK_SIZE = 1000
+    result = data_client._run_until_complete(data_client._get_records_from_key(
+        _S3Connection(_FakeAsyncS3Client(data, content_encoding), 'bucket'),
+        key))
+
+    assert result == records
+
+
+def test_get_records_from_key_range_gzip_content_encoding():
+    # Objects with a compressed Content-Encoding are downloaded in full
+
+    records = [{'cloud_t': float(t), 'x': [t] * 20} for t in range(100)]
+    data = gzip.compress(
+        b''.join(json.dumps(r).encode() + b'\n' for r in records))
+
+    data_client = AwsDataClient('ab')
+    result = data_client._run_until_complete(
+        data_client._get_records_from_key_range(
+            _S3Connection(_FakeAsyncS3Client(data, 'gzip'), 'bucket'),
+            'key.jsonl', 10.0, 20.0)
+        )
+
+    assert result == records
+
+
+class _FakePaginator(object):
+    # Lists keys in key order, supporting Prefix and StartAfter
+
+    def __init__(self, keys):
+        self._keys = sorted(keys)
+
+    def paginate(self, Bucket, Prefix, StartAfter=''):
+        return [{'Contents': [
+            {'Key': k} for k in self._keys
+            if k.startswith(Prefix) and k > StartAfter
+            ]}]
+
+
+class _FakeS3Client(object):
+
+    def __init__(self, keys):
+        self._keys = keys
+        self.num_listings = 0
+
+    def get_paginator(self, name):
+        self.num_listings += 1
+        return _FakePaginator(self._keys)
+
+
+def test_get_new_records_moves_watermarks():
+
+    prefix = 'records/country_code=ab/device_id=001/year=2020/month=01/' \
+        'day=01/hour=00/'
+    keys = [prefix + '{:02d}.jsonl'.format(m) for m in range(3)]
+    s3_client = _FakeS3Client(keys)
+    data_client = AwsDataClient('ab', s3_client)
+
+    downloaded = []
+
+    async def download_keys(keys_to_download, key_ranges=None):
+        downloaded.extend(keys_to_download)
+        return [[{'cloud_t': 1577836800.0 + 60 * int(k[-8:-6])}]
+                for k in keys_to_download]
+
+    data_client._download_keys = download_keys
+
+    watermarks = {}
+    records = data_client.get_new_records(
+        watermarks, '001', '2020-01-01 00:01:00')
+
+    assert records == [{'cloud_t': 1577836860.0}, {'cloud_t': 1577836920.0}]
+    assert watermarks == {'001': keys[2]}
+
+    # Only keys added after the watermark are downloaded
+    keys.append(prefix + '03.jsonl')
+    del downloaded[:]
+    records = data_client.get_new_records(watermarks, '001')
+
+    assert downloaded == [keys[3]]
+    assert records == [{'cloud_t': 1577836980.0}]
+    assert watermarks == {'001': keys[3]}
+
+
+def _put_minute(storage, device_id, minute):
+    # Puts a key holding a record every 10 seconds of a minute
+
+    t0 = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+    records = [
+        {'device_id': device_id, 'cloud_t': t0 + 60 * minute + s}
+        for s in range(0, 60, 10)
+        ]
+    storage.put_bytes(
+        'records/country_code=ab/device_id={}/year=2020/month=01/'
+        'day=01/hour=00/{:02d}.jsonl'.format(device_id, minute),
+        encode_records(records))
+
+    return records
+
+
+def test_follow_records_resumes_from_watermarks(tmp_path):
+    # Check that following picks up keys added between polls, including
+    # those of a new device, and that a restarted process continues
+    # from the persisted watermarks without skipping records
+
+    storage = LocalStorage(str(tmp_path / 'bucket'))
+    watermark_path = str(tmp_path / 'watermarks.json')
+    expected = _put_minute(storage, '000', 0) + _put_minute(storage, '000', 1)
+
+    def follow():
+        return AwsDataClient('ab', storage=storage).follow_records(
+            watermark_path, start_date_utc='2020-01-01 00:00:00',
+            poll_interval=0)
+
+    records = follow()
+    result = [next(records) for _ in range(12)]
+
+    # Device 001 first appears while following
+    new_records = _put_minute(storage, '000', 2) + \
+        _put_minute(storage, '001', 2)
+    expected += new_records
+    result += [next(records) for _ in range(12)]
+
+    # The next poll is interrupted after its first record, so its
+    # watermarks are not saved
+    new_records = _put_minute(storage, '000', 3) + \
+        _put_minute(storage, '001', 3)
+    expected += new_records
+    assert next(records) in new_records
+    records.close()
+
+    with open(watermark_path) as f:
+        assert sorted(json.load(f)) == ['000', '001']
+
+    records = follow()
+    result += [next(records) for _ in range(12)]
+    records.close()
+
+    assert sorted(result, key=lambda r: (r['device_id'], r['cloud_t'])) == \
+        sorted(expected, key=lambda r: (r['device_id'], r['cloud_t']))
+
+
+def test_get_key_partitions():
+
+    keys = [
+        'records/country_code=ab/device_id={}/year=2020/month=01/'
+        'day=01/hour=00/{:02d}.jsonl'.format(d, m)
+        for d in ('001', '002') for m in range(0, 6, 2)
+        ]
+    data_client = AwsDataClient('ab', _FakeS3Client(keys))
+
+    partitions = data_client.get_key_partitions(
+        '2020-01-01 00:01:00', '2020-01-01 00:03:00', ['001', '002'])
+
+    # 2020-01-01 00:00:00 UTC
+    t0 = 1577836800.0
+    assert partitions == [
+        KeyPartition(keys[0], '001', t0 + 60, t0 + 180, t0, t0 + 120),
+        KeyPartition(keys[1], '001', t0 + 60, t0 + 180, t0 + 120, inf),
+        KeyPartition(keys[3], '002', t0 + 60, t0 + 180, t0, t0 + 120),
+        KeyPartition(keys[4], '002', t0 + 60, t0 + 180, t0 + 120, inf)
+        ]
+
+
+@pytest.mark.parametrize('key_part,expected', [
+    ('year=2020/month=01/day=02/hour=03/04.jsonl',
+     datetime(2020, 1, 2, 3, 4, tzinfo=timezone.utc)),
+    ('year=2020/month=12/day=31/hour=23/59.jsonl.gz',
+     datetime(2020, 12, 31, 23, 59, tzinfo=timezone.utc))
+    ])
+def test_get_dt_from_key(key_part, expected):
+
+    dt_builder = DateTimeKeyBuilder(
+        'year={}/', 'month={}/', 'day={}/', 'hour={}/', '{}')
+
+    assert dt_builder.get_dt_from_key(key_part) == expected
+
+
+def test_get_dt_from_key_lower_granularity():
+
+    dt_builder = DateTimeKeyBuilder('year={}/', 'month={}/', 'day={}/')
+
+    assert dt_builder.get_dt_from_key('year=2020/month=01/day=02/') == \
+        datetime(2020, 1, 2, tzinfo=timezone.utc)
+
+
+def test_get_event_records_downloads_all_windows_in_one_batch():
+
+    # Two devices, 0 km and about 111 km from the epicenter
+    prefix = 'records/country_code=ab/device_id={}/year=2020/month=01/' \
+        'day=01/hour=00/{:02d}.jsonl'
+    keys = [prefix.format(d, m) for d in ('000', '001') for m in range(10)]
+    data_client = AwsDataClient('ab', _FakeS3Client(keys))
+    data_client._device_index = DeviceIndex([
+        {'device_id': '000', 'latitude': 0.0, 'longitude': 0.0,
+         'effective_from': 0, 'effective_to': 2e9},
+        {'device_id': '001', 'latitude': 1.0, 'longitude': 0.0,
+         'effective_from': 0, 'effective_to': 2e9}
+        ])
+
+    batches = []
+
+    async def download_keys(keys_to_download, key_ranges=None):
+        batches.append(keys_to_download)
+        return [_get_minute_key_records(k) for k in keys_to_download]
+
+    data_client._download_keys = download_keys
+
+    records = data_client.get_event_records(
+        '2020-01-01 00:02:00', 0.0, 0.0, 200.0,
+        velocity_model=VelocityModel(vp=6.0, vs=3.0), pre_p=5.0, post_s=10.0)
+
+    assert len(batches) == 1
+    t0 = 1577836920.0
+    assert [r['cloud_t'] - t0 for r in records
+            if r['device_id'] == '000'] == list(range(-5, 11))
+    assert [r['cloud_t'] - t0 for r in records
+            if r['device_id'] == '001'] == list(range(14, 48))
+
+
+def test_get_events_records_merges_overlapping_windows():
+    # Windows of nearby earthquakes overlap for each device, but
+    # records should only be returned once
+
+    prefix = 'records/country_code=ab/device_id={}/year=2020/month=01/' \
+        'day=01/hour=00/{:02d}.jsonl'
+    keys = [prefix.format(d, m) for d in ('000', '001') for m in range(10)]
+    data_client = AwsDataClient('ab', _FakeS3Client(keys))
+    data_client._device_index = DeviceIndex([
+        {'device_id': '000', 'latitude': 0.0, 'longitude': 0.0,
+         'effective_from': 0, 'effective_to': 2e9},
+        {'device_id': '001', 'latitude': 1.0, 'longitude': 0.0,
+         'effective_from': 0, 'effective_to': 2e9}
+        ])
+
+    async def download_keys(keys_to_download, key_ranges=None):
+        return [_get_minute_key_records(k) for k in keys_to_download]
+
+    data_client._download_keys = download_keys
+
+    records = data_client.get_events_records(
+        [('2020-01-01 00:02:00', 0.0, 0.0),
+         ('2020-01-01 00:02:10', 0.0, 0.0, 0.0)],
+        200.0, VelocityModel(vp=6.0, vs=3.0), pre_p=5.0, post_s=10.0)
+
+    t0 = 1577836920.0
+    assert [r['cloud_t'] - t0 for r in records
+            if r['device_id'] == '000'] == list(range(-5, 21))
+    assert [r['cloud_t'] - t0 for r in records
+            if r['device_id'] == '001'] == list(range(14, 58))
+
+
+def _get_minute_key_records(key):
+    # Returns one record per second for a minute key of test device 000
+    # or 001, starting at 2020-01-01 00:00:00
+
+    return [
+        {'device_id': key.split('device_id=')[1][:3],
+         'cloud_t': 1577836800.0 + 60 * int(key[-8:-6]) + s}
+        for s in range(60)
+        ]
+
+
+def test_get_filtered_records_batch_downloads_each_key_once():
+
+    prefix = 'records/country_code=ab/device_id={}/year=2020/month=01/' \
+        'day=01/hour=00/{:02d}.jsonl'
+    keys = [prefix.format(d, m) for d in ('000', '001') for m in range(10)]
+    s3_client = _FakeS3Client(keys)
+    data_client = AwsDataClient('ab', s3_client)
+
+    downloaded = []
+
+    async def download_keys(keys_to_download, key_ranges=None):
+        downloaded.extend(keys_to_download)
+        return [_get_minute_key_records(k) for k in keys_to_download]
+
+    data_client._download_keys = download_keys
+
+    window_records = data_client.get_filtered_records_batch([
+        ('2020-01-01 00:01:30', '2020-01-01 00:02:30', '000'),
+        ('2020-01-01 00:02:00', '2020-01-01 00:03:00', ['000', '001']),
+        ('2020-01-01 00:02:59', '2020-01-01 00:03:01', '001')
+        ])
+
+    # Each day prefix of each device is listed once, and each key
+    # is downloaded once
+    assert s3_client.num_listings == 2
+    assert sorted(downloaded) == [
+        keys[1], keys[2], keys[3], keys[12], keys[13]]
+
+    t0 = 1577836800.0
+    assert [(r['device_id'], r['cloud_t'] - t0)
+            for r in window_records[0]] == \
+        [('000', t) for t in range(90, 151)]
+    assert [(r['device_id'], r['cloud_t'] - t0)
+            for r in window_records[1]] == \
+        [(d, t) for d in ('000', '001') for t in range(120, 181)]
+    assert [(r['device_id'], r['cloud_t'] - t0)
+            for r in window_records[2]] == \
+        [('001', t) for t in range(179, 182)]
+
+
+@pytest.mark.parametrize('read_ahead', [0, 2])
+def test_iter_filtered_records_reads_ahead(read_ahead):
+    # Check that chunks do not overlap, and that the next chunks are
+    # requested while the caller is still processing the current one
+
+    t0 = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+    records = [{'cloud_t': t0 + s} for s in range(0, 601, 50)]
+    requested = []
+    lock = threading.Lock()
+    data_client = AwsDataClient('ab')
+
+    def get_key_partitions(start_dt, end_dt, device_ids, listing_cache):
+        with lock:
+            requested.append(start_dt.strftime('%Y-%m-%d %H:%M:%S'))
+        return [(start_dt.timestamp(), end_dt.timestamp())]
+
+    def get_records_from_partitions(partitions):
+        return [[r for r in records if start_t <= r['cloud_t'] <= end_t]
+                for start_t, end_t in partitions]
+
+    data_client._get_key_partitions = get_key_partitions
+    data_client.get_records_from_partitions = get_records_from_partitions
+
+    chunks = data_client.iter_filtered_records(
+        '2020-01-01 00:00:00', '2020-01-01 00:10:00', '000',
+        chunk_seconds=200, read_ahead=read_ahead)
+
+    result = []
+    for i, (chunk_start_utc, chunk_end_utc, chunk_records) in \
+            enumerate(chunks):
+        # Give background threads time to request chunks ahead
+        expected = min(i + 1 + read_ahead, 3)
+        deadline = time.monotonic() + 1.0
+        while len(requested) < expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.01)
+        with lock:
+            assert len(requested) == expected
+        result.append((chunk_start_utc, chunk_end_utc, chunk_records))
+
+    assert [(s, e) for s, e, _ in result] == [
+        ('2020-01-01 00:00:00', '2020-01-01 00:03:20'),
+        ('2020-01-01 00:03:20', '2020-01-01 00:06:40'),
+        ('2020-01-01 00:06:40', '2020-01-01 00:10:00')
+        ]
+    assert [r for _, _, rs in result for r in rs] == records
+
+
+def test_iter_filtered_records_shares_line_indexes(tmp_path):
+    # Check that chunks splitting keys can be read ahead in parallel
+    # while the line indexes of the keys they share are updated and
+    # saved to sidecar files
+
+    t0 = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+    records = [
+        {'device_id': '000', 'cloud_t': t0 + s, 'x': [s]}
+        for s in range(600)
+        ]
+    storage = LocalStorage(str(tmp_path / 'bucket'))
+    with RecordWriter(storage, 'ab') as writer:
+        writer.write(records)
+
+    index_dir = tmp_path / 'index'
+    data_client = AwsDataClient(
+        'ab', storage=storage, index_dir=str(index_dir))
+
+    for _ in range(3):
+        chunks = data_client.iter_filtered_records(
+            '2020-01-01 00:00:00', '2020-01-01 00:09:59', '000',
+            chunk_seconds=20, read_ahead=8)
+        assert [r for _, _, rs in chunks for r in rs] == records
+
+    sidecars = sorted(p.name for p in index_dir.rglob('*') if p.is_file())
+    assert sidecars == [
+        '{:02d}.jsonl.idx.json'.format(m) for m in range(10)]
+
+
+def test_iter_filtered_records_bounds_memory(tmp_path, monkeypatch):
+    # Check that line indexes and listings held in memory stay bounded
+    # however long the date range is, and that each prefix is only
+    # listed once
+
+    t0 = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+    records = [
+        {'device_id': d, 'cloud_t': t0 + s, 'x': [s]}
+        for d in ('000', '001') for s in range(0, 6 * 3600, 30)
+        ]
+    storage = LocalStorage(str(tmp_path / 'bucket'))
+    with RecordWriter(storage, 'ab') as writer:
+        writer.write(sorted(records, key=lambda r: r['cloud_t']))
+
+    listed = []
+    list_keys = storage.list_keys
+
+    def count_list_keys(prefix, start_after=None):
+        listed.append(prefix)
+        return list_keys(prefix, start_after)
+
+    storage.list_keys = count_list_keys
+
+    monkeypatch.setattr(AwsDataClient, '_MAX_LINE_INDEXES', 16)
+    data_client = AwsDataClient(
+        'ab', storage=storage, index_dir=str(tmp_path / 'index'))
+
+    result = []
+    for _, _, chunk_records in data_client.iter_filtered_records(
+            '2020-01-01 00:00:00', '2020-01-01 05:59:59', ['000', '001'],
+            chunk_seconds=150, read_ahead=4):
+        assert len(data_client._line_indexes) <= 16
+        result += chunk_records
+
+    assert sorted(result, key=lambda r: (r['device_id'], r['cloud_t'])) == \
+        records
+    assert sorted(listed) == sorted(set(listed))
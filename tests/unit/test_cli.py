@@ -0,0 +1,147 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import json
+import os
+import numpy as np
+import pytest
+from openeew.cli import export, MANIFEST_NAME
+from openeew.data.aws import KeyPartition
+from openeew.data.jsonl import read_records
+
+
+class _FakeDataClient(object):
+    def __init__(self, keys, fail_after=None):
+        self._keys = keys
+        self._fail_after = fail_after
+        self.downloaded_keys = []
+        self.country_code = 'MX'
+
+    def get_key_partitions(self, start_date_utc, end_date_utc,
+                           device_ids=None):
+        return [
+            KeyPartition(k, k.split('/')[0], 0, 100, 0, 100)
+            for k in self._keys
+            ]
+
+    def get_records_from_partitions(self, partitions):
+        if self._fail_after is not None and \
+                len(self.downloaded_keys) >= self._fail_after:
+            raise RuntimeError('Connection lost')
+
+        self.downloaded_keys += [p.key for p in partitions]
+
+        return [
+            [{'device_id': p.device_id, 'x': [i, i], 'y': [i, i],
+              'z': [i, i], 'sr': 2.0, 'cloud_t': 10.0 + i, 'device_t': i}]
+            for i, p in enumerate(partitions)
+            ]
+
+
+def test_export_resumes_after_failure(tmp_path):
+    # Check that an interrupted export only downloads the
+    # remaining keys when run again
+
+    keys = ['000/00.jsonl', '000/01.jsonl', '001/00.jsonl', '001/01.jsonl',
+            '002/00.jsonl']
+    output_dir = str(tmp_path)
+
+    failing_client = _FakeDataClient(keys, fail_after=2)
+    with pytest.raises(RuntimeError):
+        export(failing_client, '', '', output_dir, batch_size=2,
+               progress=None)
+
+    data_client = _FakeDataClient(keys)
+    num_records = export(
+        data_client, '', '', output_dir, batch_size=2, progress=None)
+
+    assert failing_client.downloaded_keys == keys[:2]
+    assert data_client.downloaded_keys == keys[2:]
+    assert num_records == 3
+
+    with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+        header, *manifest = [json.loads(line) for line in f]
+
+    assert header['export']['country_code'] == 'MX'
+    assert [e['file'] for e in manifest] == \
+        ['part-00000.jsonl', 'part-00001.jsonl', 'part-00002.jsonl']
+    assert [k for e in manifest for k in e['keys']] == keys
+
+    records = [
+        r for e in manifest
+        for r in read_records(os.path.join(output_dir, e['file']))
+        ]
+    assert [r['device_id'] for r in records] == \
+        ['000', '000', '001', '001', '002']
+
+    # Nothing is left to export
+    assert export(data_client, '', '', output_dir, progress=None) == 0
+    assert data_client.downloaded_keys == keys[2:]
+
+
+def test_export_refuses_different_parameters(tmp_path):
+    # Check that an export is not resumed with another date range or
+    # other devices, whose boundary keys would be filtered differently
+
+    keys = ['000/00.jsonl', '001/00.jsonl']
+    output_dir = str(tmp_path)
+    start, end = '2018-02-16 23:39:00', '2018-02-16 23:42:00'
+
+    failing_client = _FakeDataClient(keys, fail_after=1)
+    with pytest.raises(RuntimeError):
+        export(failing_client, start, end, output_dir, ['001', '000'],
+               batch_size=1, progress=None)
+
+    data_client = _FakeDataClient(keys)
+    with pytest.raises(ValueError):
+        export(data_client, start, '2018-02-16 23:45:00', output_dir,
+               ['000', '001'], progress=None)
+    with pytest.raises(ValueError):
+        export(data_client, start, end, output_dir, '000', progress=None)
+    assert data_client.downloaded_keys == []
+
+    # The same parameters resume the export
+    assert export(data_client, start, end, output_dir, ['000', '001'],
+                  progress=None) == 1
+    assert data_client.downloaded_keys == keys[1:]
+
+
+def test_export_numpy(tmp_path):
+    # Check that records are exported as arrays of samples
+
+    data_client = _FakeDataClient(['000/00.jsonl', '001/00.jsonl'])
+    export(data_client, '', '', str(tmp_path), output_format='numpy',
+           compression='gzip', progress=None)
+
+    with np.load(str(tmp_path / 'part-00000.npz')) as arrays:
+        assert list(arrays['device_id']) == ['000', '000', '001', '001']
+        assert list(arrays['x']) == [0, 0, 1, 1]
+
+
+def test_export_numpy_unsupported_compression(tmp_path):
+    # NumPy files can only be compressed with deflate
+
+    with pytest.raises(ValueError):
+        export(_FakeDataClient(['000/00.jsonl']), '', '', str(tmp_path),
+               output_format='numpy', compression='zstd', progress=None)
+    assert not os.path.exists(str(tmp_path / MANIFEST_NAME))
+
+
+def test_export_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export(_FakeDataClient([]), '', '', str(tmp_path),
+               output_format='csv', progress=None)
@@ -16,7 +16,9 @@
 
 import pytest
 import pandas as pd
-from openeew.data.df import get_df_from_records
+from openeew.data.aws import KeyPartition
+from openeew.data.df import get_df_from_records, LazyDataFrame
+from openeew.data.record import add_sample_t_to_records
 
 
 def test_get_df_from_records_all_defaults():
@@ -90,3 +92,105 @@ def test_get_df_from_records_non_default_ref_axis():
             get_df_from_records(records, ref_axis='y'),
             expected
             )
+
+
+def test_get_df_from_records_sample_t_matches_records():
+    # Check that sample times calculated for all records at once match
+    # those added to each record by add_sample_t_to_records
+
+    records = [
+        {'device_id': d, 'x': [0] * n, 'sr': sr, 'cloud_t': t,
+         'device_t': t - 0.25}
+        for d, n, sr, t in [
+            ('002', 32, 31.25, 1577836801.123),
+            ('001', 3, 2.0, 101.0),
+            ('002', 32, 31.25, 1577836800.1),
+            ('001', 125, 125.0, 102.0)
+            ]
+        ]
+
+    expected = pd.concat([
+        pd.DataFrame.from_dict(r)
+        for r in add_sample_t_to_records(records, 'device_t', 'x')
+        ]).sort_values(['device_id', 'sample_t', 'device_t'])
+
+    pd.testing.assert_frame_equal(
+        get_df_from_records(records, 'device_t'), expected)
+
+
+class _FakeDataClient(object):
+    # Serves partitions from records held in memory, by key
+
+    def __init__(self, key_records):
+        self._key_records = key_records
+        self.downloaded = []
+
+    def get_records_from_partitions(self, partitions):
+        self.downloaded += [p.key for p in partitions]
+        return [
+            [r for r in self._key_records[p.key]
+             if p.start_t <= r['cloud_t'] <= p.end_t]
+            for p in partitions
+            ]
+
+
+def _get_lazy_df_test_data():
+    # Two devices, each with two keys of two records, 60 s apart
+
+    key_records = {}
+    partitions = []
+    for d in ('test01', 'test02'):
+        for i, t in enumerate((0.0, 60.0)):
+            key = '{}/{}'.format(d, i)
+            key_records[key] = [{
+                'device_id': d,
+                'x': [1, 2],
+                'sr': 2.0,
+                'cloud_t': t + dt,
+                'device_t': t + dt
+                } for dt in (1.0, 2.0)]
+            partitions.append(
+                KeyPartition(key, d, 0.0, 120.0, t, t + 60.0))
+
+    return _FakeDataClient(key_records), partitions
+
+
+def test_lazy_df_compute():
+
+    data_client, partitions = _get_lazy_df_test_data()
+    records = [r for k in sorted(data_client._key_records)
+               for r in data_client._key_records[k]]
+
+    lazy_df = LazyDataFrame(data_client, partitions)
+
+    assert lazy_df.npartitions == 4
+    assert lazy_df.device_ids == ['test01', 'test02']
+    pd.testing.assert_frame_equal(
+        lazy_df.compute(batch_size=3),
+        get_df_from_records(records)
+        )
+
+
+def test_lazy_df_filters_prune_partitions():
+
+    data_client, partitions = _get_lazy_df_test_data()
+
+    lazy_df = LazyDataFrame(data_client, partitions) \
+        .filter_devices('test02') \
+        .filter_time('1970-01-01 00:01:02', '1970-01-01 00:02:00')
+    df = lazy_df.compute()
+
+    assert data_client.downloaded == ['test02/1']
+    assert list(df['cloud_t'].unique()) == [62.0]
+
+
+def test_lazy_df_map_partitions_and_iter_devices():
+
+    data_client, partitions = _get_lazy_df_test_data()
+
+    lazy_df = LazyDataFrame(data_client, partitions).map_partitions(
+        lambda df: df.groupby('device_id')['x'].sum().to_frame())
+
+    assert [(d, list(df['x'])) for d, df in lazy_df.iter_devices()] == [
+        ('test01', [6, 6]), ('test02', [6, 6])
+        ]
@@ -0,0 +1,84 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import pytest
+from openeew.data.event import (
+    VelocityModel,
+    get_event_windows,
+    merge_event_windows
+    )
+from openeew.data.spatial import DeviceIndex
+
+
+def test_get_travel_times():
+
+    velocity_model = VelocityModel(vp=6.0, vs=3.0)
+
+    assert velocity_model.get_travel_times(30.0, 40.0) == (50 / 6, 50 / 3)
+
+
+def test_velocity_model_non_positive_velocity():
+
+    with pytest.raises(ValueError):
+        VelocityModel(vp=0.0)
+
+
+def test_get_event_windows():
+
+    devices = [
+        {'device_id': '000', 'latitude': 0.0, 'longitude': 0.0,
+         'effective_from': 0, 'effective_to': 2000},
+        # About 111 km north of the epicenter
+        {'device_id': '001', 'latitude': 1.0, 'longitude': 0.0,
+         'effective_from': 0, 'effective_to': 2000},
+        # Out of range
+        {'device_id': '002', 'latitude': 5.0, 'longitude': 0.0,
+         'effective_from': 0, 'effective_to': 2000},
+        # Not valid at the origin time
+        {'device_id': '003', 'latitude': 0.0, 'longitude': 0.0,
+         'effective_from': 0, 'effective_to': 500}
+        ]
+
+    windows = get_event_windows(
+        DeviceIndex(devices), 1000.0, 0.0, 0.0, 200.0,
+        velocity_model=VelocityModel(vp=6.0, vs=3.0), pre_p=5.0, post_s=10.0)
+
+    assert [w['device_id'] for w in windows] == ['000', '001']
+    assert windows[0]['start_t'] == 995.0
+    assert windows[0]['end_t'] == 1010.0
+    distance_km = windows[1]['distance_km']
+    assert distance_km == pytest.approx(111.2, abs=0.1)
+    assert windows[1]['p_t'] == pytest.approx(1000.0 + distance_km / 6.0)
+    assert windows[1]['end_t'] == pytest.approx(
+        1000.0 + distance_km / 3.0 + 10.0)
+
+
+def test_merge_event_windows():
+
+    windows = [
+        {'device_id': '001', 'start_t': 20.0, 'end_t': 40.0},
+        {'device_id': '000', 'start_t': 10.0, 'end_t': 30.0},
+        {'device_id': '001', 'start_t': 0.0, 'end_t': 10.0},
+        {'device_id': '000', 'start_t': 25.0, 'end_t': 50.0, 'p_t': 30.0},
+        {'device_id': '000', 'start_t': 35.0, 'end_t': 45.0}
+        ]
+
+    assert merge_event_windows(windows) == [
+        {'device_id': '000', 'start_t': 10.0, 'end_t': 50.0},
+        {'device_id': '001', 'start_t': 0.0, 'end_t': 10.0},
+        {'device_id': '001', 'start_t': 20.0, 'end_t': 40.0}
+        ]
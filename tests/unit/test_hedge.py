@@ -0,0 +1,166 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import asyncio
+import gc
+import pytest
+import random
+from openeew.data.hedge import LatencyTracker, hedge
+
+
+def _run(coro):
+    # Runs a coroutine on a new event loop, since asyncio.run is not
+    # available before Python 3.7
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_latency_tracker_delay():
+
+    tracker = LatencyTracker(percentile=90, min_samples=5, min_delay=0.5)
+
+    for latency in (1.0, 2.0, 3.0, 4.0):
+        tracker.add(latency)
+    # Not enough samples yet
+    assert tracker.delay is None
+
+    for latency in range(5, 12):
+        tracker.add(float(latency))
+    assert tracker.delay == 10.0
+
+    tracker = LatencyTracker(percentile=50, min_samples=1, min_delay=0.5)
+    tracker.add(0.1)
+    assert tracker.delay == 0.5
+
+
+def _get_coro_factory(delays, results):
+    # Returns a factory whose nth coroutine sleeps for delays[n]
+    # and then returns results[n], or raises it if an exception
+
+    calls = []
+
+    def coro_factory():
+        n = len(calls)
+        calls.append(n)
+
+        async def coro():
+            await asyncio.sleep(delays[n])
+            if isinstance(results[n], Exception):
+                raise results[n]
+            return results[n]
+
+        return coro()
+
+    return coro_factory, calls
+
+
+def _get_tracker(delay):
+    tracker = LatencyTracker(percentile=100, min_samples=1)
+    tracker.add(delay)
+    return tracker
+
+
+def test_hedge_slow_request():
+
+    coro_factory, calls = _get_coro_factory([10.0, 0.01], ['slow', 'fast'])
+    tracker = _get_tracker(0.05)
+
+    assert _run(hedge(coro_factory, tracker)) == 'fast'
+    assert calls == [0, 1]
+    assert tracker.num_hedges == 1
+
+
+def test_hedge_fast_request_not_hedged():
+
+    coro_factory, calls = _get_coro_factory([0.01], ['fast'])
+
+    assert _run(hedge(coro_factory, _get_tracker(1.0))) == 'fast'
+    assert calls == [0]
+
+
+def test_hedge_timeout_retried():
+
+    coro_factory, calls = _get_coro_factory([10.0, 0.01], ['slow', 'fast'])
+
+    assert _run(hedge(coro_factory, timeout=0.05)) == 'fast'
+    assert calls == [0, 1]
+
+
+def test_hedge_timeout_all_requests():
+
+    coro_factory, calls = _get_coro_factory([10.0, 10.0], ['slow', 'slow'])
+
+    with pytest.raises(asyncio.TimeoutError):
+        _run(hedge(coro_factory, timeout=0.05))
+
+
+def test_hedge_error_not_retried():
+
+    coro_factory, calls = _get_coro_factory([0.01], [KeyError('key')])
+
+    with pytest.raises(KeyError):
+        _run(hedge(coro_factory, _get_tracker(1.0), timeout=1.0))
+    assert calls == [0]
+
+
+def test_hedge_error_waits_for_pending_request():
+    # The hedged request fails, but the original one then succeeds
+
+    coro_factory, calls = _get_coro_factory(
+        [0.2, 0.01], ['slow', KeyError('key')])
+
+    assert _run(hedge(coro_factory, _get_tracker(0.05))) == 'slow'
+
+
+def test_hedge_rate_stays_stable():
+    # Check that over repeated rounds of requests, about 100 - percentile
+    # percent of requests keep being hedged, rather than the delay
+    # falling as slow requests lose to their duplicates
+
+    rng = random.Random(0)
+
+    def coro_factory():
+        # 10% of requests are slow
+        if rng.random() < 0.9:
+            return asyncio.sleep(rng.uniform(0.002, 0.01))
+        return asyncio.sleep(rng.uniform(0.02, 0.06))
+
+    async def run_rounds():
+        tracker = LatencyTracker(percentile=95)
+        num_hedges = []
+        for _ in range(8):
+            before = tracker.num_hedges
+            await asyncio.gather(*[
+                hedge(coro_factory, tracker) for _ in range(200)])
+            num_hedges.append(tracker.num_hedges - before)
+        return num_hedges
+
+    # Collect garbage first, since a collection pausing the event loop
+    # during a round would delay every request in it
+    gc.collect()
+    num_hedges = _run(run_rounds())
+
+    assert num_hedges[0] == 0
+    # The hedge rate does not grow as rounds go by
+    assert sorted(num_hedges[-3:])[1] <= 30
+    assert sum(num_hedges) <= 0.1 * 200 * len(num_hedges)
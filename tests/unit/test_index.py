@@ -0,0 +1,72 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+from openeew.data.index import LineOffsetIndex
+
+
+def test_add_span_keeps_spans_sorted_and_unique():
+
+    index = LineOffsetIndex()
+    index.add_span(10, 20, 2.0)
+    index.add_span(0, 10, 1.0)
+    index.add_span(10, 20, 2.0)
+
+    assert index.spans == [[0, 10, 1.0], [10, 20, 2.0]]
+
+
+def test_get_bounds_empty_index():
+
+    index = LineOffsetIndex(size=100)
+
+    assert index.get_bounds(lambda t: t >= 5.0) == (0, 100, None, None)
+
+
+def test_get_bounds_partial_index():
+    # Only the first line and a line in the middle are known
+
+    index = LineOffsetIndex(size=100, spans=[[0, 10, 1.0], [50, 60, 5.0]])
+
+    assert index.get_bounds(lambda t: t >= 3.0) == (10, 50, 1.0, 5.0)
+    assert index.get_bounds(lambda t: t >= 1.0) == (0, 0, None, 1.0)
+    assert index.get_bounds(lambda t: t > 5.0) == (60, 100, 5.0, None)
+
+
+def test_get_bounds_full_index():
+
+    index = LineOffsetIndex(
+        size=30,
+        spans=[[0, 10, 1.0], [10, 20, 2.0], [20, 30, 3.0]]
+        )
+
+    assert index.get_bounds(lambda t: t >= 2.0) == (10, 10, 1.0, 2.0)
+    assert index.get_bounds(lambda t: t > 3.0) == (30, 30, 3.0, None)
+
+
+def test_save_and_load(tmp_path):
+
+    path = str(tmp_path / 'a' / 'b.jsonl.idx.json')
+    index = LineOffsetIndex(size=10, etag='"abc"', spans=[[0, 10, 1.0]])
+    index.save(path)
+
+    loaded = LineOffsetIndex.load(path)
+
+    assert loaded.to_dict() == index.to_dict()
+
+
+def test_load_missing_file(tmp_path):
+
+    assert LineOffsetIndex.load(str(tmp_path / 'missing.idx.json')) is None
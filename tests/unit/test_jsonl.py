@@ -0,0 +1,112 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import gzip
+import json
+import pytest
+from openeew.data.jsonl import LineDecoder, get_compression, \
+    strip_compression_suffix, read_records, write_records
+
+records = [{'device_id': 'test01', 'x': [i, i + 1], 'cloud_t': float(i)}
+           for i in range(100)]
+data = b''.join(json.dumps(r).encode() + b'\n' for r in records)
+
+
+@pytest.mark.parametrize('name,content_encoding,expected', [
+    ('00.jsonl', None, None),
+    ('00.jsonl.gz', None, 'gzip'),
+    ('00.jsonl.zst', None, 'zstd'),
+    ('00.jsonl', 'gzip', 'gzip'),
+    ('00.jsonl', 'identity', None)
+    ])
+def test_get_compression(name, content_encoding, expected):
+
+    assert get_compression(name, content_encoding) == expected
+
+
+def test_strip_compression_suffix():
+
+    assert strip_compression_suffix('00.jsonl.gz') == '00.jsonl'
+    assert strip_compression_suffix('00.jsonl') == '00.jsonl'
+
+
+def _decode_in_chunks(decoder, data, chunk_size):
+    lines = []
+    for i in range(0, len(data), chunk_size):
+        lines += decoder.decode(data[i:i + chunk_size])
+
+    return lines + decoder.flush()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100000])
+def test_line_decoder_uncompressed(chunk_size):
+
+    lines = _decode_in_chunks(LineDecoder(), data, chunk_size)
+
+    assert [json.loads(line) for line in lines] == records
+    assert b''.join(lines) == data
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100000])
+def test_line_decoder_gzip_multiple_members(chunk_size):
+    # Concatenated gzip members form a single valid gzip stream
+
+    compressed = gzip.compress(data[:1000]) + gzip.compress(data[1000:])
+    lines = _decode_in_chunks(LineDecoder('gzip'), compressed, chunk_size)
+
+    assert [json.loads(line) for line in lines] == records
+
+
+def test_line_decoder_zstd():
+
+    zstandard = pytest.importorskip('zstandard')
+    compressed = zstandard.ZstdCompressor().compress(data)
+    lines = _decode_in_chunks(LineDecoder('zstd'), compressed, 10)
+
+    assert [json.loads(line) for line in lines] == records
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100000])
+def test_line_decoder_zstd_multiple_frames(chunk_size):
+    # Concatenated zstd frames form a single valid zstd stream
+
+    zstandard = pytest.importorskip('zstandard')
+    compressor = zstandard.ZstdCompressor()
+    compressed = compressor.compress(data[:1000]) + \
+        compressor.compress(data[1000:])
+    lines = _decode_in_chunks(LineDecoder('zstd'), compressed, chunk_size)
+
+    assert [json.loads(line) for line in lines] == records
+
+
+def test_line_decoder_no_final_newline():
+
+    lines = _decode_in_chunks(LineDecoder(), data[:-1], 10)
+
+    assert [json.loads(line) for line in lines] == records
+
+
+@pytest.mark.parametrize('suffix', ['.jsonl', '.jsonl.gz', '.jsonl.zst'])
+def test_write_and_read_records(tmp_path, suffix):
+
+    if suffix.endswith('.zst'):
+        pytest.importorskip('zstandard')
+
+    path = str(tmp_path / ('records' + suffix))
+    write_records(path, records)
+
+    assert read_records(path) == records
@@ -0,0 +1,135 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import numpy as np
+import pytest
+from openeew.data.arrays import DeviceArrays
+from openeew.data.preprocess import (
+    apply_gain,
+    demean,
+    detrend,
+    preprocess,
+    Preprocessor,
+    remove_baseline
+    )
+
+
+def _get_arrays(data, offsets, sr=100.0):
+    data = np.asarray(data, dtype=float)
+    num_devices = len(offsets) - 1
+
+    return DeviceArrays(
+        device_ids=np.array(['{:03d}'.format(i) for i in range(num_devices)]),
+        offsets=np.asarray(offsets),
+        sr=np.full(num_devices, sr),
+        sample_t=np.arange(data.shape[1]) / sr,
+        data=data,
+        axes=('x', 'y', 'z')[:data.shape[0]]
+        )
+
+
+def _split(arrays, num_samples):
+    # Splits arrays of devices with the same number of samples into
+    # time chunks of num_samples samples
+
+    counts = arrays.counts
+    chunks = []
+    for start in range(0, counts[0], num_samples):
+        idx = np.concatenate([
+            np.arange(o + start, min(o + start + num_samples, o + n))
+            for o, n in zip(arrays.offsets[:-1], counts)
+            ])
+        chunk_counts = [len(range(start, min(start + num_samples, n)))
+                        for n in counts]
+        chunks.append(arrays._replace(
+            offsets=np.concatenate([[0], np.cumsum(chunk_counts)]),
+            sample_t=arrays.sample_t[idx],
+            data=arrays.data[:, idx]
+            ))
+
+    return chunks
+
+
+def test_demean():
+    arrays = _get_arrays([[1, 2, 3, 10, 20], [0, 0, 3, 5, 5]], [0, 3, 5])
+
+    result = demean(arrays)
+
+    np.testing.assert_allclose(
+        result.data, [[-1, 0, 1, -5, 5], [-1, -1, 2, 0, 0]])
+
+
+def test_detrend():
+    # Check that the linear trend of each device is removed,
+    # including devices with a single sample
+
+    t = np.arange(6)
+    arrays = _get_arrays(
+        [np.concatenate([3 * t + 1, -2 * t[:3] + 7, [5]])],
+        [0, 6, 9, 10]
+        )
+
+    result = detrend(arrays)
+
+    np.testing.assert_allclose(result.data, np.zeros((1, 10)), atol=1e-12)
+
+
+def test_remove_baseline():
+    arrays = _get_arrays([[1, 3, 10, 20, 4, 6]], [0, 4, 6])
+
+    result = remove_baseline(arrays, 2)
+
+    np.testing.assert_allclose(result.data, [[-1, 1, 8, 18, -1, 1]])
+
+
+def test_apply_gain():
+    arrays = _get_arrays([[1, 2], [3, 4]], [0, 2])
+
+    assert apply_gain(arrays, 0.5).data.tolist() == [[0.5, 1], [1.5, 2]]
+    assert apply_gain(arrays, [1, 10]).data.tolist() == [[1, 2], [30, 40]]
+
+
+def test_preprocess_unknown_detrend_type():
+    with pytest.raises(ValueError):
+        preprocess(_get_arrays([[1, 2]], [0, 2]), detrend_type='quadratic')
+
+
+def test_preprocessor_chunks_match_batch():
+    # Check that processing time chunks gives the same result as
+    # processing all samples at once
+
+    pytest.importorskip('scipy')
+
+    rng = np.random.RandomState(0)
+    arrays = _get_arrays(
+        rng.normal(size=(3, 2000)) + 100, [0, 1000, 2000])
+
+    batch = preprocess(
+        arrays, gain=0.01, baseline_samples=100, freqmin=0.5, freqmax=10)
+
+    preprocessor = Preprocessor(
+        gain=0.01, baseline_samples=100, freqmin=0.5, freqmax=10)
+    chunks = [preprocessor.process(c) for c in _split(arrays, 300)]
+    streamed = np.concatenate([
+        c.data[:, c.offsets[i]:c.offsets[i + 1]]
+        for i in range(2) for c in chunks
+        ], axis=1)
+
+    np.testing.assert_allclose(streamed, batch.data, atol=1e-12)
+
+    # The filter attenuates the noise outside its passband
+    assert np.std(batch.data) < 0.01 * np.std(arrays.data)
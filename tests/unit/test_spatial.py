@@ -0,0 +1,97 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import pytest
+from openeew.data.spatial import DeviceIndex, haversine_km
+
+devices = [
+    # Device 000 moved from Mexico City to Puebla at t=100
+    {'device_id': '000', 'latitude': 19.43, 'longitude': -99.13,
+     'effective_from': 0, 'effective_to': 100},
+    {'device_id': '000', 'latitude': 19.04, 'longitude': -98.21,
+     'effective_from': 100, 'effective_to': 1000},
+    # Device 001 in Oaxaca
+    {'device_id': '001', 'latitude': 17.07, 'longitude': -96.72,
+     'effective_from': 0, 'effective_to': 1000},
+    # Devices 002 and 003 on either side of the antimeridian
+    {'device_id': '002', 'latitude': -16.5, 'longitude': 179.9,
+     'effective_from': 0, 'effective_to': 1000},
+    {'device_id': '003', 'latitude': -16.5, 'longitude': -179.9,
+     'effective_from': 0, 'effective_to': 1000}
+    ]
+
+
+def test_haversine_km():
+
+    # Mexico City to Puebla is about 106 km
+    assert haversine_km(19.43, -99.13, 19.04, -98.21) == \
+        pytest.approx(106, abs=1)
+    assert haversine_km(10.0, 20.0, 10.0, 20.0) == 0.0
+
+
+def test_get_device_ids_within_box():
+
+    index = DeviceIndex(devices)
+
+    assert sorted(index.get_device_ids_within_box(
+        16.0, -100.0, 20.0, -96.0)) == ['000', '001']
+    assert index.get_device_ids_within_box(18.0, -100.0, 20.0, -98.5) == \
+        ['000']
+    # Device 000 was only in Mexico City before t=100
+    assert index.get_device_ids_within_box(
+        18.0, -100.0, 20.0, -98.5, 200, 300) == []
+
+
+def test_get_device_ids_within_box_across_antimeridian():
+
+    index = DeviceIndex(devices)
+
+    assert sorted(index.get_device_ids_within_box(
+        -17.0, 179.5, -16.0, -179.5)) == ['002', '003']
+    assert index.get_device_ids_within_box(
+        -17.0, 179.95, -16.0, -179.5) == ['003']
+    # A box spanning most longitudes, but not those of Mexico
+    assert sorted(index.get_device_ids_within_box(
+        -17.0, -95.0, 20.0, -100.0)) == ['002', '003']
+
+
+def test_get_devices_within_box_invalid_latitudes():
+
+    index = DeviceIndex(devices)
+
+    with pytest.raises(ValueError):
+        index.get_devices_within_box(20.0, -100.0, 16.0, -96.0)
+
+
+def test_get_devices_within_radius_sorted_by_distance():
+
+    index = DeviceIndex(devices)
+
+    found = index.get_devices_within_radius(19.43, -99.13, 400)
+
+    assert [d['device_id'] for d in found] == ['000', '000', '001']
+    assert found[0]['distance_km'] == 0.0
+    assert index.get_device_ids_within_radius(19.43, -99.13, 400, 200) == \
+        ['000', '001']
+
+
+def test_get_device_ids_within_radius_across_antimeridian():
+
+    index = DeviceIndex(devices)
+
+    assert sorted(index.get_device_ids_within_radius(-16.5, 179.95, 50)) == \
+        ['002', '003']
@@ -0,0 +1,111 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import numpy as np
+import pandas as pd
+import pytest
+from openeew.data.arrays import DeviceArrays
+from openeew.data.spectra import get_fourier_spectra, get_response_spectra
+
+
+def _get_sine_arrays(freq, durations, srs, amplitude=1.0):
+    # Returns arrays of one axis with a sine of each duration
+    # and sample rate
+
+    sample_t = [np.arange(int(d * sr)) / sr for d, sr in zip(durations, srs)]
+    counts = [len(t) for t in sample_t]
+
+    return DeviceArrays(
+        device_ids=np.array(['{:03d}'.format(i) for i in range(len(srs))]),
+        offsets=np.concatenate([[0], np.cumsum(counts)]),
+        sr=np.asarray(srs, dtype=float),
+        sample_t=np.concatenate(sample_t),
+        data=amplitude * np.sin(2 * np.pi * freq * np.concatenate(sample_t))[
+            np.newaxis, :],
+        axes=('x',)
+        )
+
+
+def test_get_fourier_spectra():
+    # Check that the spectrum of each device peaks at the frequency
+    # of its sine, for different lengths and sample rates
+
+    arrays = _get_sine_arrays(5.0, [10, 7], [100, 31.25])
+
+    spectra = get_fourier_spectra(arrays)
+
+    assert spectra.freqs.shape == (2, 513)
+    assert spectra.amplitudes.shape == (2, 1, 513)
+    assert spectra.freqs[0, -1] == 50.0
+    assert spectra.freqs[1, -1] == 15.625
+
+    peak_freqs = spectra.freqs[
+        [0, 1], spectra.amplitudes[:, 0].argmax(axis=1)]
+    np.testing.assert_allclose(peak_freqs, 5.0, atol=0.1)
+
+
+def test_get_fourier_spectra_batched():
+
+    arrays = _get_sine_arrays(5.0, [10, 7, 3, 5, 8], [100, 31.25, 50, 40, 20])
+
+    spectra = get_fourier_spectra(arrays)
+    batched = get_fourier_spectra(arrays, batch_size=2)
+
+    np.testing.assert_array_equal(batched.freqs, spectra.freqs)
+    np.testing.assert_allclose(batched.amplitudes, spectra.amplitudes)
+
+
+def test_get_fourier_spectra_from_df():
+    df = pd.DataFrame({
+        'device_id': ['001'] * 4,
+        'sr': [4.0] * 4,
+        'sample_t': [0.0, 0.25, 0.5, 0.75],
+        'x': [1.0, 1.0, 1.0, 1.0]
+        })
+
+    spectra = get_fourier_spectra(df, axes=('x',), taper=0)
+
+    # The amplitude at 0 Hz is the integral of the samples
+    np.testing.assert_allclose(spectra.amplitudes[0, 0, 0], 1.0)
+
+    with pytest.raises(ValueError):
+        get_fourier_spectra(df, axes=('x',), nfft=2)
+
+
+def test_get_response_spectra():
+    # Check the PSA of oscillators that are stiff, i.e. equal to
+    # the peak ground acceleration, and at resonance, i.e. amplified
+    # by 1 / (2 * damping)
+
+    arrays = _get_sine_arrays(1.0, [60, 50], [100, 40], amplitude=2.0)
+
+    spectra = get_response_spectra(
+        arrays, [0.02, 1.0], damping=0.05, batch_size=1)
+
+    assert spectra.psa.shape == (2, 1, 2)
+    np.testing.assert_allclose(spectra.psa[:, 0, 0], 2.0, rtol=0.01)
+    np.testing.assert_allclose(spectra.psa[:, 0, 1], 20.0, rtol=0.02)
+
+
+def test_get_response_spectra_invalid():
+    arrays = _get_sine_arrays(1.0, [1], [100])
+
+    with pytest.raises(ValueError):
+        get_response_spectra(arrays, [0.0])
+
+    with pytest.raises(ValueError):
+        get_response_spectra(arrays, [1.0], damping=0)
@@ -0,0 +1,137 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import asyncio
+import json
+import os
+import pytest
+from openeew.data.aws import AwsDataClient
+from openeew.data.storage import (
+    InvalidRangeError,
+    LocalStorage,
+    ObjectChangedError
+    )
+
+
+def _run(coro):
+    # Runs a coroutine on a new event loop, since asyncio.run is not
+    # available before Python 3.7
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def _write(root, key, data):
+    path = os.path.join(str(root), *key.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _get_object(storage, *args, **kwargs):
+    async def get_object():
+        async with storage.connect() as connection:
+            response = await connection.get_object(*args, **kwargs)
+            return response, await response.body.read()
+
+    return _run(get_object())
+
+
+def test_list_keys(tmp_path):
+    for key in ['a/b/2.jsonl', 'a/b/1.jsonl', 'a/c/1.jsonl', 'a/cd.jsonl',
+                'b/1.jsonl']:
+        _write(tmp_path, key, b'')
+    storage = LocalStorage(str(tmp_path))
+
+    assert storage.list_keys('a/') == \
+        ['a/b/1.jsonl', 'a/b/2.jsonl', 'a/c/1.jsonl', 'a/cd.jsonl']
+    assert storage.list_keys('a/c') == ['a/c/1.jsonl', 'a/cd.jsonl']
+    assert storage.list_keys('a/b/', 'a/b/1.jsonl') == ['a/b/2.jsonl']
+    assert storage.list_keys('c/') == []
+    assert storage.list_prefixes('a/') == ['a/b/', 'a/c/']
+
+    # Modified directories are scanned again
+    _write(tmp_path, 'a/b/3.jsonl', b'')
+    os.utime(str(tmp_path / 'a' / 'b'), ns=(0, 0))
+
+    assert storage.list_keys('a/b/') == \
+        ['a/b/1.jsonl', 'a/b/2.jsonl', 'a/b/3.jsonl']
+
+
+def test_get_object(tmp_path):
+    _write(tmp_path, 'a/1.jsonl', b'0123456789')
+    _write(tmp_path, 'a/empty.jsonl', b'')
+    storage = LocalStorage(str(tmp_path))
+
+    response, data = _get_object(storage, 'a/1.jsonl')
+    assert data == b'0123456789'
+    assert response.size == 10
+
+    _, data = _get_object(storage, 'a/1.jsonl', 2, 5, etag=response.etag)
+    assert data == b'234'
+
+    with pytest.raises(ObjectChangedError):
+        _get_object(storage, 'a/1.jsonl', 2, 5, etag='"other"')
+
+    with pytest.raises(InvalidRangeError):
+        _get_object(storage, 'a/empty.jsonl', 0, 5)
+
+    with pytest.raises(KeyError):
+        _get_object(storage, 'a/2.jsonl')
+
+    assert storage.get_bytes('a/1.jsonl') == b'0123456789'
+    with pytest.raises(KeyError):
+        storage.get_bytes('a/2.jsonl')
+
+
+def test_get_filtered_records_from_local_mirror(tmp_path):
+    # Check that the client runs the same queries against
+    # a local mirror of the bucket layout
+
+    # 2020-01-01 00:00:00 UTC
+    t0 = 1577836800.0
+    records = [
+        {'device_id': '001', 'cloud_t': t0 + s, 'x': [s]}
+        for s in range(0, 180, 2)
+        ]
+    for m in range(3):
+        _write(
+            tmp_path,
+            'records/country_code=ab/device_id=001/year=2020/month=01/'
+            'day=01/hour=00/{:02d}.jsonl'.format(m),
+            b''.join(
+                json.dumps(r).encode() + b'\n' for r in records
+                if m * 60 <= r['cloud_t'] - t0 < (m + 1) * 60
+                )
+            )
+    _write(tmp_path, 'devices/country_code=ab/devices.jsonl',
+           json.dumps({'device_id': '001'}).encode() + b'\n')
+
+    data_client = AwsDataClient('ab', storage=LocalStorage(str(tmp_path)))
+
+    result = data_client.get_filtered_records(
+        '2020-01-01 00:00:30', '2020-01-01 00:02:10')
+
+    assert result == [
+        r for r in records if t0 + 30 <= r['cloud_t'] <= t0 + 130
+        ]
+    assert data_client.get_devices_full_history() == [{'device_id': '001'}]
@@ -0,0 +1,138 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import numpy as np
+import pytest
+from openeew.data import timing
+from openeew.data.record import add_sample_t
+from openeew.data.timing import (
+    add_fitted_t_to_records,
+    fit_clock_offsets,
+    get_sample_t_array
+    )
+
+
+def _get_clock_data(num_records, offset, drift, seed=0):
+    # Returns device_t, cloud_t and the true clock offset of records
+    # sent every second by a device whose clock drifts, where cloud_t
+    # has network jitter with occasional large delays
+
+    rng = np.random.RandomState(seed)
+    true_t = 1.6e9 + np.arange(num_records, dtype=float)
+    device_t = true_t - offset - drift * (true_t - true_t[0])
+    latency = 0.05 + rng.exponential(0.1, num_records)
+    is_delayed = rng.rand(num_records) < 0.02
+    latency[is_delayed] += rng.uniform(1, 10, is_delayed.sum())
+
+    return device_t, true_t + latency, true_t - device_t
+
+
+def test_fit_clock_offsets_follows_drift():
+    # Check that offsets follow each device's drift across many
+    # windows and epochs, ignoring jitter and delays up to a constant
+    # latency
+
+    device_t_1, cloud_t_1, offsets_1 = _get_clock_data(7200, 5.0, 50e-6)
+    device_t_2, cloud_t_2, offsets_2 = _get_clock_data(
+        5000, -3.0, -20e-6, seed=1)
+
+    result = fit_clock_offsets(
+        ['001'] * 7200 + ['002'] * 5000,
+        np.concatenate([device_t_1, device_t_2]),
+        np.concatenate([cloud_t_1, cloud_t_2]),
+        window=120
+        )
+
+    for errors in [result[:7200] - offsets_1, result[7200:] - offsets_2]:
+        assert np.abs(errors - np.median(errors)).max() < 0.1
+        assert 0.05 < np.median(errors) < 0.3
+
+
+def test_fit_clock_offsets_unordered():
+    # Records do not need to be in order
+
+    device_t, cloud_t, _ = _get_clock_data(600, 1.0, 0.0)
+    order = np.random.RandomState(2).permutation(600)
+
+    result = fit_clock_offsets(['001'] * 600, device_t, cloud_t, window=60)
+    shuffled = fit_clock_offsets(
+        ['001'] * 600, device_t[order], cloud_t[order], window=60)
+
+    np.testing.assert_allclose(shuffled, result[order])
+
+
+@pytest.mark.parametrize('batch_size', [7, 1 << 16])
+def test_fit_clock_offsets_uneven_devices(monkeypatch, batch_size):
+    # Check that a device with many records is fitted the same
+    # alongside many devices with a single record each, including
+    # when groups of records are split into several batches
+
+    monkeypatch.setattr(timing, '_BATCH_SIZE', batch_size)
+    device_t, cloud_t, _ = _get_clock_data(3000, 2.0, 10e-6)
+    rng = np.random.RandomState(3)
+    single_device_t = device_t[0] + rng.uniform(0, 3000, 500)
+    single_cloud_t = single_device_t + rng.uniform(0, 5, 500)
+
+    result = fit_clock_offsets(
+        ['big'] * 3000 + ['{:03d}'.format(i) for i in range(500)],
+        np.concatenate([device_t, single_device_t]),
+        np.concatenate([cloud_t, single_cloud_t]),
+        window=120
+        )
+    alone = fit_clock_offsets(['big'] * 3000, device_t, cloud_t, window=120)
+
+    np.testing.assert_allclose(result[:3000], alone, atol=1e-9)
+    np.testing.assert_allclose(
+        result[3000:], single_cloud_t - single_device_t, atol=1e-9)
+
+
+def test_fit_clock_offsets_empty():
+    assert len(fit_clock_offsets([], [], [])) == 0
+
+
+def test_add_fitted_t_to_records():
+    # With exact offsets, fitted_t equals cloud_t
+
+    records = [
+        {'device_id': '001', 'device_t': 100.0 + i, 'cloud_t': 102.0 + i}
+        for i in range(10)
+        ]
+
+    result = add_fitted_t_to_records(records, window=5)
+
+    assert [r['fitted_t'] for r in result] == \
+        pytest.approx([r['cloud_t'] for r in records])
+
+
+def test_get_sample_t_array():
+    # Check that sample times match those of add_sample_t
+
+    records = [
+        {'cloud_t': 10.0, 'sr': 2.0, 'x': [0, 0, 0]},
+        {'cloud_t': 11.5, 'sr': 31.25, 'x': [0] * 32}
+        ]
+
+    result = get_sample_t_array(
+        [r['cloud_t'] for r in records],
+        [len(r['x']) for r in records],
+        [r['sr'] for r in records]
+        )
+
+    expected = [
+        t for r in records for t in add_sample_t(r, 'cloud_t', 'x')['sample_t']
+        ]
+    np.testing.assert_allclose(result, expected)
@@ -0,0 +1,136 @@
+# =============================================================================
+# Copyright 2019 Grillo Holdings Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+
+
+import pytest
+from datetime import datetime, timezone
+from openeew.data.aws import AwsDataClient
+from openeew.data.storage import LocalStorage
+from openeew.data.writer import RecordWriter
+
+# 2020-01-01 00:00:00 UTC
+_T0 = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+def _get_records(num_devices, num_seconds):
+    return [
+        {'device_id': '{:03d}'.format(d), 'cloud_t': _T0 + s, 'x': [d, s]}
+        for s in range(num_seconds) for d in range(num_devices)
+        ]
+
+
+def _list_keys(storage):
+    return storage.list_keys('records/country_code=ab/')
+
+
+def test_write_rotates_complete_minutes(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    records = _get_records(2, 150)
+
+    with RecordWriter(storage, 'AB', lateness=10) as writer:
+        writer.write(records[:2 * 69])
+        assert _list_keys(storage) == []
+
+        # Minute 0 is complete once cloud_t reaches 00:01:10
+        writer.write(records[2 * 69:2 * 71])
+        assert _list_keys(storage) == [
+            'records/country_code=ab/device_id=000/year=2020/month=01/'
+            'day=01/hour=00/00.jsonl',
+            'records/country_code=ab/device_id=001/year=2020/month=01/'
+            'day=01/hour=00/00.jsonl'
+            ]
+
+        writer.write(records[2 * 71:])
+
+    assert len(_list_keys(storage)) == 6
+    assert writer.num_records_written == len(records)
+
+    data_client = AwsDataClient('ab', storage=storage)
+    assert data_client.get_filtered_records(
+        '2020-01-01 00:00:00', '2020-01-01 00:03:00', ['000', '001']) == \
+        sorted(records, key=lambda r: (r['device_id'], r['cloud_t']))
+
+
+def test_write_merges_late_records(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    records = _get_records(1, 60)
+
+    with RecordWriter(storage, 'ab', compression='gzip') as writer:
+        writer.write(records[1::2])
+        writer.flush()
+        writer.write(records[::2])
+
+    keys = _list_keys(storage)
+    assert len(keys) == 1
+    assert keys[0].endswith('/00.jsonl.gz')
+
+    data_client = AwsDataClient('ab', storage=storage)
+    assert data_client.get_filtered_records(
+        '2020-01-01 00:00:00', '2020-01-01 00:01:00', '000') == records
+
+
+def test_write_bounds_buffered_records(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    records = _get_records(50, 20)
+
+    with RecordWriter(storage, 'ab', max_buffered_records=40) as writer:
+        for i in range(0, len(records), 10):
+            writer.write(records[i:i + 10])
+            assert writer._num_buffered <= 40
+
+    data_client = AwsDataClient('ab', storage=storage)
+    assert len(data_client.get_filtered_records(
+        '2020-01-01 00:00:00', '2020-01-01 00:01:00')) == len(records)
+
+
+class _FailingStorage(LocalStorage):
+    # Fails to put a key once
+
+    def __init__(self, root, fail_key):
+        super().__init__(root)
+        self._fail_key = fail_key
+
+    def put_bytes(self, key, data):
+        if self._fail_key is not None and key.endswith(self._fail_key):
+            self._fail_key = None
+            raise IOError('Connection lost')
+        super().put_bytes(key, data)
+
+
+def test_write_keeps_records_of_failed_keys(tmp_path):
+    storage = _FailingStorage(str(tmp_path), 'device_id=001/year=2020/'
+                              'month=01/day=01/hour=00/00.jsonl')
+    records = _get_records(2, 150)
+
+    writer = RecordWriter(storage, 'ab', lateness=10)
+    with pytest.raises(IOError):
+        writer.write(records)
+    # Only the key that failed is still buffered
+    assert writer._num_buffered == 60 + 2 * 30
+    assert writer.num_records_written == 60 + 2 * 60
+
+    writer.close()
+
+    assert writer.num_records_written == len(records)
+    data_client = AwsDataClient('ab', storage=storage)
+    assert data_client.get_filtered_records(
+        '2020-01-01 00:00:00', '2020-01-01 00:03:00', ['000', '001']) == \
+        sorted(records, key=lambda r: (r['device_id'], r['cloud_t']))
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        RecordWriter(LocalStorage(str(tmp_path)), 'ab', compression='lz4')